@@ -0,0 +1,502 @@
+"""
+Alert rules evaluated on every aggregate update.
+
+Rules are read from a JSON file (ALERT_RULES_PATH):
+
+    {"rules": [
+        {"name": "High error rate", "condition": "error_rate > 5 and count > 100",
+         "window": "5m", "for": "2m", "cooldown": "15m", "severity": "WARNING",
+         "actions": ["print", {"file": "~/alerts.log"}]},
+        {"name": "sshd failing", "condition": "errors(process='sshd') > 5",
+         "actions": [{"command": "notify-send 'sshd failing'"},
+                     {"webhook": "http://localhost:9000/alerts"}]}
+    ]}
+
+A condition is parsed once into a tree of closures. Every metric it names
+is backed by a sliding-window counter that new entries are added to as they
+are counted, so evaluating a rule reads a few running totals instead of
+rescanning the loaded logs.
+
+Metrics (each also callable with domain=, process=, priority= and window=):
+  count        entries in the window
+  errors       entries at ERROR or worse
+  critical     entries at CRITICAL or worse
+  rate         entries per minute
+  error_rate   errors as a percentage of entries
+
+Time is the entries' own: the window ends at the newest entry seen, and
+'for' (how long a condition must hold) and 'cooldown' (quiet time between
+two firings) are measured in entry time too, so replaying loaded logs
+alerts like following them would have.
+"""
+
+import ast
+import json
+import operator
+import os
+import shlex
+import subprocess
+import threading
+import urllib.request
+from collections import Counter, deque
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from analysis.entries import PRIORITY_NAMES, ERROR_PRIORITY
+from analysis.store import NUMPY_AVAILABLE
+from config.defaults import ALERT_RULES_PATH, ALERT_DEFAULT_WINDOW
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+CRITICAL_PRIORITY = 2
+
+METRICS = ("count", "errors", "critical", "rate", "error_rate")
+
+# Entries added between two rule checks when catching up with a store, so
+# replayed logs are checked about as often as followed ones
+CHECK_EVERY = 1000
+
+# Webhooks may only reach this machine
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+WEBHOOK_TIMEOUT = 5
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_COMPARE = {
+    ast.Gt: operator.gt, ast.GtE: operator.ge, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Eq: operator.eq, ast.NotEq: operator.ne,
+}
+_ARITHMETIC = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    # A ratio over an empty window is 0 rather than an error
+    ast.Div: lambda a, b: a / b if b else 0.0,
+}
+
+# (domains, processes, priorities, window); None matches everything
+QueryKey = Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]], Optional[FrozenSet[int]], int]
+Evaluator = Callable[[int], float]
+
+
+def parse_duration(value) -> int:
+    """Seconds in '30s', '5m', '2h', '1d' or a plain number of seconds"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip().lower()
+    if text and text[-1] in _UNITS:
+        number, unit = text[:-1], _UNITS[text[-1]]
+    else:
+        number, unit = text, 1
+    try:
+        return int(float(number) * unit)
+    except ValueError:
+        raise ValueError(f"Invalid duration '{value}'") from None
+
+
+class WindowCount:
+    """Running total of entries over the last window seconds"""
+
+    __slots__ = ("window", "total", "events")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.total = 0
+        self.events: "deque[List[int]]" = deque()     # [second, count], oldest first
+
+    def add(self, second: int, count: int):
+        events = self.events
+        if events and events[-1][0] == second:
+            events[-1][1] += count
+        else:
+            events.append([second, count])
+        self.total += count
+
+    def value(self, now: int) -> int:
+        events = self.events
+        horizon = now - self.window
+        while events and events[0][0] <= horizon:
+            self.total -= events.popleft()[1]
+        return self.total
+
+    def clear(self):
+        self.events.clear()
+        self.total = 0
+
+
+def _names(value) -> FrozenSet[str]:
+    """Option value as a set: a string or a list of strings"""
+    if isinstance(value, str):
+        return frozenset([value])
+    if isinstance(value, (list, tuple)) and all(isinstance(name, str) for name in value):
+        return frozenset(value)
+    raise ValueError(f"Expected a string or a list of strings, not {value!r}")
+
+
+class _Compiler:
+    """Turns a condition's syntax tree into closures over window counters"""
+
+    def __init__(self, engine: "AlertEngine", window: int):
+        self.engine = engine
+        self.window = window
+        self.metrics: List[Tuple[str, Evaluator]] = []
+
+    def compile(self, text: str) -> Evaluator:
+        try:
+            tree = ast.parse(text, mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid condition '{text}': {e.msg}") from None
+        return self._node(tree.body)
+
+    def _node(self, node) -> Evaluator:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            value = node.value
+            return lambda now: value
+        if isinstance(node, ast.Name):
+            return self._metric(node.id, {}, node.id)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.args:
+            options = {}
+            for keyword in node.keywords:
+                if keyword.arg is None:
+                    raise ValueError(f"Arguments of {node.func.id}() must be named")
+                try:
+                    options[keyword.arg] = ast.literal_eval(keyword.value)
+                except (ValueError, TypeError):
+                    raise ValueError(f"Arguments of {node.func.id}() must be literals") from None
+            return self._metric(node.func.id, options, ast.unparse(node))
+        if isinstance(node, ast.BoolOp):
+            parts = [self._node(value) for value in node.values]
+            if isinstance(node.op, ast.And):
+                return lambda now: all(part(now) for part in parts)
+            return lambda now: any(part(now) for part in parts)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            operand = self._node(node.operand)
+            return lambda now: not operand(now)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = self._node(node.operand)
+            return lambda now: -operand(now)
+        if isinstance(node, ast.BinOp) and type(node.op) in _ARITHMETIC:
+            apply = _ARITHMETIC[type(node.op)]
+            left, right = self._node(node.left), self._node(node.right)
+            return lambda now: apply(left(now), right(now))
+        if isinstance(node, ast.Compare):
+            first = self._node(node.left)
+            pairs = [(_COMPARE[type(op)], self._node(comparator))
+                     for op, comparator in zip(node.ops, node.comparators)
+                     if type(op) in _COMPARE]
+            if len(pairs) != len(node.ops):
+                raise ValueError(f"Unsupported comparison in '{ast.unparse(node)}'")
+
+            def compare(now):
+                left = first(now)
+                for apply, operand in pairs:
+                    right = operand(now)
+                    if not apply(left, right):
+                        return False
+                    left = right
+                return True
+            return compare
+        raise ValueError(f"Unsupported expression '{ast.unparse(node)}'")
+
+    def _metric(self, name: str, options: Dict, label: str) -> Evaluator:
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric '{name}'. Use: {', '.join(METRICS)}")
+        unknown = set(options) - {"domain", "process", "priority", "window"}
+        if unknown:
+            raise ValueError(f"Unknown option(s) of {name}(): {', '.join(sorted(unknown))}")
+
+        window = parse_duration(options.get("window", self.window))
+        domains = _names(options["domain"]) if "domain" in options else None
+        processes = _names(options["process"]) if "process" in options else None
+        priorities = None
+        if "priority" in options:
+            levels = [level.upper() for level in _names(options["priority"])]
+            for level in levels:
+                if level not in PRIORITY_NAMES:
+                    raise ValueError(f"Unknown priority '{level}'")
+            priorities = frozenset(PRIORITY_NAMES.index(level) for level in levels)
+
+        def counter(worst: Optional[int] = None) -> WindowCount:
+            wanted = priorities
+            if worst is not None:
+                severe = frozenset(range(worst + 1))
+                wanted = severe if wanted is None else wanted & severe
+            return self.engine.counter((domains, processes, wanted, window))
+
+        if name == "count":
+            total = counter()
+            evaluator = total.value
+        elif name == "errors":
+            evaluator = counter(ERROR_PRIORITY).value
+        elif name == "critical":
+            evaluator = counter(CRITICAL_PRIORITY).value
+        elif name == "rate":
+            total, minutes = counter(), window / 60
+            evaluator = lambda now: total.value(now) / minutes
+        else:
+            total, errors = counter(), counter(ERROR_PRIORITY)
+
+            def evaluator(now):
+                entries = total.value(now)
+                return errors.value(now) * 100 / entries if entries else 0.0
+        self.metrics.append((label, evaluator))
+        return evaluator
+
+
+class Alert:
+    """One firing of a rule"""
+
+    def __init__(self, rule: "Rule", at: int, values: Dict[str, float]):
+        self.rule = rule.name
+        self.severity = rule.severity
+        self.condition = rule.condition
+        self.at = at
+        self.values = values
+
+    @property
+    def message(self) -> str:
+        values = ", ".join(f"{label}={value:g}" for label, value in self.values.items())
+        return f"[{self.severity}] {self.rule}: {self.condition} ({values})"
+
+    def to_dict(self) -> Dict:
+        return {"rule": self.rule, "severity": self.severity, "condition": self.condition,
+                "time": datetime.fromtimestamp(self.at).isoformat(), "values": self.values}
+
+
+class Action:
+    """Where a firing alert is sent"""
+
+    def run(self, alert: Alert):
+        raise NotImplementedError
+
+
+class PrintAction(Action):
+    def run(self, alert: Alert):
+        print(f"\n🚨 {alert.message}")
+
+
+class FileAction(Action):
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+
+    def run(self, alert: Alert):
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(alert.to_dict()) + "\n")
+
+
+class CommandAction(Action):
+    def __init__(self, command: str):
+        self.argv = shlex.split(command)
+        if not self.argv:
+            raise ValueError("Empty alert command")
+
+    def run(self, alert: Alert):
+        # Not waited for; the alert is passed in the environment
+        env = dict(os.environ, ALERT_RULE=alert.rule, ALERT_SEVERITY=alert.severity,
+                   ALERT_MESSAGE=alert.message)
+        subprocess.Popen(self.argv, env=env, stdin=subprocess.DEVNULL)
+
+
+class WebhookAction(Action):
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or parsed.hostname not in LOCAL_HOSTS:
+            raise ValueError(f"Webhook '{url}' must be an http(s) URL on {', '.join(LOCAL_HOSTS)}")
+        self.url = url
+
+    def run(self, alert: Alert):
+        threading.Thread(target=self._post, args=(alert,), daemon=True).start()
+
+    def _post(self, alert: Alert):
+        request = urllib.request.Request(self.url, data=json.dumps(alert.to_dict()).encode(),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT).close()
+        except OSError as e:
+            print(f"Alert webhook {self.url} failed: {e}")
+
+
+def make_action(spec) -> Action:
+    """Action from "print", {"file": path}, {"command": cmd} or {"webhook": url}"""
+    if spec == "print":
+        return PrintAction()
+    if isinstance(spec, dict) and len(spec) == 1:
+        (kind, target), = spec.items()
+        if not isinstance(target, str):
+            raise ValueError(f"Action {spec!r} needs a string")
+        if kind == "file":
+            return FileAction(target)
+        if kind == "command":
+            return CommandAction(target)
+        if kind == "webhook":
+            return WebhookAction(target)
+    raise ValueError(f"Unknown action {spec!r}. Use: print, file, command, webhook")
+
+
+class Rule:
+    """A compiled rule and its firing state"""
+
+    def __init__(self, engine: "AlertEngine", spec: Dict):
+        if not isinstance(spec, dict):
+            raise ValueError(f"Rule {spec!r} must be an object with a condition")
+        self.name = str(spec.get("name") or spec.get("condition", "unnamed"))
+        try:
+            self.condition = spec["condition"]
+            if not isinstance(self.condition, str):
+                raise ValueError(f"condition must be a string, not {self.condition!r}")
+            self.window = parse_duration(spec.get("window", ALERT_DEFAULT_WINDOW))
+            self.hold = parse_duration(spec.get("for", 0))
+            self.cooldown = parse_duration(spec.get("cooldown", self.window))
+            self.severity = str(spec.get("severity", "WARNING")).upper()
+            compiler = _Compiler(engine, self.window)
+            self.evaluate = compiler.compile(self.condition)
+            self.metrics = compiler.metrics
+            actions = spec.get("actions", ["print"])
+            if not isinstance(actions, list):
+                raise ValueError(f"actions must be a list, not {actions!r}")
+            self.actions = [make_action(action) for action in actions]
+        except (KeyError, ValueError) as e:
+            detail = f"missing {e}" if isinstance(e, KeyError) else str(e)
+            raise ValueError(f"Rule '{self.name}': {detail}") from None
+
+        self.state = "ok"                       # ok, pending or firing
+        self.since: Optional[int] = None        # when the condition started holding
+        self.fired_at: Optional[int] = None
+        self.fired = 0
+
+    def check(self, now: int) -> Optional[Alert]:
+        """Advance the rule's state to now; returns an alert if it fires"""
+        if not self.evaluate(now):
+            self.state, self.since = "ok", None
+            return None
+        if self.since is None:
+            self.since = now
+        if now - self.since < self.hold:
+            self.state = "pending"
+            return None
+        self.state = "firing"
+        if self.fired_at is not None and now - self.fired_at < self.cooldown:
+            return None
+        self.fired_at = now
+        self.fired += 1
+        return Alert(self, now, {label: metric(now) for label, metric in self.metrics})
+
+    def reset(self):
+        self.state, self.since, self.fired_at = "ok", None, None
+
+
+class AlertEngine:
+    """Rules plus the window counters their conditions read"""
+
+    def __init__(self, specs: List[Dict], classifier):
+        self.classifier = classifier
+        self.counters: Dict[QueryKey, WindowCount] = {}
+        # (domain, priority, process) -> counters the entries of that series go to
+        self._routes: Dict[Tuple[str, int, str], List[WindowCount]] = {}
+        self.rules = [Rule(self, spec) for spec in specs]
+        names = [rule.name for rule in self.rules]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate rule name(s): {', '.join(sorted(duplicates))}")
+
+        self.clock = 0              # newest entry time, in seconds
+        self.rows = 0               # entries of the followed store observed so far
+        self.alerts: "deque[Alert]" = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, classifier, path: str = ALERT_RULES_PATH) -> "AlertEngine":
+        path = os.path.expanduser(path)
+        with open(path, encoding="utf-8") as handle:
+            try:
+                config = json.load(handle)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: {e}") from None
+        specs = config.get("rules", []) if isinstance(config, dict) else config
+        if not isinstance(specs, list):
+            raise ValueError(f"{path}: expected a list of rules, not {specs!r}")
+        return cls(specs, classifier)
+
+    def counter(self, key: QueryKey) -> WindowCount:
+        """Shared counter for a query; rules asking the same thing share one"""
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = WindowCount(key[3])
+            self._routes.clear()
+        return counter
+
+    def _route(self, series: Tuple[str, int, str]) -> List[WindowCount]:
+        domain, priority, process = series
+        return [counter for (domains, processes, priorities, _), counter in self.counters.items()
+                if (domains is None or domain in domains)
+                and (processes is None or process in processes)
+                and (priorities is None or priority in priorities)]
+
+    def observe(self, store, start: int = 0, stop: Optional[int] = None) -> List[Alert]:
+        """Add store rows [start, stop) to the windows and check every rule"""
+        stop = len(store) if stop is None else stop
+        if stop <= start or not self.rules:
+            return []
+        if NUMPY_AVAILABLE:
+            seconds = (np.frombuffer(store.timestamps, dtype=np.int64)[start:stop]
+                       // 1000000).tolist()
+        else:
+            seconds = [timestamp // 1000000 for timestamp in store.timestamps[start:stop]]
+        groups = Counter(zip(seconds, store.process_ids[start:stop], store.priorities[start:stop]))
+        domains = self.classifier.classify_many(store.processes)
+        processes = store.processes
+
+        with self._lock:
+            routes = self._routes
+            for (second, process_id, priority), count in sorted(groups.items()):
+                if not second:
+                    continue
+                series = (domains[process_id], priority, processes[process_id] or "unknown")
+                counters = routes.get(series)
+                if counters is None:
+                    counters = routes[series] = self._route(series)
+                for counter in counters:
+                    counter.add(second, count)
+                if second > self.clock:
+                    self.clock = second
+            return self.check()
+
+    def update(self, store) -> List[Alert]:
+        """Observe the entries added to store since the last update"""
+        start = max(self.rows - store.base, 0)
+        self.rows = store.base + len(store)
+        fired = []
+        for chunk in range(start, len(store), CHECK_EVERY):
+            fired.extend(self.observe(store, chunk, min(chunk + CHECK_EVERY, len(store))))
+        return fired
+
+    def check(self) -> List[Alert]:
+        """Evaluate every rule at the current time and run the actions of those firing"""
+        fired = []
+        for rule in self.rules:
+            alert = rule.check(self.clock)
+            if alert is None:
+                continue
+            fired.append(alert)
+            self.alerts.append(alert)
+            for action in rule.actions:
+                try:
+                    action.run(alert)
+                except OSError as e:
+                    print(f"Alert action of '{rule.name}' failed: {e}")
+        return fired
+
+    def reset(self):
+        """Forget the windows and rule states, e.g. when other logs are loaded"""
+        with self._lock:
+            for counter in self.counters.values():
+                counter.clear()
+            for rule in self.rules:
+                rule.reset()
+            self.clock = 0
+            self.rows = 0
+
+    def status(self) -> str:
+        firing = sum(rule.state == "firing" for rule in self.rules)
+        return (f"Alerts: {len(self.rules)} rules over {len(self.counters)} window counters, "
+                f"{firing} firing, {sum(rule.fired for rule in self.rules)} fired")
@@ -1,5 +1,249 @@
-from collections import defaultdict
-from datetime import datetime
+"""
+Anomaly detection.
+
+AnomalyDetector keeps a baseline of entry counts per (domain, priority,
+process) series and time bucket (a minute or an hour). The baseline is a
+running mean and variance: Welford's equal-weight update while a series is
+young, then an exponentially weighted one (alpha) so it follows slow drifts.
+With seasonality, each series keeps 24 baselines, one per hour of the day.
+State per series is constant, and entries are checked as they are observed,
+so a burst is flagged while its bucket is still filling up.
+"""
+
+import math
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from analysis.entries import PRIORITY_NAMES
+from analysis.store import NO_TIME, NUMPY_AVAILABLE
+from config.defaults import (ANOMALY_BUCKET, ANOMALY_SEASONAL, ANOMALY_ALPHA, ANOMALY_THRESHOLD,
+                             ANOMALY_MIN_COUNT, ANOMALY_WARMUP, ANOMALY_HISTORY)
+
+BUCKETS = ("minute", "hour")
+
+# Empty buckets between two entries of a series that are folded into its
+# baseline; after this many the baseline has forgotten the earlier counts anyway
+GAP_LIMIT = 1440
+
+_EPOCH = datetime(1970, 1, 1)
+
+# (domain, priority, process)
+SeriesKey = Tuple[str, int, str]
+
+
+class Baseline:
+    """Running mean and variance of one series' bucket counts"""
+
+    __slots__ = ("mean", "var", "n")
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.n = 0
+
+    def add(self, value: float, alpha: float):
+        # Weight 1/(n+1) is Welford's update; alpha takes over once it is larger
+        weight = max(alpha, 1.0 / (self.n + 1))
+        diff = value - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+        self.n += 1
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+
+class Anomaly:
+    """A bucket whose count exceeded its series' baseline"""
+
+    __slots__ = ("bucket", "domain", "priority", "process", "count", "expected", "std",
+                 "detected_at")
+
+    def __init__(self, bucket: str, key: SeriesKey, count: int, baseline: Baseline):
+        self.bucket = bucket
+        self.domain, self.priority, self.process = key
+        self.count = count                  # keeps growing until the bucket closes
+        self.expected = baseline.mean
+        self.std = baseline.std
+        self.detected_at = time.time()
+
+    def __str__(self) -> str:
+        score = (self.count - self.expected) / max(self.std, 1.0)
+        return (f"[{self.bucket}] {self.domain}/{self.process} {PRIORITY_NAMES[self.priority]}: "
+                f"{self.count} entries (baseline {self.expected:.1f} ± {self.std:.1f}, "
+                f"{score:.0f}σ)")
+
+
+class _Series:
+    __slots__ = ("bucket", "count", "limit", "baselines", "anomaly")
+
+    def __init__(self, bucket: int, baselines: int):
+        self.bucket = bucket
+        self.count = 0
+        self.limit = math.inf
+        self.baselines = [Baseline() for _ in range(baselines)]
+        self.anomaly: Optional[Anomaly] = None
+
+
+class AnomalyDetector:
+    """Flags bursts of entries per (domain, priority, process) series as they arrive"""
+
+    def __init__(self, classifier, bucket: str = ANOMALY_BUCKET, seasonal: bool = ANOMALY_SEASONAL,
+                 alpha: float = ANOMALY_ALPHA, threshold: float = ANOMALY_THRESHOLD,
+                 min_count: int = ANOMALY_MIN_COUNT, warmup: int = ANOMALY_WARMUP):
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}'. Use: {', '.join(BUCKETS)}")
+        self.classifier = classifier
+        self.bucket = bucket
+        self.seasonal = seasonal
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_count = min_count
+        self.warmup = warmup
+
+        self.series: Dict[SeriesKey, _Series] = {}
+        self.anomalies: "deque[Anomaly]" = deque(maxlen=ANOMALY_HISTORY)
+        self.observed = 0
+        self.late = 0                       # entries older than their series' current bucket
+        self.rows = 0                       # entries of the followed store observed so far
+        # The live follower observes from its own thread
+        self._lock = threading.Lock()
+
+    def _hour_of_day(self, bucket: int) -> int:
+        return (bucket // 60 if self.bucket == "minute" else bucket) % 24
+
+    def _baseline(self, series: _Series, bucket: int) -> Baseline:
+        return series.baselines[self._hour_of_day(bucket) if self.seasonal else 0]
+
+    def label(self, bucket: int) -> str:
+        """Local time of a bucket"""
+        if self.bucket == "minute":
+            return (_EPOCH + timedelta(minutes=bucket)).strftime("%Y-%m-%d %H:%M")
+        return (_EPOCH + timedelta(hours=bucket)).strftime("%Y-%m-%d %H:00")
+
+    def _advance(self, series: _Series, bucket: int):
+        """Close the series' current bucket (and the empty ones up to bucket)"""
+        # A burst is clipped to the limit so it doesn't inflate the baseline that
+        # should catch the next one; a lasting shift still moves it bucket by bucket
+        self._baseline(series, series.bucket).add(min(series.count, series.limit), self.alpha)
+        for empty in range(series.bucket + 1, min(bucket, series.bucket + 1 + GAP_LIMIT)):
+            self._baseline(series, empty).add(0, self.alpha)
+
+        series.bucket = bucket
+        series.count = 0
+        series.anomaly = None
+        baseline = self._baseline(series, bucket)
+        if baseline.n < self.warmup:
+            series.limit = math.inf
+        else:
+            # A floor of one keeps perfectly steady series from flagging +1
+            series.limit = max(baseline.mean + self.threshold * max(baseline.std, 1.0),
+                               self.min_count - 1)
+
+    def observe(self, store, start: int = 0, stop: Optional[int] = None):
+        """Count store rows [start, stop) and flag the series they push past their limit"""
+        stop = len(store) if stop is None else stop
+        if stop <= start:
+            return
+        parts = store.time_parts()
+        buckets = (parts.minutes if self.bucket == "minute" else parts.hours)[start:stop]
+        if NUMPY_AVAILABLE:
+            buckets = buckets.tolist()
+        groups = Counter(zip(buckets, store.process_ids[start:stop], store.priorities[start:stop]))
+        domains = self.classifier.classify_many(store.processes)
+        processes = store.processes
+
+        with self._lock:
+            self.observed += stop - start
+            # Oldest first, so every series sees its buckets in order
+            for (bucket, process_id, priority), count in sorted(groups.items()):
+                if bucket == NO_TIME:
+                    continue
+                key = (domains[process_id], priority, processes[process_id] or "unknown")
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = _Series(bucket, 24 if self.seasonal else 1)
+                elif bucket < series.bucket:
+                    self.late += count
+                    continue
+                elif bucket > series.bucket:
+                    self._advance(series, bucket)
+
+                series.count += count
+                if series.anomaly is not None:
+                    series.anomaly.count = series.count
+                elif series.count > series.limit:
+                    series.anomaly = Anomaly(self.label(bucket), key, series.count,
+                                             self._baseline(series, bucket))
+                    self.anomalies.append(series.anomaly)
+
+    def update(self, store):
+        """Observe the entries added to store since the last update"""
+        start = max(self.rows - store.base, 0)
+        self.observe(store, start)
+        self.rows = store.base + len(store)
+
+    def recent(self, limit: int = 20, priority: Optional[int] = None,
+               domain: Optional[str] = None) -> List[Anomaly]:
+        """Flagged buckets, most recently detected first"""
+        with self._lock:
+            anomalies = list(self.anomalies)
+        matches = [anomaly for anomaly in reversed(anomalies)
+                   if (priority is None or anomaly.priority == priority)
+                   and (domain is None or anomaly.domain == domain)]
+        return matches[:limit]
+
+    def status(self) -> str:
+        seasonal = ", by hour of day" if self.seasonal else ""
+        return (f"Anomaly detection per {self.bucket}{seasonal}: {len(self.series)} series, "
+                f"{self.observed} entries observed, {len(self.anomalies)} anomalies flagged")
+
+
+def show_anomalies(self, limit: int = 20, level: Optional[str] = None,
+                   domain: Optional[str] = None, bucket: Optional[str] = None,
+                   seasonal: Optional[bool] = None):
+    """Show the bursts flagged so far; bucket/seasonal rebuild the detector"""
+    priority = None
+    if level:
+        if level.upper() not in PRIORITY_NAMES:
+            print(f"Unknown level '{level}'. Use: {', '.join(PRIORITY_NAMES)}")
+            return
+        priority = PRIORITY_NAMES.index(level.upper())
+    
+    detector = self.detector
+    if detector is not None and ((bucket and bucket != detector.bucket) or
+                                 (seasonal is not None and seasonal != detector.seasonal)):
+        if self.follower and self.follower.running:
+            print("Stop following before changing the anomaly settings.")
+            return
+        detector = None
+    if detector is None:
+        try:
+            detector = AnomalyDetector(self.classifier, bucket or ANOMALY_BUCKET,
+                                       ANOMALY_SEASONAL if seasonal is None else seasonal)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        self.detector = detector
+    # Only the entries loaded since the last look are new to the detector
+    detector.update(self.store)
+    
+    print(f"\n{detector.status()}")
+    anomalies = detector.recent(limit, priority, domain)
+    if not anomalies:
+        if detector.observed:
+            print("No anomalies.")
+        else:
+            print("Nothing observed yet. Use 'load' or 'follow' first.")
+        return
+    for anomaly in anomalies:
+        print(f"  ⚠️  {anomaly}")
+
 
 def add_advanced_features(self):
     """Demonstrate advanced features"""
@@ -26,57 +270,15 @@ def add_advanced_features(self):
         print("Invalid choice")
 
 def _demo_anomaly_detection(self):
-    """Demo simple anomaly detection"""
-    if not self.processed_data:
-        print("No data analyzed")
-        return
-    
+    """Demo anomaly detection over the loaded entries"""
     print("\n🔍 Anomaly Detection")
     print("-" * 40)
-    
-    # Detect unusual error spikes
-    error_rates = []
-    months = []
-    
-    for month, month_data in sorted(self.processed_data.items()):
-        total = 0
-        errors = 0
-        
-        for domain_data in month_data.values():
-            for priority, count in domain_data.items():
-                total += count
-                if priority in ["ERROR", "CRITICAL", "ALERT", "EMERGENCY"]:
-                    errors += count
-        
-        if total > 0:
-            error_rate = (errors / total * 100)
-            error_rates.append(error_rate)
-            months.append(month)
-    
-    if len(error_rates) >= 3:
-        # Simple anomaly: error rate > 2 standard deviations from mean
-        mean = sum(error_rates) / len(error_rates)
-        variance = sum((x - mean) ** 2 for x in error_rates) / len(error_rates)
-        std_dev = variance ** 0.5
-        
-        print(f"Mean error rate: {mean:.1f}%")
-        print(f"Std deviation: {std_dev:.1f}%")
-        print("\nChecking for anomalies...")
-        
-        for month, rate in zip(months, error_rates):
-            if rate > mean + (2 * std_dev):
-                print(f"⚠️  ANOMALY in {month}: {rate:.1f}% error rate "
-                      f"(>{mean + (2*std_dev):.1f}%)")
-            elif rate < mean - (2 * std_dev):
-                print(f"✅ LOW in {month}: {rate:.1f}% error rate "
-                      f"(<{mean - (2*std_dev):.1f}%)")
-            else:
-                print(f"  Normal in {month}: {rate:.1f}%")
-    else:
-        print("Need at least 3 months of data for anomaly detection")
+    self.show_anomalies(10)
 
 def _demo_alert_rules(self):
     """Demo alert rule system"""
+    from analysis.alerts import AlertEngine
+    
     print("\n🚨 Alert Rule Configuration")
     print("-" * 40)
     
@@ -86,19 +288,19 @@ def _demo_alert_rules(self):
             "name": "High Error Rate",
             "condition": "error_rate > 5.0",
             "severity": "WARNING",
-            "action": "print"
+            "actions": ["print"]
         },
         {
             "name": "Critical Errors",
-            "condition": "critical_count > 10",
+            "condition": "critical > 10",
             "severity": "CRITICAL",
-            "action": "print"
+            "actions": ["print"]
         },
         {
             "name": "Service Down",
-            "condition": "process_errors.get('sshd', 0) > 5",
+            "condition": "errors(process='sshd') > 5",
             "severity": "ERROR",
-            "action": "email"
+            "actions": ["print"]
         }
     ]
     
@@ -106,38 +308,17 @@ def _demo_alert_rules(self):
     for i, rule in enumerate(alert_rules, 1):
         print(f"{i}. [{rule['severity']}] {rule['name']}")
         print(f"   Condition: {rule['condition']}")
-        print(f"   Action: {rule['action']}")
+        print(f"   Action: {', '.join(rule['actions'])}")
         print()
     
-    # Simulate checking rules
-    if self.processed_data:
-        print("Simulating rule checks...")
-        # Calculate metrics
-        total = 0
-        errors = 0
-        critical_count = 0
-        process_errors = defaultdict(int)
-        
-        for month_data in self.processed_data.values():
-            for domain_data in month_data.values():
-                for priority, count in domain_data.items():
-                    total += count
-                    if priority in ["ERROR", "CRITICAL", "ALERT", "EMERGENCY"]:
-                        errors += count
-                    if priority in ["CRITICAL", "ALERT", "EMERGENCY"]:
-                        critical_count += count
-        
-        error_rate = (errors / total * 100) if total > 0 else 0
-        
-        print(f"\nCurrent metrics:")
-        print(f"  Error rate: {error_rate:.1f}%")
-        print(f"  Critical count: {critical_count}")
-        
-        # Check rules
-        if error_rate > 5.0:
-            print("⚠️  Alert: High Error Rate detected!")
-        if critical_count > 10:
-            print("🚨 Alert: Critical Errors detected!")
+    if not self.store:
+        print("Load logs to see the rules checked against them.")
+        return
+    
+    print(f"Checking the rules over {len(self.store)} loaded entries...")
+    engine = AlertEngine(alert_rules, self.classifier)
+    fired = engine.update(self.store)
+    print(f"\n{len(fired)} alert(s) fired. Put rules in a file and use 'alerts load' to keep them running.")
 
 # Note: _demo_export_formats moved to data/export.py
 # Note: _demo_batch_processing and _demo_integration_hooks are omitted for brevity
@@ -0,0 +1,143 @@
+"""
+Process classification: maps a process name to its domain.
+
+DOMAIN_MAP and the user rules in config are compiled once into three
+lookups, checked in this order:
+
+  1. exact names   - a dict from name to domain (user rules win over DOMAIN_MAP)
+  2. prefixes      - a character trie; the longest matching prefix wins
+  3. globs/regexes - one combined regex; the first matching rule wins
+
+Results are memoized per name, so classifying an entry is a dict lookup.
+"""
+
+import fnmatch
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from config.defaults import DOMAIN_MAP, CLASSIFIER_RULES, CLASSIFIER_CACHE_SIZE
+
+DEFAULT_DOMAIN = "MISC"
+RULE_KINDS = ("exact", "prefix", "glob", "regex")
+
+Rule = Tuple[str, str, str]
+
+# Marks the end of a prefix in the trie
+_END = ""
+
+
+class ProcessClassifier:
+    """Compiled DOMAIN_MAP plus exact/prefix/glob/regex rules"""
+
+    def __init__(self, domain_map: Dict[str, Set[str]] = DOMAIN_MAP,
+                 rules: Sequence[Rule] = CLASSIFIER_RULES,
+                 cache_size: int = CLASSIFIER_CACHE_SIZE):
+        self.domain_map = domain_map
+        self.rules = list(rules)
+        self.cache_size = cache_size
+
+        self._exact: Dict[str, str] = {}
+        self._trie: Dict = {}
+        self._patterns: List[Tuple[str, str]] = []   # (group name, domain)
+        self._regex: Optional["re.Pattern"] = None
+        self._cache: Dict[str, str] = {}
+        self._compile()
+
+    def _compile(self):
+        # The first domain listing a name keeps it, as with the old linear scan
+        for domain, names in self.domain_map.items():
+            for name in names:
+                self._exact.setdefault(name, domain)
+
+        alternatives = []
+        for kind, pattern, domain in self.rules:
+            if kind == "exact":
+                self._exact[pattern] = domain
+            elif kind == "prefix":
+                node = self._trie
+                for char in pattern:
+                    node = node.setdefault(char, {})
+                node.setdefault(_END, domain)
+            elif kind in ("glob", "regex"):
+                regex = fnmatch.translate(pattern) if kind == "glob" else f"(?:{pattern})\\Z"
+                try:
+                    re.compile(regex)
+                except re.error as e:
+                    raise ValueError(f"Invalid {kind} rule '{pattern}': {e}") from None
+                group = f"_rule{len(self._patterns)}"
+                self._patterns.append((group, domain))
+                alternatives.append(f"(?P<{group}>{regex})")
+            else:
+                raise ValueError(f"Unknown rule kind '{kind}'. Use: {', '.join(RULE_KINDS)}")
+
+        if alternatives:
+            self._regex = re.compile("|".join(alternatives))
+
+    def _prefix_domain(self, name: str) -> Optional[str]:
+        node = self._trie
+        found = node.get(_END)
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return found
+
+    def _pattern_domain(self, name: str) -> Optional[str]:
+        if self._regex is None:
+            return None
+        match = self._regex.match(name)
+        if match is None:
+            return None
+        for group, domain in self._patterns:
+            if match.group(group) is not None:
+                return domain
+        return None
+
+    def _lookup(self, name: str) -> str:
+        domain = self._exact.get(name)
+        if domain is None:
+            domain = self._prefix_domain(name)
+        if domain is None:
+            domain = self._pattern_domain(name)
+        return domain or DEFAULT_DOMAIN
+
+    def classify(self, name: Optional[str]) -> str:
+        """Domain of a process name"""
+        if not name or name == "unknown":
+            return DEFAULT_DOMAIN
+
+        cache = self._cache
+        domain = cache.get(name)
+        if domain is None:
+            domain = self._lookup(name)
+            if len(cache) >= self.cache_size:
+                cache.clear()
+            cache[name] = domain
+        return domain
+
+    __call__ = classify
+
+    def classify_many(self, names: Iterable[Optional[str]]) -> List[str]:
+        """Domains of many names, e.g. a store's interned process pool by id"""
+        return [self.classify(name) for name in names]
+
+    def fingerprint(self) -> str:
+        """Digest of the domain map and rules; changes whenever a result could"""
+        domain_map = sorted((domain, sorted(names)) for domain, names in self.domain_map.items())
+        text = repr((domain_map, self.rules, DEFAULT_DOMAIN))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def exact_names(self) -> Dict[str, Set[str]]:
+        """Names that belong to a domain by exact match alone
+
+        Domains reachable through prefix, glob or regex rules are left out,
+        since their members can't be listed as journal field matches.
+        """
+        pattern_domains = {domain for kind, _, domain in self.rules if kind != "exact"}
+        names: Dict[str, Set[str]] = {}
+        for name, domain in self._exact.items():
+            if domain not in pattern_domains:
+                names.setdefault(domain, set()).add(name)
+        return names
@@ -1,104 +1,487 @@
-import json
-from collections import defaultdict
+import os
+import socket
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Optional, DefaultDict, Any
-from sources.journalctl import load_journal_logs
-from config.defaults import PRIO_MAP, DOMAIN_MAP
+from typing import Dict, List, Optional
+from sources.base import LogSource
+from sources.journalctl import JournalctlSource, resolve_time
+from sources.journal_file import JournalFileSource
+from sources.archive import open_archive
+from sources.fleet import FleetSource
+from sources.saved import SavedSource
+from sources.planner import plan_query
+from analysis.entries import parse_entry, decode_record, message_tokens, PRIORITY_NAMES
+from analysis.live import LogFollower
+from analysis.classifier import ProcessClassifier
+from analysis.anomalies import AnomalyDetector
+from analysis.alerts import AlertEngine
+from analysis.sketches import SketchSet
+from analysis.sampling import StratifiedSample
+from analysis.search import parse_query
+from analysis.grep import PatternSet, grep
+from analysis.store import LogStore
+from analysis.cube import RollupCube
+from analysis.parallel import analyze_parallel
+from data.cache import AggregateCache, closed_hours, fetch_windows, hour_start
+from data.segments import SegmentArchive, priority_mask
+from config.defaults import (PRIO_MAP, DOMAIN_MAP, PARALLEL_MIN_ENTRIES, STREAM_BATCH_SIZE,
+                             LOAD_WINDOW, ALERT_RULES_PATH, SKETCHES_ENABLED)
 
 class LogAnalyzer:
     def __init__(self):
         self.PRIO_MAP = PRIO_MAP
         self.DOMAIN_MAP = DOMAIN_MAP
+        self.classifier = ProcessClassifier(DOMAIN_MAP)
         
         self.data_loaded = False
-        self.raw_logs = []
-        self.processed_data = None
+        self.store = LogStore()
+        self.log_stream = None
+        self.streamed_count = 0
+        self.cube = None
         self.line_limit = 10000
+        
+        # High-water mark: entries of the store up to this entry number are
+        # already counted in the cube, so 'analyze' only folds in the rest
+        self.analyzed_rows = 0
+        self._analyzed = (None, None)   # (store, cube) the mark refers to
+        self.window = LOAD_WINDOW
+        
+        # Counts of hours read from the aggregate cache instead of the source
+        self.cached_cube = None
+        self._saved_logs = None
+        
+        # Fixed-memory distinct counts and top talkers, kept next to the cube
+        self.sketching = SKETCHES_ENABLED
+        self.sketches: Optional[SketchSet] = None
+        # Sketches merged in with 'sketch merge'; rebuilt sketches start from them
+        self.merged_sketches: Optional[SketchSet] = None
+        
+        # Burst detection over the entries ingested since the last load
+        self.detector: Optional[AnomalyDetector] = None
+        # Stratified sample of the same entries, for quick looks at any size
+        self.sample: Optional[StratifiedSample] = None
+        
+        # Where the last load came from, so 'load new' can continue from it
+        self.source = None
+        self._cursor_lock = threading.Lock()
+        self._last_cursor = None
+        self.load_filter = None
+        self.follower = None
+        
+        # Alert rules, checked whenever the aggregates take in new entries
+        self.alerts: Optional[AlertEngine] = None
+        if os.path.exists(os.path.expanduser(ALERT_RULES_PATH)):
+            self.load_alert_rules()
+    
+    @property
+    def last_cursor(self) -> Optional[str]:
+        """Cursor of the newest ingested entry; the follower moves it from its own thread"""
+        with self._cursor_lock:
+            return self._last_cursor
+    
+    @last_cursor.setter
+    def last_cursor(self, cursor: Optional[str]):
+        with self._cursor_lock:
+            self._last_cursor = cursor
+    
+    def _following(self, action: str) -> bool:
+        """True (after saying so) if action has to wait until following stops"""
+        if self.follower and self.follower.running:
+            print(f"Stop following before {action} ('follow stop'); "
+                  f"the analysis is kept up to date meanwhile.")
+            return True
+        return False
+    
+    @property
+    def saved_logs(self) -> SegmentArchive:
+        """The on-disk archive of saved logs, opened on first use"""
+        if self._saved_logs is None:
+            self._saved_logs = SegmentArchive()
+        return self._saved_logs
+    
+    @property
+    def processed_data(self) -> Optional[Dict]:
+        """month -> domain -> priority counts of the last analysis"""
+        return self.cube.nested("month") if self.cube is not None else None
+    
+    @property
+    def host_data(self) -> Optional[Dict]:
+        """host -> domain -> priority counts of the last analysis"""
+        return self.cube.nested("host") if self.cube is not None else None
     
     def classify_process(self, proc: str) -> str:
         """Classify process into domain"""
-        if not proc or proc == "unknown":
-            return "MISC"
-            
-        for domain, names in self.DOMAIN_MAP.items():
-            if proc in names:
-                return domain
+        return self.classifier.classify(proc)
+    
+    def load_logs(self, limit: Optional[int] = None, since: str = None, until: str = None,
+                  stream: bool = False, journal_dir: Optional[str] = None,
+                  incremental: bool = False, shards: int = 1,
+                  level: Optional[str] = None, domain: Optional[str] = None,
+                  archive: Optional[str] = None, fleet: Optional[List[str]] = None,
+                  source: Optional[LogSource] = None, cache: bool = False,
+                  saved: bool = False) -> bool:
+        """Load logs from journalctl or another source with optional filters"""
+        if self._following("loading logs"):
+            return self.data_loaded
+        if incremental:
+            if self.last_cursor:
+                return self._load_new_logs()
+            print("No previous load to continue from. Loading normally.")
 
-        if proc.startswith("systemd"):
-            return "BOOT"
+        self.last_cursor = None
+        
+        # Push level/domain filters down into the source where possible
+        plan = None
+        if level or domain:
+            plan = plan_query(level, domain, self.classifier.classify, self.PRIO_MAP,
+                              self.classifier.exact_names())
+            print(f"Filtering on {plan}")
+        self.load_filter = plan
 
-        return "MISC"
-    
-    def load_logs(self, limit: Optional[int] = None, since: str = None, until: str = None) -> bool:
-        """Load logs from journalctl with optional filters"""
-        self.raw_logs = load_journal_logs(limit, since, until)
-        self.data_loaded = bool(self.raw_logs)
+        if source is None:
+            if saved:
+                source = SavedSource(self.saved_logs, limit, since, until)
+            elif fleet:
+                source = FleetSource(fleet, limit)
+            elif archive:
+                source = open_archive(archive, limit)
+            elif journal_dir:
+                # Read the binary journal files directly, bypassing journalctl
+                source = JournalFileSource(journal_dir, limit, since, until)
+            else:
+                source = JournalctlSource(limit, since, until, shards=shards, plan=plan)
+        self.source = source
+        self.cached_cube = None
+        self.detector = None
+        self.sample = None
+        if self.alerts is not None:
+            self.alerts.reset()
+
+        if cache and self._load_cached(source, since, until, limit, stream):
+            return self.data_loaded
+
+        if stream:
+            # Defer reading until analysis so entries are aggregated as they
+            # arrive and never held in memory.
+            self.store = LogStore()
+            self.log_stream = self._filtered(source.iter_entries(), source.supports_pushdown)
+            self.streamed_count = 0
+            self.data_loaded = True
+            print(f"Logs from {source} will be streamed. Use 'analyze' to process them.")
+            return self.data_loaded
+
+        self.log_stream = None
+        logs = source.load()
+        self._remember_cursor(logs)
+        self.store = LogStore.from_lines(self._filtered(logs, source.supports_pushdown))
+        if self.window:
+            self.store.trim(len(self.store) - self.window)
+        self.data_loaded = bool(self.store)
         return self.data_loaded
     
-    def analyze_logs(self) -> Optional[Dict]:
-        """Process and analyze loaded logs"""
-        if not self.data_loaded:
-            print("No logs loaded. Use 'load' command first.")
-            return None
+    def _load_cached(self, source: LogSource, since: Optional[str], until: Optional[str],
+                     limit: Optional[int], stream: bool) -> bool:
+        """Load a time window, reading closed hours from the aggregate cache
+        
+        Returns False (and loads nothing) when the cache can't be used, so
+        the caller falls back to a normal load.
+        """
+        now = time.time()
+        start = resolve_time(since) if since else None
+        end = resolve_time(until) if until else None
+        if start is None or (until and end is None):
+            print("The aggregate cache needs a since= (and until=) it can resolve. Loading without it.")
+            return False
+        if limit or stream or self.load_filter or not source.supports_windows:
+            print("The aggregate cache only covers unfiltered time windows of the journal. "
+                  "Loading without it.")
+            return False
+        
+        start = start.timestamp()
+        end = min(end.timestamp(), now) if end else now
+        scope = f"{socket.gethostname()}:{source}"
+        hours = closed_hours(start, end, now)
+        
+        cache = AggregateCache(self.classifier.fingerprint())
+        try:
+            cached = cache.cached_hours(scope, hours)
+            print(f"{len(cached)} of {len(hours)} closed hours are cached")
             
-        month_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-        total_lines = len(self.raw_logs)
-        processed = 0
+            logs = []
+            fetched_windows = []
+            complete = True
+            for lower, upper in fetch_windows(start, end, cached):
+                try:
+                    logs.extend(source.between(f"@{lower:.6f}", f"@{upper:.6f}").load_complete())
+                except (RuntimeError, OSError, ValueError) as e:
+                    print(f"Error loading logs: {e}")
+                    complete = False
+                    continue
+                except KeyboardInterrupt:
+                    print("Interrupted.")
+                    complete = False
+                    break
+                fetched_windows.append((lower, upper))
+            self._remember_cursor(logs)
+            self.store = LogStore.from_lines(logs)
+            
+            # Hours fetched in full are final now, so cache them for next time;
+            # hours of failed or skipped windows are fetched again on the next load
+            fresh = {hour for hour in set(hours) - cached
+                     if any(lower <= hour_start(hour) and hour_start(hour + 1) - 0.000001 <= upper
+                            for lower, upper in fetched_windows)}
+            if not complete:
+                print("Warning: the load is incomplete; the hours that failed are not cached.")
+            if fresh:
+                fetched = RollupCube()
+                fetched.add_store(self.store, self.classifier)
+                cache.save(scope, fetched, fresh)
+            self.cached_cube = cache.load(scope, cached)
+        finally:
+            cache.close()
+        
+        self.log_stream = None
+        print(f"Loaded {len(self.store)} log entries, plus {len(self.cached_cube)} "
+              f"counted from the cache")
+        self.data_loaded = bool(self.store) or bool(self.cached_cube)
+        return True
+    
+    def _filtered(self, entries, pushed_down: bool = True):
+        """Lazily drop entries that fail the load filter's Python-side predicates"""
+        plan = self.load_filter
+        if not plan or (pushed_down and not plan.needs_residual()):
+            return entries
         
-        print(f"Analyzing {total_lines} log entries...")
+        def accepts(line) -> bool:
+            try:
+                return plan.accepts(parse_entry(line), pushed_down)
+            except ValueError:
+                return False
+        
+        return filter(accepts, entries)
+    
+    def _load_new_logs(self) -> bool:
+        """Fetch only entries newer than the last one ingested"""
+        source = self.source.after(self.last_cursor) if self.source else None
+        if source is None:
+            print(f"{self.source} does not support loading new entries.")
+            return self.data_loaded
+        
+        new_logs = source.load()
+        self._remember_cursor(new_logs)
+        added = self.store.extend(self._filtered(new_logs, source.supports_pushdown))
+        if not added:
+            print("No new log entries.")
+            return self.data_loaded
+        
+        self.data_loaded = True
+        if self.alerts is not None:
+            self.alerts.update(self.store)
+        
+        # Fold the new entries into the existing aggregates
+        start = self._analyzed_start()
+        if start is not None:
+            self.cube.add_store(self.store, self.classifier, start)
+            self._mark_analyzed()
+            print(f"Added {added} new entries to the analysis.")
+        else:
+            print(f"Added {added} new entries ({len(self.store)} total).")
+        
+        if self.window:
+            dropped = self.trim_window(self.window)
+            if dropped:
+                print(f"Dropped the {dropped} oldest entries to keep {self.window}.")
+        return True
+    
+    def _analyzed_start(self) -> Optional[int]:
+        """First store row not yet in the cube, or None if the cube doesn't cover the store"""
+        store, cube = self._analyzed
+        if cube is None or store is not self.store or cube is not self.cube:
+            return None
+        return max(self.analyzed_rows - store.base, 0)
+    
+    def _mark_analyzed(self):
+        """Record that the cube now covers every entry in the store"""
+        self._analyzed = (self.store, self.cube)
+        self.analyzed_rows = self.store.base + len(self.store)
+    
+    def trim_window(self, keep: int) -> int:
+        """Drop the oldest loaded entries beyond keep, retracting them from the analysis"""
+        store = self.store
+        excess = len(store) - keep
+        if excess <= 0:
+            return 0
         
-        for line in self.raw_logs:
+        start = self._analyzed_start()
+        if start:
+            self.cube.subtract_store(store, self.classifier, 0, min(excess, start))
+        return store.trim(excess)
+    
+    def set_window(self, keep: Optional[int]):
+        """Keep at most keep loaded entries (None keeps everything)"""
+        if self._following("changing the window"):
+            return
+        self.window = keep
+        if not keep:
+            print("Loaded window is unlimited.")
+            return
+        dropped = self.trim_window(keep)
+        print(f"Keeping the newest {keep} entries"
+              + (f" (dropped {dropped})." if dropped else "."))
+    
+    def _remember_cursor(self, logs: List):
+        """Record the cursor of the newest loaded entry"""
+        for line in reversed(logs):
+            try:
+                cursor = decode_record(line).cursor
+            except ValueError:
+                continue
+            if cursor:
+                self.last_cursor = cursor
+            return
+    
+    def _aggregate(self, lines, cube: RollupCube) -> int:
+        """Count streamed entries into the cube, a batch at a time"""
+        processed = 0
+        batch = LogStore()
+        cursor = None
+        
+        for line in lines:
             processed += 1
             if processed % 5000 == 0:
-                print(f"  Processed {processed}/{total_lines} entries...")
+                print(f"  Processed {processed} entries...")
                 
             try:
-                log_entry = json.loads(line)
-                
-                # Extract process name
-                process = log_entry.get("SYSLOG_IDENTIFIER", "unknown")
-                if not process or process == "unknown":
-                    process = log_entry.get("_COMM", "unknown")
-                
-                # Extract priority
-                priority_num = str(log_entry.get("PRIORITY", "6"))
-                priority = self.PRIO_MAP.get(priority_num, "INFO")
-                
-                # Extract timestamp and month
-                timestamp = log_entry.get("__realtime_timestamp")
-                if timestamp:
-                    dt = datetime.fromtimestamp(int(timestamp) / 1000000)
-                    month = dt.strftime("%b")
-                else:
-                    month = "Unknown"
-                
-                # Classify and count
-                domain = self.classify_process(process)
-                month_counts[month][domain][priority] += 1
-                
-            except (json.JSONDecodeError, KeyError, ValueError):
+                record = decode_record(line)
+            except ValueError:
                 continue
+            batch.append(record)
+            
+            # Streamed entries are not kept, so track the cursor as we go
+            cursor = record.cursor or cursor
+            
+            if len(batch) >= STREAM_BATCH_SIZE:
+                self._count_batch(batch, cube)
+                batch = LogStore()
+                # Only counted entries count as ingested
+                if cursor:
+                    self.last_cursor = cursor
+        
+        self._count_batch(batch, cube)
+        if cursor:
+            self.last_cursor = cursor
+        return processed
+    
+    def _count_batch(self, batch: LogStore, cube: RollupCube):
+        cube.add_store(batch, self.classifier)
+        # Streamed and followed entries are never stored, so bursts are checked now
+        if self.detector is not None:
+            self.detector.observe(batch)
+        if self.alerts is not None:
+            self.alerts.observe(batch)
+        if self.sketches is not None:
+            self.sketches.add_store(batch, self.classifier)
+        if self.sample is not None:
+            self.sample.observe(batch)
+    
+    def analyze_logs(self, workers: Optional[int] = None, full: bool = False,
+                     sketch: bool = False) -> Optional[RollupCube]:
+        """Process and analyze loaded logs, optionally on several cores
+        
+        Only entries loaded since the last analysis are counted, unless full
+        is set or the loaded logs have been replaced since. With sketch (or
+        SKETCHES_ENABLED) the entries also feed the sketches from then on.
+        """
+        if not self.data_loaded:
+            print("No logs loaded. Use 'load' command first.")
+            return None
+        if self._following("analyzing again"):
+            return self.cube
+        if sketch:
+            self.sketching = True
         
-        self.processed_data = month_counts
+        if self.log_stream is not None:
+            # A stream can only be consumed once
+            cube = RollupCube()
+            self.detector = AnomalyDetector(self.classifier)
+            self.sketches = self._new_sketches() if self.sketching else None
+            self.sample = StratifiedSample(self.classifier)
+            lines, self.log_stream = self.log_stream, None
+            print("Analyzing streamed log entries...")
+            processed = self._aggregate(lines, cube)
+            self.streamed_count = processed
+        else:
+            store = self.store
+            start = None if full else self._analyzed_start()
+            if full and self.follower and self.follower.processed:
+                print(f"Note: the {self.follower.processed} followed entries aren't stored, "
+                      f"so the rebuilt analysis leaves them out.")
+            if start is None:
+                cube, start = RollupCube(), 0
+                what = "log entries"
+                if self.cached_cube:
+                    cube = self.cached_cube.copy()
+                    what = f"log entries on top of {len(cube)} cached ones"
+                self.sketches = None
+            elif start == len(store) and (self.sketches is not None or not self.sketching):
+                print("Analysis is up to date. Use 'analyze full' to rebuild it.")
+                return self.cube
+            else:
+                cube = self.cube
+                what = "new log entries"
+            
+            sketch_start = start
+            if self.sketching and self.sketches is None:
+                # Sketches started after the cube first catch up with what it counted
+                self.sketches = self._new_sketches()
+                sketch_start = 0
+            sketches = self.sketches
+            
+            pending = len(store) - start
+            if workers and workers > 1 and pending >= PARALLEL_MIN_ENTRIES:
+                print(f"Analyzing {pending} {what} on {workers} processes...")
+                # The workers' partial counts feed the process sketches as well
+                shared = sketches if sketch_start == start else None
+                processed = analyze_parallel(store, self.classifier, cube, workers, start, shared)
+            else:
+                print(f"Analyzing {pending} {what}...")
+                processed = cube.add_store(store, self.classifier, start)
+                shared = None
+            if shared is not None:
+                sketches.add_templates(store, self.classifier, start)
+            elif sketches is not None:
+                sketches.add_store(store, self.classifier, sketch_start)
+            if self.alerts is not None:
+                self.alerts.update(store)
+        self.cube = cube
+        self._mark_analyzed()
         print(f"Analysis complete. Processed {processed} entries.")
-        return month_counts
+        return cube
+    
+    def _new_sketches(self) -> SketchSet:
+        """Empty sketches plus whatever was merged in from other hosts"""
+        sketches = SketchSet()
+        if self.merged_sketches is not None:
+            sketches.merge(self.merged_sketches)
+        return sketches
     
     def show_summary(self):
         """Show summary of analyzed data"""
-        if not self.processed_data:
+        if not self.cube:
             print("No data analyzed. Use 'analyze' command first.")
             return
         
         print("\n=== LOG ANALYSIS SUMMARY ===")
-        for month in sorted(self.processed_data.keys()):
+        for month in self.cube.labels("month"):
             print(f"\n{month}:")
-            for domain in sorted(self.processed_data[month].keys()):
-                total = sum(self.processed_data[month][domain].values())
+            for domain, total in self.cube.group("domain", month=month).items():
                 print(f"  {domain}: {total} entries")
     
     def show_detailed(self, month: Optional[str] = None, domain: Optional[str] = None):
         """Show detailed breakdown"""
-        if not self.processed_data:
+        cube = self.cube
+        if not cube:
             print("No data analyzed. Use 'analyze' command first.")
             return
         
@@ -106,59 +489,206 @@ class LogAnalyzer:
                          "WARNING", "NOTICE", "INFO", "DEBUG"]
         
         if month:
-            months_to_show = [month] if month in self.processed_data else []
+            # Accepts 2024-01, a year, or a month name such as Jan
+            months_to_show = cube.resolve_month(month)
         else:
-            months_to_show = sorted(self.processed_data.keys())
+            months_to_show = cube.labels("month")
         
         for m in months_to_show:
             print(f"\n=== {m} ===")
-            domains = [domain] if domain and domain in self.processed_data[m] else sorted(self.processed_data[m].keys())
+            month_domains = cube.labels("domain", month=m)
+            domains = [domain] if domain and domain in month_domains else month_domains
             
             for d in domains:
                 print(f"\n{d}:")
+                counts = cube.group("priority", month=m, domain=d)
                 for prio in priority_order:
-                    count = self.processed_data[m][d].get(prio, 0)
+                    count = counts.get(prio, 0)
                     if count > 0:
                         print(f"  {prio}: {count}")
     
-    def search_logs(self, keyword: str, level: str = None):
-        """Search logs for specific keyword"""
+    def search_logs(self, keyword: str, level: str = None, saved: bool = False,
+                    process: Optional[str] = None, limit: int = 10,
+                    template: Optional[str] = None):
+        """Search logs for words, phrases or alternatives (see analysis.search), newest first
+        
+        With a template (e.g. 'T12') only entries of that message template
+        match; the query may then be empty.
+        """
+        if saved:
+            if template:
+                print("Saved logs have no templates; searching without template=.")
+            self._search_saved(keyword, level, process, limit)
+            return
         if not self.data_loaded:
             print("No logs loaded. Use 'load' command first.")
             return
         
-        print(f"\nSearching for '{keyword}' in logs...")
+        clauses = parse_query(keyword)
+        if not clauses and not template:
+            print("Nothing to search for.")
+            return
+        priority = None
+        if level:
+            if level.upper() not in PRIORITY_NAMES:
+                print(f"Unknown level '{level}'. Use: {', '.join(PRIORITY_NAMES)}")
+                return
+            priority = PRIORITY_NAMES.index(level.upper())
+        
+        store = self.store
+        process_id = None
+        if process:
+            process_id = store.processes.id_of(process)
+            if process_id is None:
+                print(f"No entries from process '{process}'.")
+                return
+        
+        template_ids = None
+        if template:
+            template_ids, template_id = self._template_filter(template)
+            if template_ids is None:
+                return
+        
+        if clauses:
+            matches = store.token_index().search(store, clauses, priority, process_id)
+        else:
+            matches = (index for index in store.templates().rows(template_id)
+                       if (priority is None or store.priorities[index] == priority)
+                       and (process_id is None or store.process_ids[index] == process_id))
+        
+        what = f"'{keyword}'" if clauses else "entries"
+        if template:
+            what += f" of template {template}"
+        print(f"\nSearching for {what} in {len(store)} entries...")
+        started = time.perf_counter()
         results = []
+        for index in matches:
+            if template_ids is not None and template_ids[index] != template_id:
+                continue
+            time_str = store.clock(index) or "Unknown"
+            name = store.processes[store.process_ids[index]] or "unknown"
+            results.append(f"[{time_str}] {name}: {store.message(index)[:80]}...")
+            if len(results) >= limit:
+                break
+        elapsed = (time.perf_counter() - started) * 1000
         
-        for line in self.raw_logs[:100]:  # Limit search to first 100 for performance
-            try:
-                log_entry = json.loads(line)
-                message = log_entry.get("MESSAGE", "")
-                
-                if keyword.lower() in message.lower():
-                    # Check priority filter
-                    if level:
-                        priority_num = str(log_entry.get("PRIORITY", "6"))
-                        priority = self.PRIO_MAP.get(priority_num, "INFO")
-                        if priority != level.upper():
-                            continue
-                    
-                    # Format result
-                    process = log_entry.get("SYSLOG_IDENTIFIER", log_entry.get("_COMM", "unknown"))
-                    timestamp = log_entry.get("__realtime_timestamp")
-                    if timestamp:
-                        dt = datetime.fromtimestamp(int(timestamp) / 1000000)
-                        time_str = dt.strftime("%H:%M:%S")
-                    else:
-                        time_str = "Unknown"
-                    
-                    results.append(f"[{time_str}] {process}: {message[:80]}...")
-                    
-                    if len(results) >= 10:  # Limit results
+        if results:
+            print(f"Found {len(results)} matching entries, newest first ({elapsed:.1f} ms):")
+            for r in results:
+                print(f"  {r}")
+        else:
+            print("No matches found.")
+    
+    def _template_filter(self, name: str):
+        """(template id column, template id) for a template name, or (None, None)"""
+        templates = self.store.templates()
+        template_id = templates.lookup(name)
+        if template_id is None:
+            print(f"No template '{name}'. Use 'templates' to list them.")
+            return None, None
+        return templates.ids, template_id
+    
+    def grep_logs(self, patterns: List[str], level: str = None, process: Optional[str] = None,
+                  limit: int = 20, ignore_case: bool = False, workers: Optional[int] = None,
+                  template: Optional[str] = None):
+        """Regex search over all loaded entries, printing matches as they are found"""
+        if not self.store:
+            print("No logs loaded. Use 'load' command first (streamed logs aren't kept).")
+            return
+        try:
+            pattern_set = PatternSet(patterns, ignore_case)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        
+        priority = None
+        if level:
+            if level.upper() not in PRIORITY_NAMES:
+                print(f"Unknown level '{level}'. Use: {', '.join(PRIORITY_NAMES)}")
+                return
+            priority = PRIORITY_NAMES.index(level.upper())
+        store = self.store
+        process_id = None
+        if process:
+            process_id = store.processes.id_of(process)
+            if process_id is None:
+                print(f"No entries from process '{process}'.")
+                return
+        template_ids = None
+        if template:
+            template_ids, template_id = self._template_filter(template)
+            if template_ids is None:
+                return
+        
+        prefilter = "no literal prefilter" if pattern_set.literals is None else \
+            "prefilter " + ", ".join(repr(literal.decode(errors="replace"))
+                                     for literal in pattern_set.literals)
+        print(f"\nSearching {len(store)} entries for {len(patterns)} pattern(s) ({prefilter}). "
+              f"Ctrl-C stops.")
+        started = time.perf_counter()
+        found = 0
+        matches = grep(store, pattern_set, priority, process_id, workers)
+        try:
+            for index, pattern in matches:
+                if template_ids is not None and template_ids[index] != template_id:
+                    continue
+                time_str = store.clock(index) or "Unknown"
+                name = store.processes[store.process_ids[index]] or "unknown"
+                tag = f"#{pattern + 1} " if len(patterns) > 1 else ""
+                print(f"  {tag}[{time_str}] {name}: {store.message(index)[:100]}")
+                found += 1
+                if found >= limit:
+                    break
+        except KeyboardInterrupt:
+            print("Search cancelled.")
+        finally:
+            # Stops the workers and drops the chunks not yet scanned
+            matches.close()
+        
+        elapsed = time.perf_counter() - started
+        print(f"{found} match(es) in {elapsed:.2f}s" + (" (limit reached)" if found >= limit else ""))
+    
+    def _search_saved(self, keyword: str, level: str = None, process: Optional[str] = None,
+                      limit: int = 10):
+        """Search saved logs for entries containing every word of keyword, newest first"""
+        tokens = message_tokens(keyword)
+        if not tokens:
+            print("Nothing to search for.")
+            return
+        wanted = None
+        if level:
+            if level.upper() not in PRIORITY_NAMES:
+                print(f"Unknown level '{level}'. Use: {', '.join(PRIORITY_NAMES)}")
+                return
+            wanted = PRIORITY_NAMES.index(level.upper())
+        
+        archive = self.saved_logs
+        # Segment headers rule out most of the archive before any message is read
+        segments = archive.select(priorities=priority_mask([wanted]) if wanted is not None else None,
+                                  processes={process} if process else None,
+                                  tokens=tokens, newest_first=True)
+        print(f"\nSearching for '{keyword}' in saved logs "
+              f"({len(segments)} of {len(archive.segments)} segments may match)...")
+        
+        results = []
+        for segment in segments:
+            process_id = segment.processes.index(process) if process else None
+            for index in reversed(segment.rows()):
+                if wanted is not None and segment.priorities[index] != wanted:
+                    continue
+                if process_id is not None and segment.process_ids[index] != process_id:
+                    continue
+                message = segment.message(index)
+                lowered = message.lower()
+                # Cheap substring test before splitting the message into words
+                if all(token in lowered for token in tokens) and \
+                        set(tokens) <= set(message_tokens(message)):
+                    name = segment.processes[segment.process_ids[index]] or "unknown"
+                    results.append(f"[{segment.clock(index)}] {name}: {message[:80]}...")
+                    if len(results) >= limit:
                         break
-                        
-            except (json.JSONDecodeError, KeyError, ValueError):
-                continue
+            if len(results) >= limit:
+                break
         
         if results:
             print(f"Found {len(results)} matching entries:")
@@ -167,14 +697,145 @@ class LogAnalyzer:
         else:
             print("No matches found.")
     
+    def save_logs(self):
+        """Append the loaded entries to the saved-logs archive"""
+        if not self.store:
+            print("No logs loaded to save. Use 'load' command first (streamed logs aren't kept).")
+            return
+        archive = self.saved_logs
+        saved = archive.append(self.store)
+        skipped = len(self.store) - saved
+        print(f"Saved {saved} entries" + (f" ({skipped} already saved or without a timestamp)."
+                                          if skipped else "."))
+        print(archive.info())
+    
+    def follow(self, policy: Optional[str] = None, queue_size: Optional[int] = None):
+        """Start ingesting new journal entries in the background"""
+        if self.follower and self.follower.running:
+            print("Already following. Use 'follow stop' first.")
+            return
+        if self.log_stream is not None:
+            print("Analyze the pending stream before following.")
+            return
+        
+        options = {}
+        if policy:
+            options["policy"] = policy
+        if queue_size:
+            options["queue_size"] = queue_size
+        
+        # The follower continues from the analysis, so it must cover every loaded entry
+        if self.store and self._analyzed_start() != len(self.store):
+            self.analyze_logs()
+        
+        # Catch the detector up with the loaded entries; followed ones are checked on arrival
+        if self.detector is None:
+            self.detector = AnomalyDetector(self.classifier)
+        self.detector.update(self.store)
+        if self.sample is None:
+            self.sample = StratifiedSample(self.classifier)
+        self.sample.update(self.store)
+        
+        try:
+            self.follower = LogFollower(self, **options)
+            self.follower.start()
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+            return
+        
+        self.data_loaded = True
+        start = "after the last loaded entry" if self.last_cursor else "from now"
+        print(f"Following the journal {start} ({self.follower.policy}). "
+              f"'summary' and 'stats' show live data; 'follow stop' to end.")
+    
+    def load_alert_rules(self, path: Optional[str] = None) -> bool:
+        """(Re)load the alert rules file; the previous rules stay on errors"""
+        path = path or ALERT_RULES_PATH
+        try:
+            engine = AlertEngine.from_file(self.classifier, path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading alert rules: {e}")
+            return False
+        if self.follower and self.follower.running:
+            # The follower's entries from now on are checked against the new rules
+            engine.rows = self.store.base + len(self.store)
+        self.alerts = engine
+        print(f"Loaded {len(engine.rules)} alert rules from {path}")
+        return True
+    
+    def show_alerts(self, check: bool = False):
+        """Show the alert rules, their state and the latest alerts"""
+        engine = self.alerts
+        if engine is None:
+            print(f"No alert rules. Put them in {ALERT_RULES_PATH} and use 'alerts load'.")
+            return
+        if check:
+            # Rules only see entries as they are counted; catch up with the loaded ones
+            fired = engine.update(self.store)
+            print(f"Checked the loaded entries: {len(fired)} alert(s) fired.")
+        
+        print(f"\n{engine.status()}")
+        for rule in engine.rules:
+            hold = f", for {rule.hold}s" if rule.hold else ""
+            print(f"  [{rule.state:7}] {rule.name} ({rule.severity}): {rule.condition} "
+                  f"over {rule.window}s{hold}, fired {rule.fired}x")
+        recent = list(engine.alerts)[-10:]
+        if recent:
+            print("\nLatest alerts:")
+            for alert in reversed(recent):
+                time_str = datetime.fromtimestamp(alert.at).strftime("%Y-%m-%d %H:%M:%S")
+                print(f"  {time_str} {alert.message}")
+    
+    def stop_follow(self):
+        """Stop background ingestion, keeping the aggregates"""
+        if not self.follower or not self.follower.running:
+            print("Not following.")
+            return
+        self.follower.stop()
+        print(self.follower.status())
+    
+    def _sampled(self) -> Optional[StratifiedSample]:
+        """The sample of the ingested entries, caught up with the loaded ones"""
+        if self.sample is None:
+            if not self.store:
+                return None
+            self.sample = StratifiedSample(self.classifier)
+        self.sample.update(self.store)
+        return self.sample
+    
     def show_stats(self):
         """Show basic statistics"""
+        if self.follower:
+            print(self.follower.status())
+        if self.detector:
+            print(self.detector.status())
+        if self.alerts:
+            print(self.alerts.status())
+        if self.sketches:
+            print(self.sketches.status())
+        if self.sample:
+            print(self.sample.status())
         if self.data_loaded:
-            print(f"Logs loaded: {len(self.raw_logs)} entries")
-            if self.processed_data:
-                total_months = len(self.processed_data)
-                total_domains = sum(len(v) for v in self.processed_data.values())
+            if self.log_stream is not None:
+                print("Logs loaded: streaming (not analyzed yet)")
+            elif self.streamed_count and not self.store:
+                print(f"Logs streamed: {self.streamed_count} entries (not kept in memory)")
+            else:
+                store = self.store
+                print(f"Logs loaded: {len(store)} entries "
+                      f"({store.nbytes() / 1024 / 1024:.1f} MiB in memory)")
+            if self.cached_cube:
+                print(f"Cached counts: {len(self.cached_cube)} entries "
+                      f"(counted only; search and error tables don't see them)")
+            if self.load_filter:
+                print(f"Load filter: {self.load_filter}")
+            if self.cube:
+                total_months = len(self.cube.labels("month"))
+                total_domains = len(self.cube.group("month", "domain"))
                 print(f"Analysis complete: {total_months} months, {total_domains} domains")
+                hosts = self.cube.labels("host")
+                if len(hosts) > 1:
+                    print(f"Hosts: {len(hosts)}")
             else:
                 print("Data not analyzed yet.")
         else:
@@ -197,12 +858,22 @@ class LogAnalyzer:
         _show_detailed_table as _show_detailed_table,
         _show_errors_table as _show_errors_table,
         _show_domains_table as _show_domains_table,
+        _show_hosts_table as _show_hosts_table,
+        show_templates as show_templates,
+        show_template as show_template,
         browse_table as browse_table,
         _show_detailed_table_data as _show_detailed_table_data
     )
     
     # Import advanced features
-    from analysis.anomalies import add_advanced_features as add_advanced_features
+    from analysis.anomalies import (
+        add_advanced_features as add_advanced_features,
+        show_anomalies as show_anomalies,
+        _demo_anomaly_detection as _demo_anomaly_detection,
+        _demo_alert_rules as _demo_alert_rules
+    )
+    from analysis.sketches import show_sketches as show_sketches
+    from analysis.sampling import show_sample as show_sample
     from data.export import export_data as export_data
     
     def show_help(self):
@@ -211,16 +882,50 @@ class LogAnalyzer:
 === Log Analyzer REPL Commands ===
 
   load [limit] [since] [until]  - Load logs (e.g., 'load 5000', 'load since="1 hour ago"')
-  analyze                       - Analyze loaded logs
+  load new                      - Load only entries added since the last load
+  analyze [parallel|workers=N]  - Analyze newly loaded logs (optionally on several cores)
+  analyze full                  - Rebuild the analysis from all loaded logs
+  analyze sketch                - Also keep fixed-memory sketches (distinct counts, top
+                                  talkers per domain in 'table domains'/'table errors')
+  window <N>|off                - Keep only the newest N loaded entries
   summary                       - Show analysis summary
   detailed [month] [domain]     - Show detailed breakdown
-  search <keyword> [level]      - Search logs (e.g., 'search error', 'search failed ERROR')
+  search <query> [level]        - Search logs (e.g., 'search error', 'search failed ERROR')
+                                  query: words (all must match), OR, "a phrase", prefix*
+                                  options: level=ERROR process=sshd limit=N
+  search <words> [level] saved  - Search saved logs for entries with every word
+  grep <regex> [regex...]       - Regex search over all loaded logs, streamed
+                                  options: -i level=ERROR process=sshd limit=N workers=N
+  templates [limit]             - Most frequent message templates (PIDs, addresses,
+                                  ... replaced by <*>)
+                                  options: level=ERROR process=sshd by=priority|process|host|domain
+  templates T<id>               - Show one template with example entries
+                                  (search/grep also take template=T<id>)
+  save                          - Keep the loaded logs in the saved-logs archive
+  save info / save compact      - Describe / compact the saved-logs archive
+  anomalies [limit]             - Bursts of entries flagged per domain/priority/process,
+                                  live while following
+                                  options: level=ERROR domain=NETWORK bucket=minute|hour
+                                  seasonal|flat (baseline per hour of day or not)
+  alerts [check]                - Alert rules and latest alerts (check: run them over
+                                  the loaded logs)
+  alerts load [path]            - (Re)load alert rules (default ~/.config/log-analyzer/alerts.json)
+  sample [limit]                - Quick look through a stratified sample: strata, estimated
+                                  top processes with bounds, representative entries
+                                  options: level=ERROR domain=NETWORK
+  sketch [limit]                - Distinct processes/units/hosts and top talkers from the sketches
+  sketch save|merge <path>      - Save the sketches, or merge ones saved on another host
   stats                         - Show statistics
   visualize / viz               - Generate visualizations
-  table [type] [limit]          - Display data in tables
+  table [type] [limit]          - Display data in tables (summary, detailed, errors,
+                                  domains, hosts, templates)
+  table errors [limit] saved    - Newest errors in the saved logs
   browse                        - Interactive table browser
   advanced                      - Advanced features demo
   export <format>               - Export data (json, csv, html, markdown)
+  follow [policy] [queue=N]     - Keep ingesting new entries in the background
+                                  (policy: block, drop-newest, drop-oldest)
+  follow stop / follow status   - Stop following / show ingestion progress
   help                          - Show this help
   quit / q                      - Exit the program
   tui                           - Launch tui window
@@ -231,14 +936,31 @@ Examples:
   analyze                       # Process loaded logs
   summary                       # Show summary
   detailed                      # Show all details
-  detailed Jan NETWORK          # Show January network logs
+  detailed Jan NETWORK          # Show network logs of every January
+  detailed 2024-01 NETWORK      # Show network logs of January 2024
   search authentication         # Search for authentication
   search failed ERROR           # Search 'failed' at ERROR level
+  search "link down" OR carrier* process=kernel
+  grep "I/O error.*sd[a-z]" "EXT4-fs error" -i
+  templates level=ERROR by=process # Which errors repeat, and where
+  search template=T12 process=sshd
   
 Filters available for 'load':
   since="2024-01-01"           # From date
   until="2024-01-02"           # Until date
   since="1 hour ago"           # Relative time
   since="yesterday"            # Relative time
+  level=ERROR                  # Only entries at this priority
+  domain=NETWORK               # Only entries from this domain
+  shards=8                     # Split since/until into 8 parallel slices
+  journal=/var/log/journal     # Read binary journal files directly
+  file=host.export.zst         # Read an export or JSON-lines archive
+                               # (plain, .gz, .xz or .zst)
+  fleet=dir1,host2.export.gz   # Merge many hosts' journals by timestamp
+  saved                        # Read saved logs instead of the journal
+  cache                        # Reuse counts of closed hours cached by
+                               # earlier loads; fetch only the rest
+  stream                       # Aggregate while reading, without keeping
+                               # the raw entries (for very large windows)
         """
         print(help_text)
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""
+Pre-aggregated rollup cube of entry counts.
+
+Counts are kept per cell of (hour bucket, domain, priority, process, host).
+Hour buckets are local hours since the epoch, so January 2024 and January
+2025 never share a bucket. For querying, the cells are frozen into compact
+arrays with precomputed year/month/day levels and a posting list per
+dimension value; a drill-down such as "NETWORK in 2024-01 by priority"
+reads only the cells in the matching posting lists.
+"""
+
+from array import array
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from analysis.entries import PRIORITY_NAMES, ERROR_PRIORITY
+from analysis.store import NO_TIME, NUMPY_AVAILABLE, StringPool, month_label
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+LEVELS = ("year", "month", "day", "hour")
+DIMENSIONS = LEVELS + ("domain", "priority", "process", "host")
+
+# Priorities counted as errors by tables and charts
+ERROR_LEVELS = PRIORITY_NAMES[:ERROR_PRIORITY + 1]
+
+_EPOCH = date(1970, 1, 1)
+
+# (hour bucket, domain id, priority, process id, host id)
+Cell = Tuple[int, int, int, int, int]
+# (hour bucket, domain, priority, process, host, count) with names for ids
+Row = Tuple[int, str, int, str, str, int]
+FilterValue = Union[str, Iterable[str]]
+
+
+def _time_levels(hour: int) -> Tuple[int, int, int]:
+    """(year, month, day) buckets of an hour bucket"""
+    if hour == NO_TIME:
+        return NO_TIME, NO_TIME, NO_TIME
+    day = hour // 24
+    calendar = _EPOCH + timedelta(days=day)
+    month = (calendar.year - 1970) * 12 + calendar.month - 1
+    return calendar.year - 1970, month, day
+
+
+def _time_label(level: str, bucket: int) -> str:
+    if bucket == NO_TIME:
+        return "Unknown"
+    if level == "year":
+        return str(1970 + bucket)
+    if level == "month":
+        return month_label(bucket, "%Y-%m")
+    if level == "day":
+        return (_EPOCH + timedelta(days=bucket)).isoformat()
+    calendar = _EPOCH + timedelta(days=bucket // 24)
+    return f"{calendar.isoformat()} {bucket % 24:02d}:00"
+
+
+class CubeView:
+    """Frozen, indexed snapshot of the cube's cells"""
+
+    def __init__(self, cube: "RollupCube"):
+        self.cube = cube
+        self.columns: Dict[str, array] = {
+            "hour": array("i"), "day": array("i"), "month": array("i"), "year": array("i"),
+            "domain": array("I"), "priority": array("B"),
+            "process": array("I"), "host": array("I"),
+        }
+        self.counts = array("q")
+        self.postings: Dict[str, Dict[int, array]] = {dim: {} for dim in DIMENSIONS}
+
+        levels_cache: Dict[int, Tuple[int, int, int]] = {}
+        columns = self.columns
+        for position, (cell, value) in enumerate(cube.cells.items()):
+            hour, domain, priority, process, host = cell
+            levels = levels_cache.get(hour)
+            if levels is None:
+                levels = levels_cache[hour] = _time_levels(hour)
+            year, month, day = levels
+            row = (("hour", hour), ("day", day), ("month", month), ("year", year),
+                   ("domain", domain), ("priority", priority),
+                   ("process", process), ("host", host))
+            for dim, key in row:
+                columns[dim].append(key)
+                posting = self.postings[dim].get(key)
+                if posting is None:
+                    posting = self.postings[dim][key] = array("I")
+                posting.append(position)
+            self.counts.append(value)
+        self.size = len(self.counts)
+        self._groups: Dict[Tuple, Dict] = {}
+        self._time_keys: Dict[str, Dict[str, int]] = {}
+
+    def key_of(self, dim: str, label: str) -> Optional[int]:
+        """Bucket or id for a label of a dimension"""
+        if dim in LEVELS:
+            keys = self._time_keys.get(dim)
+            if keys is None:
+                keys = self._time_keys[dim] = {_time_label(dim, key): key
+                                               for key in self.postings[dim]}
+            return keys.get(label)
+        if dim == "priority":
+            return PRIORITY_NAMES.index(label) if label in PRIORITY_NAMES else None
+        pool = self.cube.pool(dim)
+        if label == "unknown":
+            return 0
+        return pool.id_of(label)
+
+    def label_of(self, dim: str, key: int) -> str:
+        if dim in LEVELS:
+            return _time_label(dim, key)
+        if dim == "priority":
+            return PRIORITY_NAMES[key]
+        return self.cube.pool(dim)[key] or "unknown"
+
+    def positions(self, filters: Dict[str, FilterValue]) -> Iterable[int]:
+        """Cell positions matching every filter, via the posting lists"""
+        if not filters:
+            return range(self.size)
+
+        wanted: Dict[str, set] = {}
+        for dim, value in filters.items():
+            labels = [value] if isinstance(value, str) else list(value)
+            keys = {self.key_of(dim, label) for label in labels}
+            keys.discard(None)
+            if not keys:
+                return []
+            wanted[dim] = keys
+
+        # Start from the smallest candidate set and check the rest by column
+        def size(dim):
+            return sum(len(self.postings[dim].get(key, ())) for key in wanted[dim])
+
+        first = min(wanted, key=size)
+        candidates = sorted(p for key in wanted[first] for p in self.postings[first].get(key, ()))
+        rest = [(self.columns[dim], keys) for dim, keys in wanted.items() if dim != first]
+        return [p for p in candidates if all(column[p] in keys for column, keys in rest)]
+
+    def group(self, dims: Tuple[str, ...], filters: Dict[str, FilterValue]) -> Dict:
+        """Counts grouped by dims over the cells matching filters"""
+        memo_key = (dims, tuple(sorted((dim, value if isinstance(value, str) else tuple(value))
+                                       for dim, value in filters.items())))
+        cached = self._groups.get(memo_key)
+        if cached is not None:
+            return cached
+
+        totals: Dict[Tuple[int, ...], int] = defaultdict(int)
+        columns = [self.columns[dim] for dim in dims]
+        counts = self.counts
+        for position in self.positions(filters):
+            totals[tuple(column[position] for column in columns)] += counts[position]
+
+        # Time levels sort chronologically, everything else by label
+        def order(item):
+            return tuple(key if dim in LEVELS else self.label_of(dim, key)
+                         for dim, key in zip(dims, item[0]))
+
+        result = {}
+        for keys, value in sorted(totals.items(), key=order):
+            labels = tuple(self.label_of(dim, key) for dim, key in zip(dims, keys))
+            result[labels[0] if len(dims) == 1 else labels] = value
+        self._groups[memo_key] = result
+        return result
+
+
+class RollupCube:
+    """Entry counts by hour bucket, domain, priority, process and host"""
+
+    def __init__(self):
+        self.domains = StringPool()
+        self.processes = StringPool()
+        self.hosts = StringPool()
+        self.cells: Dict[Cell, int] = {}
+        self._view: Optional[CubeView] = None
+
+    def pool(self, dim: str) -> StringPool:
+        return {"domain": self.domains, "process": self.processes, "host": self.hosts}[dim]
+
+    def __len__(self) -> int:
+        """Number of entries counted"""
+        return sum(self.cells.values())
+
+    def __bool__(self) -> bool:
+        return bool(self.cells)
+
+    def add_grouped(self, groups: Dict[Tuple[int, int, int, int], int], store, classifier,
+                    sign: int = 1):
+        """Add counts keyed by a store's (hour bucket, process id, host id, priority)
+
+        With sign=-1 the counts are retracted instead; emptied cells are removed.
+        """
+        domains = [self.domains.intern(domain) for domain in classifier.classify_many(store.processes)]
+        processes = [self.processes.intern(name) for name in store.processes]
+        hosts = [self.hosts.intern(name) for name in store.hosts]
+
+        cells = self.cells
+        for (hour, process, host, priority), count in groups.items():
+            cell = (hour, domains[process], priority, processes[process], hosts[host])
+            total = cells.get(cell, 0) + sign * count
+            if total:
+                cells[cell] = total
+            else:
+                del cells[cell]
+        self._view = None
+
+    def add_store(self, store, classifier, start: int = 0, stop: Optional[int] = None,
+                  sign: int = 1) -> int:
+        """Count the stored entries in rows [start, stop)"""
+        stop = len(store) if stop is None else stop
+        if stop <= start:
+            return 0
+
+        hours = store.time_parts().hours
+        if NUMPY_AVAILABLE:
+            rows = np.stack([
+                np.asarray(hours[start:stop], dtype=np.int64),
+                np.frombuffer(store.process_ids, dtype=np.uint32)[start:stop],
+                np.frombuffer(store.host_ids, dtype=np.uint32)[start:stop],
+                np.frombuffer(store.priorities, dtype=np.uint8)[start:stop],
+            ], axis=1)
+            unique, counts = np.unique(rows, axis=0, return_counts=True)
+            groups = dict(zip(map(tuple, unique.tolist()), counts.tolist()))
+        else:
+            groups = Counter(zip(hours[start:stop], store.process_ids[start:stop],
+                                 store.host_ids[start:stop], store.priorities[start:stop]))
+
+        self.add_grouped(groups, store, classifier, sign)
+        return stop - start
+
+    def subtract_store(self, store, classifier, start: int = 0, stop: Optional[int] = None) -> int:
+        """Retract the stored entries in rows [start, stop), counted earlier"""
+        return self.add_store(store, classifier, start, stop, sign=-1)
+
+    def merge(self, other: "RollupCube"):
+        """Add another cube's counts to this one"""
+        domains = [self.domains.intern(name) for name in other.domains]
+        processes = [self.processes.intern(name) for name in other.processes]
+        hosts = [self.hosts.intern(name) for name in other.hosts]
+        cells = self.cells
+        for (hour, domain, priority, process, host), count in other.cells.items():
+            cell = (hour, domains[domain], priority, processes[process], hosts[host])
+            cells[cell] = cells.get(cell, 0) + count
+        self._view = None
+
+    def rows(self, hours: Optional[Iterable[int]] = None) -> Iterator[Row]:
+        """Cells with names instead of ids, optionally only those of some hours"""
+        hours = set(hours) if hours is not None else None
+        domains, processes, hosts = self.domains, self.processes, self.hosts
+        for (hour, domain, priority, process, host), count in self.cells.items():
+            if hours is None or hour in hours:
+                yield hour, domains[domain], priority, processes[process], hosts[host], count
+
+    def add_rows(self, rows: Iterable[Row]):
+        """Add cells given as rows()"""
+        cells = self.cells
+        for hour, domain, priority, process, host, count in rows:
+            cell = (hour, self.domains.intern(domain), priority,
+                    self.processes.intern(process), self.hosts.intern(host))
+            cells[cell] = cells.get(cell, 0) + count
+        self._view = None
+
+    def copy(self) -> "RollupCube":
+        copied = RollupCube()
+        copied.merge(self)
+        return copied
+
+    @property
+    def view(self) -> CubeView:
+        """Indexed snapshot, rebuilt after the counts change"""
+        if self._view is None:
+            self._view = CubeView(self)
+        return self._view
+
+    def group(self, *dims: str, **filters: FilterValue) -> Dict:
+        """Counts by dims, e.g. group("domain", month="2024-01")
+
+        Keys are labels (a tuple of labels for several dims). Filter values
+        are labels or collections of labels.
+        """
+        for dim in dims + tuple(filters):
+            if dim not in DIMENSIONS:
+                raise ValueError(f"Unknown dimension '{dim}'. Use: {', '.join(DIMENSIONS)}")
+        return self.view.group(dims, filters)
+
+    def total(self, **filters: FilterValue) -> int:
+        view = self.view
+        return sum(view.counts[position] for position in view.positions(filters))
+
+    def labels(self, dim: str, **filters: FilterValue) -> List[str]:
+        """Values of a dimension present in the cube, time levels in order"""
+        return list(self.group(dim, **filters))
+
+    def resolve_month(self, month: str) -> List[str]:
+        """Months matching 'YYYY-MM', a year 'YYYY' or a month name such as 'Jan'"""
+        view = self.view
+        matches = []
+        for key in sorted(view.postings["month"]):
+            label = _time_label("month", key)
+            if month == label or label.startswith(month + "-"):
+                matches.append(label)
+            elif key != NO_TIME and month_label(key, "%b").lower() == month.lower():
+                matches.append(label)
+        return matches
+
+    def nested(self, outer: str, middle: str = "domain", inner: str = "priority") -> Dict:
+        """outer -> middle -> inner counts, the shape of processed_data"""
+        view = self.view
+        memo_key = ("nested", outer, middle, inner)
+        nested = view._groups.get(memo_key)
+        if nested is None:
+            nested = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+            for (a, b, c), count in self.group(outer, middle, inner).items():
+                nested[a][b][c] = count
+            view._groups[memo_key] = nested
+        return nested
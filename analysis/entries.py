@@ -0,0 +1,216 @@
+"""
+Decoding of journal entries into compact typed records.
+
+Uses msgspec or orjson when installed and falls back to the standard library
+otherwise. Only the fields the analyzer reads are kept, so a record costs a
+small tuple instead of a dict with every journal field.
+"""
+
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional, Union
+
+from config.defaults import PRIO_MAP
+
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Priority names indexed by syslog priority number
+PRIORITY_NAMES = tuple(PRIO_MAP[str(i)] for i in range(8))
+DEFAULT_PRIORITY = 6
+# ERROR and everything more severe
+ERROR_PRIORITY = 3
+
+# Words of a message as matched by token search
+_TOKEN = re.compile(r"\w+")
+
+
+class LogRecord(NamedTuple):
+    """The fields of a journal entry the analyzer uses"""
+    timestamp: Optional[int]    # realtime, microseconds since the epoch
+    priority: int               # 0 (EMERGENCY) .. 7 (DEBUG)
+    process: str                # SYSLOG_IDENTIFIER, falling back to _COMM
+    message: str
+    host: Optional[str]
+    cursor: Optional[str]
+    unit: Optional[str] = None  # _SYSTEMD_UNIT
+
+    @property
+    def priority_name(self) -> str:
+        return PRIORITY_NAMES[self.priority]
+
+
+if MSGSPEC_AVAILABLE:
+    class _JournalFields(msgspec.Struct):
+        """Typed view of the journalctl JSON fields; everything else is skipped"""
+        syslog_identifier: Union[str, list, None] = msgspec.field(default=None, name="SYSLOG_IDENTIFIER")
+        comm: Union[str, list, None] = msgspec.field(default=None, name="_COMM")
+        priority: Union[str, int, None] = msgspec.field(default=None, name="PRIORITY")
+        message: Union[str, list, None] = msgspec.field(default=None, name="MESSAGE")
+        hostname: Union[str, list, None] = msgspec.field(default=None, name="_HOSTNAME")
+        realtime: Union[str, list, None] = msgspec.field(default=None, name="__REALTIME_TIMESTAMP")
+        cursor: Union[str, list, None] = msgspec.field(default=None, name="__CURSOR")
+        unit: Union[str, list, None] = msgspec.field(default=None, name="_SYSTEMD_UNIT")
+
+    _msgspec_decoder = msgspec.json.Decoder(_JournalFields)
+    _msgspec_loads = msgspec.json.Decoder().decode
+
+
+def _priority(value) -> int:
+    """Normalize a PRIORITY field; unknown values count as INFO like before"""
+    try:
+        priority = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PRIORITY
+    return priority if 0 <= priority <= 7 else DEFAULT_PRIORITY
+
+
+def _text(value) -> Optional[str]:
+    """Normalize a string field
+
+    journalctl emits a non-UTF-8 value as a list of byte values, and a field
+    that occurs more than once in an entry as a list of its values (the
+    first one is used).
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, list) and value:
+        if all(isinstance(item, int) for item in value):
+            try:
+                return bytes(value).decode(errors="replace")
+            except ValueError:
+                return None
+        return _text(value[0])
+    return None
+
+
+def _message(value) -> str:
+    return _text(value) or ""
+
+
+def _process(identifier: Optional[str], comm: Optional[str]) -> str:
+    if identifier and identifier != "unknown":
+        return identifier
+    return comm or "unknown"
+
+
+def record_from_dict(entry: Dict) -> LogRecord:
+    """Build a record from an already decoded entry"""
+    timestamp = _text(entry.get("__REALTIME_TIMESTAMP") or entry.get("__realtime_timestamp"))
+    return LogRecord(
+        int(timestamp) if timestamp else None,
+        _priority(entry.get("PRIORITY", DEFAULT_PRIORITY)),
+        _process(_text(entry.get("SYSLOG_IDENTIFIER")), _text(entry.get("_COMM"))),
+        _message(entry.get("MESSAGE")),
+        _text(entry.get("_HOSTNAME")),
+        _text(entry.get("__CURSOR")),
+        _text(entry.get("_SYSTEMD_UNIT")),
+    )
+
+
+def _decode_msgspec(line: Union[str, bytes]) -> LogRecord:
+    try:
+        fields = _msgspec_decoder.decode(line)
+    except msgspec.DecodeError as e:
+        # Callers handle ValueError, like json.JSONDecodeError
+        raise ValueError(str(e)) from None
+    realtime = _text(fields.realtime)
+    return LogRecord(
+        int(realtime) if realtime else None,
+        _priority(fields.priority),
+        _process(_text(fields.syslog_identifier), _text(fields.comm)),
+        _message(fields.message),
+        _text(fields.hostname),
+        _text(fields.cursor),
+        _text(fields.unit),
+    )
+
+
+def _loads_msgspec(line: Union[str, bytes]) -> Dict:
+    try:
+        return _msgspec_loads(line)
+    except msgspec.DecodeError as e:
+        raise ValueError(str(e)) from None
+
+
+def _checked(entry) -> Dict:
+    if not isinstance(entry, dict):
+        raise ValueError("journal entry is not a JSON object")
+    return entry
+
+
+def _decode_orjson(line: Union[str, bytes]) -> LogRecord:
+    return record_from_dict(_checked(orjson.loads(line)))
+
+
+def _decode_stdlib(line: Union[str, bytes]) -> LogRecord:
+    return record_from_dict(_checked(json.loads(line)))
+
+
+DECODERS = {"stdlib": _decode_stdlib}
+LOADERS = {"stdlib": json.loads}
+if ORJSON_AVAILABLE:
+    DECODERS["orjson"] = _decode_orjson
+    LOADERS["orjson"] = orjson.loads
+if MSGSPEC_AVAILABLE:
+    DECODERS["msgspec"] = _decode_msgspec
+    LOADERS["msgspec"] = _loads_msgspec
+
+_decode = _decode_stdlib
+_loads = json.loads
+BACKEND = "stdlib"
+
+
+def set_backend(name: str):
+    """Select the JSON backend used for decoding"""
+    global _decode, _loads, BACKEND
+    if name not in DECODERS:
+        raise ValueError(f"JSON backend '{name}' is not available. "
+                         f"Available: {', '.join(DECODERS)}")
+    _decode = DECODERS[name]
+    _loads = LOADERS[name]
+    BACKEND = name
+
+
+# Prefer the fastest installed backend
+set_backend("msgspec" if MSGSPEC_AVAILABLE else "orjson" if ORJSON_AVAILABLE else "stdlib")
+
+
+def decode_record(line: Union[str, bytes, Dict]) -> LogRecord:
+    """Decode a JSON line (or an already decoded entry) into a LogRecord"""
+    if isinstance(line, dict):
+        return record_from_dict(line)
+    return _decode(line)
+
+
+def parse_entry(line: Union[str, Dict]) -> Dict:
+    """Return a log entry as a dict, decoding JSON lines on demand
+
+    Raises ValueError (json.JSONDecodeError for stdlib/orjson) on bad input.
+    """
+    # Entries from the binary journal reader are already decoded
+    if isinstance(line, dict):
+        return line
+    return _loads(line)
+
+
+def entry_timestamp(entry: Dict) -> Optional[int]:
+    """Return the realtime timestamp of an entry in microseconds"""
+    # journalctl names the field in upper case; the lower-case spelling is
+    # accepted for older exports produced by this tool.
+    timestamp = entry.get("__REALTIME_TIMESTAMP") or entry.get("__realtime_timestamp")
+    return int(timestamp) if timestamp else None
+
+
+def message_tokens(message: str) -> List[str]:
+    """Lower-cased words of a message, in order"""
+    return _TOKEN.findall(message.lower())
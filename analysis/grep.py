@@ -0,0 +1,269 @@
+"""
+Regex search over the loaded logs.
+
+All patterns are compiled into one alternation, so a message is matched
+once no matter how many patterns there are. Before any regex runs, each
+pattern's longest required literal (e.g. 'I/O error' in 'I/O error.*sd[a-z]')
+is located in the raw message arena with bytes.find, and only the entries
+containing one of the literals are decoded and matched. Patterns without a
+usable literal disable the prefilter.
+
+Large stores are split into chunks, newest first, and scanned by a pool of
+worker processes sharing the message columns. Matches are yielded newest
+chunk first, as soon as that chunk and every newer one have finished;
+closing the iterator (or setting the cancel event) drops the chunks not yet
+started and raises a flag in the shared block that the running ones check
+as they scan.
+"""
+
+import os
+import re
+import threading
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+from analysis.parallel import CHUNKS_PER_WORKER
+from config.defaults import PARALLEL_MIN_ENTRIES
+
+# Entries per chunk when scanning in-process
+SERIAL_CHUNK_SIZE = 50000
+
+# Candidate rows scanned between two looks at the cancel flag
+CANCEL_CHECK_EVERY = 256
+
+# Seconds between two looks at the cancel event while workers run
+CANCEL_POLL_INTERVAL = 0.1
+
+# Messages are stored as in LogStore
+_ENCODING = "utf-8"
+_ERRORS = "surrogatepass"
+
+# (store row, index of the pattern that matched)
+Match = Tuple[int, int]
+
+
+def _literal_runs(parsed) -> List[str]:
+    """Literal strings every match of a parsed pattern must contain"""
+    runs = []
+    current = []
+
+    def flush():
+        if current:
+            runs.append("".join(current))
+            current.clear()
+
+    for op, value in parsed:
+        if op is sre_constants.LITERAL:
+            current.append(chr(value))
+        elif op is sre_constants.AT:
+            # Anchors consume nothing, so the literal run continues
+            continue
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            # A scoped (?i:...) matches other cases than its literals show
+            if not value[1] & re.IGNORECASE:
+                runs.extend(_literal_runs(value[-1]))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and value[0] >= 1:
+            flush()
+            runs.extend(_literal_runs(value[2]))
+        else:
+            flush()
+    flush()
+    return runs
+
+
+def required_literal(pattern: str, flags: int = 0) -> Optional[str]:
+    """Longest literal a match of pattern must contain, if any"""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+        runs = _literal_runs(parsed)
+    except (re.error, TypeError, ValueError, IndexError):
+        return None
+    if parsed.state.flags & re.IGNORECASE and not flags & re.IGNORECASE:
+        # A leading (?i) can't be honoured by a case-sensitive prefilter
+        return None
+    return max(runs, key=len) if runs else None
+
+
+class PatternSet:
+    """Several regexes compiled into one matcher plus their prefilter literals"""
+
+    def __init__(self, patterns: Sequence[str], ignore_case: bool = False):
+        if not patterns:
+            raise ValueError("No patterns to search for")
+        self.patterns = list(patterns)
+        self.ignore_case = ignore_case
+        flags = re.IGNORECASE if ignore_case else 0
+        for pattern in self.patterns:
+            try:
+                re.compile(pattern, flags)
+            except re.error as e:
+                raise ValueError(f"Invalid pattern '{pattern}': {e}") from None
+        alternatives = "|".join(f"(?P<_p{i}>{pattern})" for i, pattern in enumerate(self.patterns))
+        try:
+            self.regex = re.compile(alternatives, flags)
+        except re.error as e:
+            raise ValueError(f"Patterns can't be combined: {e}") from None
+
+        # Case-insensitive literals are matched against lower-cased bytes,
+        # which only folds ASCII
+        literals = []
+        for pattern in self.patterns:
+            literal = required_literal(pattern, flags)
+            if literal and ignore_case:
+                literal = literal.lower() if literal.isascii() else None
+            literals.append(literal.encode(_ENCODING, _ERRORS) if literal else None)
+        self.literals: Optional[List[bytes]] = None if None in literals else literals
+
+    def __getstate__(self):
+        return {"patterns": self.patterns, "ignore_case": self.ignore_case}
+
+    def __setstate__(self, state):
+        self.__init__(state["patterns"], state["ignore_case"])
+
+    def match(self, message: str) -> Optional[int]:
+        """Index of the pattern matching message, or None"""
+        found = self.regex.search(message)
+        if found is None:
+            return None
+        return int(found.lastgroup[2:])
+
+    def candidates(self, arena, offsets, start: int, stop: int) -> Sequence[int]:
+        """Rows in [start, stop) that contain a prefilter literal, ascending"""
+        if self.literals is None:
+            return range(start, stop)
+        low = offsets[start]
+        text = bytes(arena[low:offsets[stop]])
+        if self.ignore_case:
+            text = text.lower()
+        rows = set()
+        for literal in self.literals:
+            position = text.find(literal)
+            while position != -1:
+                rows.add(bisect_right(offsets, low + position, start, stop + 1) - 1)
+                # Step by one: an occurrence straddling two messages may overlap a real one
+                position = text.find(literal, position + 1)
+        return sorted(rows)
+
+
+def scan(patterns: PatternSet, arena, offsets, priorities, process_ids, start: int, stop: int,
+         priority: Optional[int] = None, process_id: Optional[int] = None,
+         cancelled: Optional[Callable[[], bool]] = None) -> List[Match]:
+    """Matches among rows [start, stop), newest first; stops early once cancelled()"""
+    matches = []
+    for position, row in enumerate(reversed(patterns.candidates(arena, offsets, start, stop))):
+        if cancelled is not None and position % CANCEL_CHECK_EVERY == 0 and cancelled():
+            break
+        if priority is not None and priorities[row] != priority:
+            continue
+        if process_id is not None and process_ids[row] != process_id:
+            continue
+        message = bytes(arena[offsets[row]:offsets[row + 1]]).decode(_ENCODING, _ERRORS)
+        pattern = patterns.match(message)
+        if pattern is not None:
+            matches.append((row, pattern))
+    return matches
+
+
+def _layout(rows: int, arena_size: int) -> Tuple[int, int, int, int, int]:
+    """Byte offsets of the shared columns, widest first; the cancel flag byte follows"""
+    offsets = 0
+    process_ids = offsets + 8 * (rows + 1)
+    priorities = process_ids + 4 * rows
+    arena = priorities + rows
+    return offsets, process_ids, priorities, arena, arena + arena_size
+
+
+def _share(store) -> shared_memory.SharedMemory:
+    rows = len(store)
+    layout = _layout(rows, len(store.arena))
+    block = shared_memory.SharedMemory(create=True, size=layout[-1] + 1)
+    columns = (store.offsets, store.process_ids, store.priorities, store.arena)
+    for offset, column in zip(layout, columns):
+        data = bytes(column)
+        block.buf[offset:offset + len(data)] = data
+    return block
+
+
+def _scan_shared(name: str, rows: int, arena_size: int, patterns: PatternSet,
+                 start: int, stop: int, priority: Optional[int],
+                 process_id: Optional[int]) -> List[Match]:
+    """Worker: scan rows [start, stop) of the shared columns"""
+    block = shared_memory.SharedMemory(name=name)
+    views = []
+    try:
+        off, proc, prio, arena, end = _layout(rows, arena_size)
+        views = [block.buf[off:proc].cast("Q"), block.buf[proc:prio].cast("I"),
+                 block.buf[prio:arena], block.buf[arena:end]]
+        offsets, process_ids, priorities, arena_view = views
+        flag = block.buf
+        return scan(patterns, arena_view, offsets, priorities, process_ids,
+                    start, stop, priority, process_id, lambda: flag[end] != 0)
+    finally:
+        # Exported views must be released before the block can be closed
+        for view in views:
+            view.release()
+        block.close()
+
+
+def _chunks(rows: int, count: int) -> List[Tuple[int, int]]:
+    """(start, stop) row ranges, newest first"""
+    count = max(1, min(rows, count))
+    bounds = [rows * i // count for i in range(count + 1)]
+    return list(zip(bounds, bounds[1:]))[::-1]
+
+
+def grep(store, patterns: PatternSet, priority: Optional[int] = None,
+         process_id: Optional[int] = None, workers: Optional[int] = None,
+         cancel: Optional[threading.Event] = None) -> Iterator[Match]:
+    """Stream (row, pattern) matches, newest chunk first"""
+    rows = len(store)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or rows < PARALLEL_MIN_ENTRIES:
+        for start, stop in _chunks(rows, -(-rows // SERIAL_CHUNK_SIZE)):
+            if cancel is not None and cancel.is_set():
+                return
+            yield from scan(patterns, store.arena, store.offsets, store.priorities,
+                            store.process_ids, start, stop, priority, process_id,
+                            cancel.is_set if cancel is not None else None)
+        return
+
+    block = _share(store)
+    flag = _layout(rows, len(store.arena))[-1]
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(_scan_shared, block.name, rows, len(store.arena), patterns,
+                               start, stop, priority, process_id)
+                   for start, stop in _chunks(rows, workers * CHUNKS_PER_WORKER)]
+        index = {future: number for number, future in enumerate(futures)}
+        finished: Dict[int, List[Match]] = {}
+        pending = set(futures)
+        following = 0                   # the newest chunk not yet yielded
+        while following < len(futures):
+            if cancel is not None and cancel.is_set():
+                return
+            if pending:
+                done, pending = wait(pending, CANCEL_POLL_INTERVAL, FIRST_COMPLETED)
+                for future in done:
+                    finished[index[future]] = future.result()
+            # Chunks come back in any order; yield them newest first, as the serial scan does
+            while following in finished:
+                yield from finished.pop(following)
+                following += 1
+    finally:
+        # Runs when the consumer stops early too: pending chunks never start,
+        # running ones see the flag and return
+        block.buf[flag] = 1
+        pool.shutdown(wait=True, cancel_futures=True)
+        block.close()
+        block.unlink()
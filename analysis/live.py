@@ -0,0 +1,169 @@
+"""
+Live follow mode: keeps ingesting new journal entries in the background.
+
+A reader thread feeds a bounded queue from 'journalctl --follow' and an
+aggregator thread folds entries into a private copy of the aggregates. A
+snapshot is published to the analyzer at a fixed interval, so summary, stats
+and the TUI can read it at any moment without stopping ingestion.
+"""
+
+import queue
+import threading
+import time
+from typing import Optional
+
+from analysis.cube import RollupCube
+from sources.journalctl import open_follow_process
+from config.defaults import FOLLOW_QUEUE_SIZE, FOLLOW_POLICY, FOLLOW_PUBLISH_INTERVAL
+
+POLICIES = ("block", "drop-newest", "drop-oldest")
+
+# Entries folded per aggregator wake-up
+BATCH_SIZE = 1000
+
+
+class LogFollower:
+    """Follows the journal and keeps the analyzer's aggregates up to date"""
+
+    def __init__(self, analyzer, queue_size: int = FOLLOW_QUEUE_SIZE,
+                 policy: str = FOLLOW_POLICY, publish_interval: float = FOLLOW_PUBLISH_INTERVAL):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}'. Use: {', '.join(POLICIES)}")
+
+        self.analyzer = analyzer
+        self.policy = policy
+        self.publish_interval = publish_interval
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=queue_size)
+
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.started_at: Optional[float] = None
+
+        self._stop = threading.Event()
+        self._process = None
+        self._threads = []
+        self._cube: Optional[RollupCube] = None
+        self._covers_store = False      # whether the cube started out covering the store
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        """Start following from the last ingested entry (or from now)"""
+        if self.running:
+            return
+
+        # Continue from whatever has been analyzed so far
+        analyzer = self.analyzer
+        self._covers_store = (analyzer.cube is not None and
+                              analyzer._analyzed_start() == len(analyzer.store))
+        self._cube = analyzer.cube.copy() if analyzer.cube is not None else RollupCube()
+        self._publish()
+
+        self._stop.clear()
+        self._process = open_follow_process(analyzer.last_cursor, analyzer.load_filter)
+        self.started_at = time.time()
+        self._threads = [
+            threading.Thread(target=self._read, name="follow-reader", daemon=True),
+            threading.Thread(target=self._aggregate, name="follow-aggregator", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop journalctl and wait for the queue to drain"""
+        self._stop.set()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._process:
+            self._process.wait()
+            self._process.stdout.close()
+        self._threads = []
+
+    def _enqueue(self, line: str):
+        """Hand one entry to the aggregator according to the queue policy"""
+        if self.policy == "block":
+            # Backpressure: journalctl stalls on a full pipe until we catch up
+            while not self._stop.is_set():
+                try:
+                    self.queue.put(line, timeout=0.2)
+                    return
+                except queue.Full:
+                    continue
+            return
+
+        try:
+            self.queue.put_nowait(line)
+            return
+        except queue.Full:
+            pass
+
+        if self.policy == "drop-oldest":
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(line)
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+    def _read(self):
+        """Reader thread: move journalctl output into the queue"""
+        for line in self._process.stdout:
+            if self._stop.is_set():
+                break
+            line = line.rstrip("\n")
+            if line:
+                self.received += 1
+                self._enqueue(line)
+
+    def _aggregate(self):
+        """Aggregator thread: fold queued entries and publish snapshots"""
+        analyzer = self.analyzer
+        last_publish = time.monotonic()
+        batch = []
+
+        while not (self._stop.is_set() and self.queue.empty()):
+            try:
+                batch.append(self.queue.get(timeout=self.publish_interval))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if batch:
+                entries = analyzer._filtered(batch, pushed_down=True)
+                analyzer._aggregate(entries, self._cube)
+                self.processed += len(batch)
+                batch = []
+
+            now = time.monotonic()
+            if now - last_publish >= self.publish_interval:
+                self._publish()
+                last_publish = now
+
+        self._publish()
+
+    def _publish(self):
+        """Hand readers a snapshot; the live cube stays private to the aggregator"""
+        analyzer = self.analyzer
+        analyzer.cube = self._cube.copy()
+        # The snapshot holds the analyzed store plus the followed entries, which
+        # are not stored; 'analyze' and 'load new' continue from it
+        if self._covers_store:
+            analyzer._mark_analyzed()
+
+    def status(self) -> str:
+        """One-line description of the follower's progress"""
+        state = "running" if self.running else "stopped"
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        rate = self.processed / elapsed if elapsed else 0
+        return (f"Follow {state} ({self.policy}): {self.received} received, "
+                f"{self.processed} aggregated, {self.dropped} dropped, "
+                f"queue {self.queue.qsize()}/{self.queue.maxsize}, {rate:.0f} entries/s")
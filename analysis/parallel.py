@@ -0,0 +1,93 @@
+"""
+Multi-core analysis of the columnar store.
+
+The columns a count needs (hour buckets, process ids, host ids, priorities)
+are copied once into a shared memory block. Each worker process attaches to
+the block, counts its row range into partial cube cells and returns them;
+the parent adds the partials into the rollup cube, so the result is
+identical to the serial scan.
+"""
+
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+# Chunks per worker, so a slow chunk doesn't leave the other cores idle
+CHUNKS_PER_WORKER = 4
+
+# (hour bucket, process id, host id, priority) -> count
+Groups = Dict[Tuple[int, int, int, int], int]
+
+
+def _layout(rows: int) -> Tuple[int, int, int, int]:
+    """Byte offsets of the columns in the shared block, widest first"""
+    hours = 0
+    process_ids = hours + 4 * rows
+    host_ids = process_ids + 4 * rows
+    priorities = host_ids + 4 * rows
+    return hours, process_ids, host_ids, priorities
+
+
+def _share_columns(store, start: int = 0) -> shared_memory.SharedMemory:
+    """Copy rows [start, end) of the counted columns into a new shared block"""
+    rows = len(store) - start
+    offsets = _layout(rows)
+    block = shared_memory.SharedMemory(create=True, size=max(offsets[-1] + rows, 1))
+    # Hour buckets are int32 whether they are a numpy or a stdlib array
+    columns = (store.time_parts().hours, store.process_ids, store.host_ids, store.priorities)
+    for offset, column in zip(offsets, columns):
+        data = column[start:].tobytes()
+        block.buf[offset:offset + len(data)] = data
+    return block
+
+
+def _count_chunk(name: str, rows: int, start: int, stop: int) -> Groups:
+    """Worker: count rows [start, stop) of the shared columns"""
+    block = shared_memory.SharedMemory(name=name)
+    views = []
+    try:
+        hour_off, proc_off, host_off, prio_off = _layout(rows)
+        hours = block.buf[hour_off:proc_off].cast("i")
+        process_ids = block.buf[proc_off:host_off].cast("I")
+        host_ids = block.buf[host_off:prio_off].cast("I")
+        priorities = block.buf[prio_off:prio_off + rows]
+        views = [hours, process_ids, host_ids, priorities]
+
+        return Counter(zip(hours[start:stop], process_ids[start:stop],
+                           host_ids[start:stop], priorities[start:stop]))
+    finally:
+        # Exported views must be released before the block can be closed
+        for view in views:
+            view.release()
+        block.close()
+
+
+def analyze_parallel(store, classifier, cube, workers: Optional[int] = None,
+                     start: int = 0, sketches=None) -> int:
+    """Count stored entries from row start on into cube using a pool of worker processes
+
+    The workers' partial counts also feed sketches (a SketchSet), if given.
+    """
+    rows = len(store) - start
+    workers = workers or os.cpu_count() or 1
+    chunk_count = min(rows, workers * CHUNKS_PER_WORKER) or 1
+    bounds = [rows * i // chunk_count for i in range(chunk_count + 1)]
+
+    block = _share_columns(store, start)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_count_chunk, block.name, rows, start, stop)
+                       for start, stop in zip(bounds, bounds[1:])]
+            for done, future in enumerate(futures, 1):
+                groups = future.result()
+                cube.add_grouped(groups, store, classifier)
+                if sketches is not None:
+                    sketches.add_grouped(groups, store, classifier)
+                print(f"  Merged chunk {done}/{chunk_count}")
+    finally:
+        block.close()
+        block.unlink()
+
+    return rows
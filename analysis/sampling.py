@@ -0,0 +1,276 @@
+"""
+Stratified reservoir sample of the ingested entries.
+
+Entries are split into strata by (domain, priority) and every stratum keeps
+a uniform random sample of its entries (reservoir sampling, Algorithm L:
+after the reservoir fills, the number of entries to skip is drawn directly,
+so most entries are never looked at). Error-and-worse strata get a larger
+reservoir, so rare priorities are normally kept in full. Stratum totals
+are exact; a sampled entry stands for seen / kept entries of its stratum,
+which is what estimates and their confidence bounds are built from.
+"""
+
+import math
+import random
+import threading
+from collections import Counter, defaultdict
+from statistics import NormalDist
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from analysis.entries import LogRecord, PRIORITY_NAMES
+from analysis.store import NO_TIME, NUMPY_AVAILABLE
+from config.defaults import SAMPLE_SIZE, SAMPLE_RARE_SIZE, SAMPLE_RARE_PRIORITY, SAMPLE_CONFIDENCE
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# (domain, priority)
+StratumKey = Tuple[str, int]
+
+# (local minute bucket or NO_TIME, record)
+Sampled = Tuple[int, LogRecord]
+
+
+class Estimate:
+    """An estimated count with its confidence bounds"""
+
+    __slots__ = ("value", "low", "high")
+
+    def __init__(self, value: float, low: float, high: float):
+        self.value = value
+        self.low = low
+        self.high = high
+
+    @property
+    def exact(self) -> bool:
+        return self.low == self.high
+
+    def __str__(self) -> str:
+        if self.exact:
+            return f"{self.value:.0f}"
+        return f"~{self.value:.0f} ({self.low:.0f}-{self.high:.0f})"
+
+
+class _Stratum:
+    __slots__ = ("capacity", "seen", "entries", "weight", "next")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.seen = 0
+        self.entries: List[Sampled] = []
+        self.weight = 0.0               # Algorithm L's W
+        self.next = 0                   # number of the next entry to take once full
+
+    def _skip(self, rng: random.Random):
+        """Draw the next entry that replaces a sampled one"""
+        self.weight *= math.exp(math.log(rng.random()) / self.capacity)
+        self.next += int(math.log(rng.random()) / math.log1p(-self.weight)) + 1
+
+    def add(self, rows, sample: Callable[[int], Sampled], rng: random.Random):
+        """Offer store rows (all of this stratum, in order) to the reservoir"""
+        first, count = self.seen, len(rows)
+        position = 0
+        while len(self.entries) < self.capacity and position < count:
+            self.entries.append(sample(rows[position]))
+            position += 1
+            if len(self.entries) == self.capacity:
+                self.weight = 1.0
+                self.next = self.capacity - 1
+                self._skip(rng)
+        while len(self.entries) == self.capacity and self.next < first + count:
+            self.entries[rng.randrange(self.capacity)] = sample(rows[self.next - first])
+            self._skip(rng)
+        self.seen += count
+
+
+class StratifiedSample:
+    """Reservoir samples of everything ingested, per (domain, priority)"""
+
+    def __init__(self, classifier, size: int = SAMPLE_SIZE, rare_size: int = SAMPLE_RARE_SIZE,
+                 seed: Optional[int] = None):
+        self.classifier = classifier
+        self.size = size
+        self.rare_size = rare_size
+        self.strata: Dict[StratumKey, _Stratum] = {}
+        self.rows = 0                       # entries of the loaded store sampled so far
+        self._rng = random.Random(seed)
+        # The live follower adds from its own thread
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(stratum.entries) for stratum in self.strata.values())
+
+    @property
+    def seen(self) -> int:
+        return sum(stratum.seen for stratum in self.strata.values())
+
+    def _stratum(self, key: StratumKey) -> _Stratum:
+        stratum = self.strata.get(key)
+        if stratum is None:
+            capacity = self.rare_size if key[1] <= SAMPLE_RARE_PRIORITY else self.size
+            stratum = self.strata[key] = _Stratum(capacity)
+        return stratum
+
+    def _group(self, store, start: int) -> Dict[StratumKey, List[int]]:
+        """Store rows from start on per stratum, in order"""
+        domains = self.classifier.classify_many(store.processes)
+        if NUMPY_AVAILABLE and len(store) - start > 1000:
+            names = sorted(set(domains))
+            codes = np.array([names.index(name) for name in domains], dtype=np.int64)
+            keys = codes[np.asarray(store.process_ids[start:])] * 8 \
+                + np.asarray(store.priorities[start:])
+            order = np.argsort(keys, kind="stable")
+            ordered = keys[order]
+            cuts = np.flatnonzero(ordered[1:] != ordered[:-1]) + 1
+            firsts = [0] + cuts.tolist()
+            return {(names[int(ordered[first]) >> 3], int(ordered[first]) & 7): rows + start
+                    for first, rows in zip(firsts, np.split(order, cuts))}
+        groups = defaultdict(list)
+        for row, (process_id, priority) in enumerate(zip(store.process_ids[start:],
+                                                         store.priorities[start:]), start):
+            groups[domains[process_id], priority].append(row)
+        return groups
+
+    def observe(self, store, start: int = 0):
+        """Offer store rows from start on to the reservoirs"""
+        if start >= len(store):
+            return
+        minutes = store.time_parts().minutes
+
+        def sample(row) -> Sampled:
+            row = int(row)
+            return int(minutes[row]), store.record(row)
+
+        groups = self._group(store, start)
+        with self._lock:
+            # One call per stratum, its rows in order, keeps the skips cheap
+            for key, rows in groups.items():
+                self._stratum(key).add(rows, sample, self._rng)
+
+    def update(self, store):
+        """Sample the entries added to store since the last update"""
+        start = max(self.rows - store.base, 0)
+        self.observe(store, start)
+        self.rows = store.base + len(store)
+
+    def _selected(self, priority: Optional[int], domain: Optional[str]) -> List[Tuple[_Stratum, List[Sampled]]]:
+        with self._lock:
+            return [(stratum, list(stratum.entries)) for (name, level), stratum in self.strata.items()
+                    if (priority is None or level == priority) and (domain is None or name == domain)]
+
+    def kept(self, priority: Optional[int] = None, domain: Optional[str] = None) -> List[Sampled]:
+        """All sampled entries (of a priority and/or domain), oldest first"""
+        entries = [entry for _, kept in self._selected(priority, domain) for entry in kept]
+        return sorted(entries, key=lambda entry: entry[1].timestamp or 0)
+
+    def counts(self) -> List[Tuple[str, int, int, int]]:
+        """(domain, priority, kept, seen) of every stratum"""
+        with self._lock:
+            return sorted((domain, priority, len(stratum.entries), stratum.seen)
+                          for (domain, priority), stratum in self.strata.items())
+
+    def totals(self, *dims: str) -> Counter:
+        """Exact entry counts per domain and/or priority (name), from the stratum totals"""
+        totals = Counter()
+        with self._lock:
+            for (domain, priority), stratum in self.strata.items():
+                values = {"domain": domain, "priority": PRIORITY_NAMES[priority]}
+                key = tuple(values[dim] for dim in dims)
+                totals[key[0] if len(key) == 1 else key] += stratum.seen
+        return totals
+
+    def estimate(self, key: Callable[[Sampled], Hashable], priority: Optional[int] = None,
+                 domain: Optional[str] = None,
+                 confidence: float = SAMPLE_CONFIDENCE) -> Dict[Hashable, Estimate]:
+        """Estimated entry count per key(sampled entry), with confidence bounds
+
+        Each stratum contributes seen * share of its sample with that key; the
+        variances of the strata add up (with finite population correction).
+        """
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        values = defaultdict(float)
+        variances = defaultdict(float)
+        floors = defaultdict(int)
+        ceilings = defaultdict(int)
+        for stratum, entries in self._selected(priority, domain):
+            kept, seen = len(entries), stratum.seen
+            if not kept:
+                continue
+            for value, count in Counter(map(key, entries)).items():
+                share = count / kept
+                values[value] += seen * share
+                floors[value] += count
+                ceilings[value] += seen - (kept - count)
+                if kept < seen and kept > 1:
+                    variances[value] += seen * seen * (1 - kept / seen) * share * (1 - share) / (kept - 1)
+        estimates = {}
+        for value, estimate in values.items():
+            margin = z * math.sqrt(variances[value])
+            estimates[value] = Estimate(estimate, max(estimate - margin, floors[value]),
+                                        min(estimate + margin, ceilings[value]))
+        return estimates
+
+    def entries(self, limit: int, priority: Optional[int] = None,
+                domain: Optional[str] = None) -> List[Sampled]:
+        """Up to limit sampled entries, drawn in proportion to what they stand for, oldest first"""
+        weighted = []
+        for stratum, entries in self._selected(priority, domain):
+            if entries:
+                weight = stratum.seen / len(entries)
+                weighted.extend((weight, entry) for entry in entries)
+        # Weighted sampling without replacement: the largest u^(1/weight) win
+        rng = self._rng
+        keyed = [(rng.random() ** (1 / weight), index) for index, (weight, _) in enumerate(weighted)]
+        chosen = sorted(keyed, reverse=True)[:limit]
+        picked = [weighted[index][1] for _, index in chosen]
+        return sorted(picked, key=lambda entry: entry[1].timestamp or 0)
+
+    def status(self) -> str:
+        with self._lock:
+            full = sum(1 for stratum in self.strata.values() if len(stratum.entries) == stratum.seen)
+            count = len(self.strata)
+        return (f"Sample: {len(self)} of {self.seen} entries in {count} strata "
+                f"({full} kept in full)")
+
+
+def hour_of(entry: Sampled) -> int:
+    """Local hour of day of a sampled entry, or NO_TIME"""
+    minute = entry[0]
+    return NO_TIME if minute == NO_TIME else minute // 60 % 24
+
+
+def show_sample(self, limit: int = 10, level: Optional[str] = None,
+                domain: Optional[str] = None):
+    """Quick look at the ingested entries through the stratified sample"""
+    priority = None
+    if level:
+        if level.upper() not in PRIORITY_NAMES:
+            print(f"Unknown level '{level}'. Use: {', '.join(PRIORITY_NAMES)}")
+            return
+        priority = PRIORITY_NAMES.index(level.upper())
+
+    sample = self._sampled()
+    if sample is None or not sample.seen:
+        print("Nothing sampled yet. Use 'load' or 'follow' first.")
+        return
+
+    print(f"\n{sample.status()}")
+    print("\nStrata (domain, priority: kept/seen):")
+    for name, stratum_priority, kept, seen in sample.counts():
+        if (priority is None or stratum_priority == priority) and (domain is None or name == domain):
+            full = "  (all)" if kept == seen else ""
+            print(f"  {name:18} {PRIORITY_NAMES[stratum_priority]:10} {kept:6}/{seen}{full}")
+
+    processes = sample.estimate(lambda entry: entry[1].process, priority, domain)
+    if processes:
+        print(f"\nTop processes (estimated, {SAMPLE_CONFIDENCE:.0%} bounds):")
+        for process, estimate in sorted(processes.items(), key=lambda item: item[1].value,
+                                        reverse=True)[:limit]:
+            print(f"  {process:24} {estimate}")
+
+    entries = sample.entries(limit, priority, domain)
+    if entries:
+        print(f"\n{len(entries)} representative entries:")
+        for minute, record in entries:
+            clock = "Unknown" if minute == NO_TIME else f"{minute // 60 % 24:02d}:{minute % 60:02d}"
+            print(f"  [{clock}] {record.priority_name:9} {record.process}: {record.message[:100]}")
@@ -0,0 +1,158 @@
+"""
+Token search over the loaded logs.
+
+Every message is split into lower-cased words (message_tokens) and each word
+maps to a posting list: the numbers of the entries containing it, ascending.
+Entries are numbered in load order, which for journal loads is timestamp
+order, so walking a posting list backwards visits the newest entries first
+and a search can stop as soon as it has enough matches.
+
+Query syntax:
+  disk error        entries with both words
+  disk OR raid      entries with either word (OR binds loosest)
+  "I/O error"       the words next to each other, in this order
+  fail*             any word starting with 'fail'
+"""
+
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from analysis.entries import message_tokens
+
+_QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+
+_EMPTY = array("I")
+
+
+class Term(NamedTuple):
+    """One query term; a word is a one-word phrase"""
+    kind: str                   # "phrase" or "prefix"
+    words: Tuple[str, ...]
+
+
+Clause = List[Term]
+
+
+def parse_query(text: str) -> List[Clause]:
+    """Split a query into OR-ed clauses of AND-ed terms"""
+    clauses: List[Clause] = [[]]
+    for quoted, bare in _QUERY_PART.findall(text):
+        if bare == "OR":
+            clauses.append([])
+            continue
+        if bare == "AND":
+            continue
+        if bare.endswith("*") and len(message_tokens(bare)) == 1:
+            clauses[-1].append(Term("prefix", tuple(message_tokens(bare))))
+            continue
+        # Punctuated words such as 'I/O' become phrases of their parts
+        words = tuple(message_tokens(quoted or bare))
+        if words:
+            clauses[-1].append(Term("phrase", words))
+    return [clause for clause in clauses if clause]
+
+
+def _contains(posting: array, row: int) -> bool:
+    position = bisect_left(posting, row)
+    return position < len(posting) and posting[position] == row
+
+
+def _has_phrase(tokens: List[str], words: Tuple[str, ...]) -> bool:
+    return f" {' '.join(words)} " in f" {' '.join(tokens)} "
+
+
+class TokenIndex:
+    """Posting lists of entry numbers per message word"""
+
+    def __init__(self):
+        self.generation = -1
+        self.base = 0           # entries before this number were trimmed away
+        self.rows = 0           # entries before this number are indexed
+        self.postings: Dict[str, array] = {}
+        self._vocabulary: Optional[List[str]] = None
+
+    def update(self, store):
+        """Index entries added since the last update and forget trimmed ones"""
+        if store.base > self.base:
+            for token, posting in list(self.postings.items()):
+                cut = bisect_left(posting, store.base)
+                if cut == len(posting):
+                    del self.postings[token]
+                elif cut:
+                    del posting[:cut]
+            self.base = store.base
+            self._vocabulary = None
+
+        postings = self.postings
+        end = store.base + len(store)
+        for row in range(max(self.rows, store.base), end):
+            for token in set(message_tokens(store.message(row - store.base))):
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = array("I")
+                    self._vocabulary = None
+                posting.append(row)
+        self.rows = end
+
+    def nbytes(self) -> int:
+        return sum(len(token) + 4 * len(posting) for token, posting in self.postings.items())
+
+    def _prefixed(self, prefix: str) -> array:
+        """Entries containing any word that starts with prefix"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        position = bisect_left(vocabulary, prefix)
+        lists = []
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            lists.append(self.postings[vocabulary[position]])
+            position += 1
+        if len(lists) == 1:
+            return lists[0]
+        merged = array("I")
+        for row in heapq.merge(*lists):
+            if not merged or merged[-1] != row:
+                merged.append(row)
+        return merged
+
+    def _clause_rows(self, clause: Clause) -> Iterator[int]:
+        """Entries having every word of a clause, newest first"""
+        lists = []
+        for term in clause:
+            if term.kind == "prefix":
+                lists.append(self._prefixed(term.words[0]))
+            else:
+                lists.extend(self.postings.get(word, _EMPTY) for word in term.words)
+        lists.sort(key=len)
+        driver, others = lists[0], lists[1:]
+        # Walk the shortest list and probe the others
+        for row in reversed(driver):
+            if all(_contains(posting, row) for posting in others):
+                yield row
+
+    def search(self, store, clauses: List[Clause], priority: Optional[int] = None,
+               process_id: Optional[int] = None) -> Iterator[int]:
+        """Store rows matching the query, newest first; stop iterating to stop searching"""
+        def matches(clause: Clause) -> Iterator[int]:
+            phrases = [term.words for term in clause if term.kind == "phrase" and len(term.words) > 1]
+            for row in self._clause_rows(clause):
+                index = row - store.base
+                if priority is not None and store.priorities[index] != priority:
+                    continue
+                if process_id is not None and store.process_ids[index] != process_id:
+                    continue
+                if phrases:
+                    tokens = message_tokens(store.message(index))
+                    if not all(_has_phrase(tokens, words) for words in phrases):
+                        continue
+                yield row
+
+        previous = None
+        for row in heapq.merge(*(matches(clause) for clause in clauses), reverse=True):
+            # An entry can match several OR-ed clauses
+            if row != previous:
+                yield row - store.base
+                previous = row
@@ -0,0 +1,369 @@
+"""
+Fixed-memory sketches kept next to the exact aggregates.
+
+- HyperLogLog estimates how many distinct processes, units and hosts were
+  seen (about 1% error with 2^14 one-byte registers).
+- TopK finds the heaviest keys (processes, message templates) per domain:
+  a Count-Min sketch estimates every key's count and a Space-Saving style
+  table keeps the K keys with the largest estimates.
+
+Every sketch merges with another of the same shape (registers are maxed,
+counters added), and serializes to plain JSON, so partial sketches built
+by other workers or on other hosts can be combined.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import math
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from analysis.entries import ERROR_PRIORITY
+from analysis.templates import TemplateMiner
+from config.defaults import (HLL_PRECISION, SKETCH_WIDTH, SKETCH_DEPTH, SKETCH_TOP_K,
+                             SKETCH_TEMPLATES)
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash(key: str) -> int:
+    """Stable 64-bit hash, the same in every process and on every host"""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8", "surrogatepass"),
+                                          digest_size=8).digest(), "little")
+
+
+def _pack(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _unpack(typecode: str, text: str) -> array:
+    values = array(typecode)
+    values.frombytes(base64.b64decode(text))
+    return values
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2^precision bytes"""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key: str):
+        hashed = _hash(key)
+        index = hashed >> (64 - self.precision)
+        rest = (hashed << self.precision) & _MASK64
+        # Position of the first 1 bit after the index bits
+        rank = 64 - self.precision + 1 if not rest else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, keys: Iterable[str]):
+        for key in keys:
+            if key:
+                self.add(key)
+
+    def count(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -rank for rank in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            # Linear counting is more accurate while most registers are empty
+            estimate = size * math.log(size / empty)
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Can't merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_dict(self) -> Dict:
+        return {"precision": self.precision,
+                "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HyperLogLog":
+        sketch = cls(data["precision"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+
+class CountMin:
+    """Count estimates that are never too low, in depth x width counters"""
+
+    def __init__(self, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.counters = array("q", bytes(8 * width * depth))
+
+    def _cells(self, key: str) -> List[int]:
+        hashed = _hash(key)
+        low, high = hashed & 0xFFFFFFFF, hashed >> 32
+        width = self.width
+        # Double hashing gives depth independent-enough rows from one hash
+        return [row * width + (low + row * high) % width for row in range(self.depth)]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Add count to key; returns its new estimate"""
+        counters = self.counters
+        estimate = None
+        for cell in self._cells(key):
+            counters[cell] += count
+            if estimate is None or counters[cell] < estimate:
+                estimate = counters[cell]
+        return estimate
+
+    def estimate(self, key: str) -> int:
+        counters = self.counters
+        return min(counters[cell] for cell in self._cells(key))
+
+    def merge(self, other: "CountMin"):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Can't merge Count-Min sketches of different shapes")
+        self.counters = array("q", map(sum, zip(self.counters, other.counters)))
+
+    def to_dict(self) -> Dict:
+        return {"width": self.width, "depth": self.depth, "counters": _pack(self.counters)}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CountMin":
+        sketch = cls(data["width"], data["depth"])
+        sketch.counters = _unpack("q", data["counters"])
+        return sketch
+
+
+class TopK:
+    """The k heaviest keys: Count-Min estimates, Space-Saving style replacement"""
+
+    def __init__(self, k: int = SKETCH_TOP_K, width: int = SKETCH_WIDTH, depth: int = SKETCH_DEPTH):
+        self.k = k
+        self.counts = CountMin(width, depth)
+        self.top: Dict[str, int] = {}
+        self.total = 0
+
+    def add(self, key: str, count: int = 1):
+        self.total += count
+        estimate = self.counts.add(key, count)
+        top = self.top
+        if key in top or len(top) < self.k:
+            top[key] = estimate
+            return
+        # Replace the lightest key once this one outweighs it
+        lightest = min(top, key=top.get)
+        if estimate > top[lightest]:
+            del top[lightest]
+            top[key] = estimate
+
+    def items(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """(key, estimated count), heaviest first"""
+        return sorted(self.top.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def merge(self, other: "TopK"):
+        self.counts.merge(other.counts)
+        self.total += other.total
+        candidates = set(self.top) | set(other.top)
+        estimates = {key: self.counts.estimate(key) for key in candidates}
+        self.top = dict(sorted(estimates.items(), key=lambda item: item[1], reverse=True)[:self.k])
+
+    def to_dict(self) -> Dict:
+        return {"k": self.k, "total": self.total, "counts": self.counts.to_dict(),
+                "top": self.top}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TopK":
+        sketch = cls(data["k"])
+        sketch.counts = CountMin.from_dict(data["counts"])
+        sketch.top = dict(data["top"])
+        sketch.total = data["total"]
+        return sketch
+
+
+class SketchSet:
+    """Distinct counts and per-domain top talkers of everything analyzed
+
+    Top talkers are kept per ("process" or "template", domain, errors only).
+    Sketches only grow: entries dropped from the loaded window stay counted.
+    """
+
+    DISTINCT = ("process", "unit", "host")
+
+    def __init__(self, templates: bool = SKETCH_TEMPLATES):
+        self.distinct = {name: HyperLogLog() for name in self.DISTINCT}
+        self.talkers: Dict[Tuple[str, str, bool], TopK] = {}
+        self.entries = 0
+        # Templates are mined here, so streamed batches get them too
+        self.miner = TemplateMiner() if templates else None
+        # The live follower adds from its own thread
+        self._lock = threading.Lock()
+
+    def _talkers(self, what: str, domain: str, errors: bool) -> TopK:
+        key = (what, domain, errors)
+        sketch = self.talkers.get(key)
+        if sketch is None:
+            sketch = self.talkers[key] = TopK()
+        return sketch
+
+    def add_grouped(self, groups, store, classifier):
+        """Add (hour, process id, host id, priority) -> count partials, as the cube does"""
+        domains = classifier.classify_many(store.processes)
+        processes = Counter()
+        for (_, process_id, _, priority), count in groups.items():
+            processes[process_id, priority] += count
+        with self._lock:
+            self._add_processes(processes, store, domains)
+
+    def _add_processes(self, groups: Counter, store, domains: List[str]):
+        for (process_id, priority), count in groups.items():
+            name = store.processes[process_id] or "unknown"
+            domain = domains[process_id]
+            self.entries += count
+            self._talkers("process", domain, False).add(name, count)
+            if priority <= ERROR_PRIORITY:
+                self._talkers("process", domain, True).add(name, count)
+        # The pools hold each distinct name once, so they are cheap to add
+        self.distinct["process"].update(store.processes)
+        self.distinct["unit"].update(store.units)
+        self.distinct["host"].update(store.hosts)
+
+    def add_templates(self, store, classifier, start: int = 0):
+        """Mine the templates of store rows from start on into the template talkers"""
+        if self.miner is None or start >= len(store):
+            return
+        domains = classifier.classify_many(store.processes)
+        ids = self.miner.mine(store, start)
+        groups = Counter(zip(ids, store.process_ids[start:], store.priorities[start:]))
+        with self._lock:
+            for (template_id, process_id, priority), count in groups.items():
+                text = self.miner.label(template_id)
+                domain = domains[process_id]
+                self._talkers("template", domain, False).add(text, count)
+                if priority <= ERROR_PRIORITY:
+                    self._talkers("template", domain, True).add(text, count)
+
+    def add_store(self, store, classifier, start: int = 0) -> int:
+        """Sketch the stored entries from row start on"""
+        if start >= len(store):
+            return 0
+        groups = Counter(zip(store.process_ids[start:], store.priorities[start:]))
+        with self._lock:
+            self._add_processes(groups, store, classifier.classify_many(store.processes))
+        self.add_templates(store, classifier, start)
+        return len(store) - start
+
+    def top(self, what: str, domain: Optional[str] = None, errors: bool = False,
+            limit: int = 5) -> List[Tuple[str, int]]:
+        """Heaviest processes or templates of a domain, or of all domains merged"""
+        with self._lock:
+            tops = [dict(sketch.top) for (kind, name, only_errors), sketch in self.talkers.items()
+                    if kind == what and only_errors == errors and domain in (None, name)]
+        # Keys of different domains are different entries, so estimates simply add up
+        merged = Counter()
+        for top in tops:
+            merged.update(top)
+        return merged.most_common(limit)
+
+    def domains(self) -> List[str]:
+        with self._lock:
+            return sorted({domain for _, domain, _ in self.talkers})
+
+    def count(self, name: str) -> int:
+        """Estimated number of distinct processes, units or hosts"""
+        with self._lock:
+            return self.distinct[name].count()
+
+    def merge(self, other: "SketchSet"):
+        with self._lock:
+            for name, sketch in other.distinct.items():
+                self.distinct[name].merge(sketch)
+            for key, sketch in other.talkers.items():
+                if key in self.talkers:
+                    self.talkers[key].merge(sketch)
+                else:
+                    self.talkers[key] = TopK.from_dict(sketch.to_dict())
+            self.entries += other.entries
+
+    def nbytes(self) -> int:
+        with self._lock:
+            size = sum(len(sketch.registers) for sketch in self.distinct.values())
+            for sketch in self.talkers.values():
+                size += 8 * len(sketch.counts.counters) + 64 * len(sketch.top)
+        return size
+
+    def status(self) -> str:
+        return (f"Sketches: {self.entries} entries, ~{self.count('process')} processes, "
+                f"~{self.count('unit')} units, ~{self.count('host')} hosts, "
+                f"{len(self.talkers)} top-talker lists ({self.nbytes() / 1024:.0f} KiB)")
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": self.entries,
+                "distinct": {name: sketch.to_dict() for name, sketch in self.distinct.items()},
+                "talkers": [[what, domain, errors, sketch.to_dict()]
+                            for (what, domain, errors), sketch in self.talkers.items()],
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SketchSet":
+        sketches = cls(templates=False)
+        sketches.entries = data["entries"]
+        sketches.distinct = {name: HyperLogLog.from_dict(sketch)
+                             for name, sketch in data["distinct"].items()}
+        sketches.talkers = {(what, domain, errors): TopK.from_dict(sketch)
+                            for what, domain, errors, sketch in data["talkers"]}
+        return sketches
+
+
+def show_sketches(self, action: Optional[str] = None, path: Optional[str] = None,
+                  limit: int = 10):
+    """Show the sketches' distinct counts and top talkers, or save/merge them"""
+    if action == "merge":
+        # Partial sketches from another host or run add into the current ones
+        try:
+            with open(os.path.expanduser(path)) as f:
+                other = SketchSet.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error reading sketches: {e}")
+            return
+        if self.sketches is None:
+            self.sketches = self._new_sketches()
+        # Entries analyzed from now on are sketched as well
+        self.sketching = True
+        try:
+            self.sketches.merge(other)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+        # Kept apart as well, so rebuilding the analysis doesn't drop them
+        if self.merged_sketches is None:
+            self.merged_sketches = SketchSet(templates=False)
+        self.merged_sketches.merge(other)
+        print(f"Merged {other.entries} sketched entries from {path}")
+
+    sketches = self.sketches
+    if sketches is None:
+        print("No sketches. Use 'analyze sketch' to keep them next to the analysis.")
+        return
+    
+    if action == "save":
+        try:
+            with open(os.path.expanduser(path), "w") as f:
+                json.dump(sketches.to_dict(), f)
+        except OSError as e:
+            print(f"Error saving sketches: {e}")
+            return
+        print(f"Saved sketches of {sketches.entries} entries to {path}")
+        return
+    
+    print(f"\n{sketches.status()}")
+    for what in ("process", "template"):
+        top = sketches.top(what, limit=limit)
+        if top:
+            print(f"\nTop {what}es:" if what == "process" else f"\nTop {what}s:")
+            for key, count in top:
+                print(f"  ~{count:8}  {key[:100]}")
@@ -0,0 +1,327 @@
+"""
+Columnar in-memory storage for loaded log entries.
+
+Instead of one JSON string per entry, each field lives in its own typed
+array: timestamps as int64, priorities as uint8, and process, host and unit
+names as ids into interned string pools. Messages are packed into a single
+byte arena indexed by an offsets array. An entry costs a few tens of bytes
+plus its message text, and every column can be scanned as a whole (or viewed
+with numpy.frombuffer without copying).
+"""
+
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from analysis.entries import LogRecord, decode_record
+from analysis.search import TokenIndex
+from analysis.templates import TemplateMiner
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Messages may carry lone surrogates from JSON \u escapes
+_ENCODING = "utf-8"
+_ERRORS = "surrogatepass"
+
+# Bucket id of entries without a timestamp
+NO_TIME = -1
+
+# Distinct minutes remembered by the pure-Python bucketing
+MINUTE_CACHE_SIZE = 4096
+
+
+class StringPool:
+    """Dictionary encoding of repeated strings; id 0 is reserved for 'missing'"""
+
+    def __init__(self):
+        self.values: List[str] = [""]
+        self._ids: Dict[str, int] = {"": 0}
+
+    def intern(self, value: Optional[str]) -> int:
+        if not value:
+            return 0
+        index = self._ids.get(value)
+        if index is None:
+            index = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def id_of(self, value: str) -> Optional[int]:
+        """Id of a value, or None if it never occurred"""
+        return self._ids.get(value)
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[index]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.values)
+
+
+class TimeParts:
+    """Local-time bucket ids derived from the timestamp column
+
+    Buckets count whole minutes, hours, days and months since the local
+    epoch (1970-01-01 00:00 in the local time zone), so grouping by any of
+    them is an integer comparison. Rows without a timestamp get NO_TIME.
+    """
+
+    def __init__(self):
+        self.generation = -1
+        self.rows = 0
+        if NUMPY_AVAILABLE:
+            self.minutes = np.empty(0, dtype=np.int32)
+            self.hours = np.empty(0, dtype=np.int32)
+            self.days = np.empty(0, dtype=np.int32)
+            self.months = np.empty(0, dtype=np.int32)
+        else:
+            self.minutes = array("i")
+            self.hours = array("i")
+            self.days = array("i")
+            self.months = array("i")
+            self._minute_cache: Dict[int, Tuple[int, int]] = {}
+
+    def update(self, timestamps: array):
+        """Derive the buckets of rows added since the last update"""
+        if len(timestamps) > self.rows:
+            if NUMPY_AVAILABLE:
+                self._update_numpy(timestamps)
+            else:
+                self._update_python(timestamps)
+            self.rows = len(timestamps)
+
+    def drop(self, count: int):
+        """Forget the buckets of the oldest count rows"""
+        for name in ("minutes", "hours", "days", "months"):
+            column = getattr(self, name)
+            if NUMPY_AVAILABLE:
+                setattr(self, name, column[count:].copy())
+            else:
+                del column[:count]
+        self.rows -= count
+
+    def _update_numpy(self, timestamps: array):
+        ts = np.frombuffer(timestamps, dtype=np.int64)[self.rows:]
+        seconds = ts // 1000000
+
+        # Look up the UTC offset once per distinct hour; only hours containing
+        # a DST or zone change are resolved per distinct minute
+        hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+        starts = np.array([_utc_offset(h * 3600) for h in hours.tolist()], dtype=np.int64)
+        ends = np.array([_utc_offset(h * 3600 + 3600) for h in hours.tolist()], dtype=np.int64)
+        offsets = starts[inverse]
+        changing = np.nonzero((starts != ends)[inverse])[0]
+        if len(changing):
+            minutes, minute_inverse = np.unique(seconds[changing] // 60, return_inverse=True)
+            minute_offsets = np.array([_utc_offset(m * 60) for m in minutes.tolist()],
+                                      dtype=np.int64)
+            offsets[changing] = minute_offsets[minute_inverse]
+
+        local = (seconds + offsets).astype("datetime64[s]")
+        missing = ts == 0
+        columns = (
+            local.astype("datetime64[m]").astype(np.int64),
+            local.astype("datetime64[h]").astype(np.int64),
+            local.astype("datetime64[D]").astype(np.int64),
+            local.astype("datetime64[M]").astype(np.int64),
+        )
+        for name, column in zip(("minutes", "hours", "days", "months"), columns):
+            column = column.astype(np.int32)
+            column[missing] = NO_TIME
+            setattr(self, name, np.concatenate((getattr(self, name), column)))
+
+    def _update_python(self, timestamps: array):
+        cache = self._minute_cache
+        for timestamp in timestamps[self.rows:]:
+            if not timestamp:
+                for column in (self.minutes, self.hours, self.days, self.months):
+                    column.append(NO_TIME)
+                continue
+            # Time zone offsets are whole minutes, so every entry of a UTC
+            # minute shares its local buckets
+            minute = timestamp // 60000000
+            parts = cache.get(minute)
+            if parts is None:
+                if len(cache) >= MINUTE_CACHE_SIZE:
+                    cache.clear()
+                local_minute = minute + _utc_offset(minute * 60) // 60
+                local = time.gmtime(local_minute * 60)
+                parts = cache[minute] = (local_minute, (local.tm_year - 1970) * 12 + local.tm_mon - 1)
+            local_minute, month = parts
+            self.minutes.append(local_minute)
+            self.hours.append(local_minute // 60)
+            self.days.append(local_minute // 1440)
+            self.months.append(month)
+
+    def hours_of_day(self):
+        """Local hour (0-23) of every row, NO_TIME where unknown"""
+        if NUMPY_AVAILABLE:
+            return np.where(self.hours == NO_TIME, NO_TIME, self.hours % 24)
+        return array("b", (NO_TIME if hour == NO_TIME else hour % 24 for hour in self.hours))
+
+
+def _utc_offset(seconds: int) -> int:
+    """Local UTC offset in seconds at a POSIX time"""
+    return time.localtime(seconds).tm_gmtoff
+
+
+def month_label(month: int, fmt: str = "%b") -> str:
+    """Format a month bucket (months since 1970-01)"""
+    if month == NO_TIME:
+        return "Unknown"
+    return datetime(1970 + month // 12, month % 12 + 1, 1).strftime(fmt)
+
+
+class LogStore:
+    """Column-oriented store of log entries"""
+
+    def __init__(self):
+        self.timestamps = array("q")      # realtime in microseconds, 0 if unknown
+        self.priorities = array("B")
+        self.process_ids = array("I")
+        self.host_ids = array("I")
+        self.unit_ids = array("I")
+        self.processes = StringPool()
+        self.hosts = StringPool()
+        self.units = StringPool()
+        self.arena = bytearray()
+        self.offsets = array("Q", [0])    # message i is arena[offsets[i]:offsets[i + 1]]
+
+        # Rows trimmed from the front so far; row i is entry number base + i
+        self.base = 0
+
+        # Bumped whenever entries change; derived data is rebuilt lazily
+        self.generation = 0
+        self._time_parts: Optional[TimeParts] = None
+        self._token_index: Optional[TokenIndex] = None
+        self._templates: Optional[TemplateMiner] = None
+
+    @classmethod
+    def from_lines(cls, lines: Iterable) -> "LogStore":
+        store = cls()
+        store.extend(lines)
+        return store
+
+    def append(self, record: LogRecord):
+        """Add one decoded record"""
+        self.timestamps.append(record.timestamp or 0)
+        self.priorities.append(record.priority)
+        self.process_ids.append(self.processes.intern(record.process))
+        self.host_ids.append(self.hosts.intern(record.host))
+        self.unit_ids.append(self.units.intern(record.unit))
+        self.arena += record.message.encode(_ENCODING, _ERRORS)
+        self.offsets.append(len(self.arena))
+        self.generation += 1
+
+    def extend(self, lines: Iterable) -> int:
+        """Decode and add JSON lines or entry dicts; returns how many were added"""
+        added = 0
+        for line in lines:
+            try:
+                record = decode_record(line)
+            except ValueError:
+                continue
+            self.append(record)
+            added += 1
+        return added
+
+    def trim(self, count: int) -> int:
+        """Drop the oldest count entries; returns how many were dropped"""
+        count = min(count, len(self))
+        if count <= 0:
+            return 0
+        for column in (self.timestamps, self.priorities, self.process_ids,
+                       self.host_ids, self.unit_ids):
+            del column[:count]
+        cut = self.offsets[count]
+        del self.arena[:cut]
+        self.offsets = array("Q", (offset - cut for offset in self.offsets[count:]))
+        if self._time_parts is not None:
+            self._time_parts.drop(min(count, self._time_parts.rows))
+        self.base += count
+        self.generation += 1
+        return count
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def time_parts(self) -> TimeParts:
+        """Time buckets of every entry, derived once and shared by all commands"""
+        parts = self._time_parts
+        if parts is None:
+            parts = self._time_parts = TimeParts()
+        if parts.generation != self.generation:
+            # Entries are appended at the end and trimmed from the front, so
+            # just the new rows are derived
+            parts.update(self.timestamps)
+            parts.generation = self.generation
+        return parts
+
+    def token_index(self) -> TokenIndex:
+        """Word index of the messages, extended with just the rows added since last use"""
+        index = self._token_index
+        if index is None:
+            index = self._token_index = TokenIndex()
+        if index.generation != self.generation:
+            index.update(self)
+            index.generation = self.generation
+        return index
+
+    def templates(self) -> TemplateMiner:
+        """Message templates and the template id of every entry, mined once per entry"""
+        miner = self._templates
+        if miner is None:
+            miner = self._templates = TemplateMiner()
+        if miner.generation != self.generation:
+            miner.update(self)
+            miner.generation = self.generation
+        return miner
+
+    def clock(self, index: int) -> Optional[str]:
+        """Local wall-clock time of an entry as HH:MM:SS"""
+        timestamp = self.timestamps[index]
+        if not timestamp:
+            return None
+        minute = int(self.time_parts().minutes[index])
+        return f"{minute // 60 % 24:02d}:{minute % 60:02d}:{timestamp // 1000000 % 60:02d}"
+
+    def message(self, index: int) -> str:
+        return self.arena[self.offsets[index]:self.offsets[index + 1]].decode(_ENCODING, _ERRORS)
+
+    def record(self, index: int) -> LogRecord:
+        """Rebuild the record of one entry (without its cursor)"""
+        return LogRecord(
+            self.timestamps[index] or None,
+            self.priorities[index],
+            self.processes[self.process_ids[index]] or "unknown",
+            self.message(index),
+            self.hosts[self.host_ids[index]] or None,
+            None,
+            self.units[self.unit_ids[index]] or None,
+        )
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> Iterator[LogRecord]:
+        for index in range(*slice(start, stop).indices(len(self))):
+            yield self.record(index)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns and the message arena"""
+        columns = (self.timestamps, self.priorities, self.process_ids,
+                   self.host_ids, self.unit_ids, self.offsets)
+        size = sum(column.itemsize * len(column) for column in columns) + len(self.arena)
+        for pool in (self.processes, self.hosts, self.units):
+            size += sum(len(value) for value in pool.values)
+        if self._time_parts is not None:
+            size += 16 * self._time_parts.rows
+        if self._token_index is not None:
+            size += self._token_index.nbytes()
+        if self._templates is not None:
+            size += self._templates.nbytes()
+        return size
@@ -0,0 +1,256 @@
+"""
+Message templates mined from the loaded logs (Drain-style).
+
+Messages that differ only in variable parts (PIDs, addresses, paths, ...)
+are grouped into one template such as 'Accepted publickey for <*> from <*>'.
+Numbers, hex values and IP addresses are masked first; the masked message is
+then routed through a fixed-depth parse tree, first by its token count and
+then by its leading tokens, to a short list of candidate templates. It joins
+the most similar candidate (the share of positions with the same token) if
+that is similar enough, turning the differing positions into <*>, and starts
+a new template otherwise.
+
+Every message is looked at once and the tree and template table have fixed
+limits, so mining millions of entries needs memory for the templates only
+(plus, for a LogStore, one template id per entry).
+"""
+
+import re
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config.defaults import (TEMPLATE_DEPTH, TEMPLATE_SIMILARITY, TEMPLATE_MAX_CHILDREN,
+                             TEMPLATE_MAX_TEMPLATES, TEMPLATE_EXAMPLES)
+
+WILDCARD = "<*>"
+
+# Distinct messages (raw and masked) whose template is remembered
+MESSAGE_CACHE_SIZE = 100000
+
+_MASK = re.compile(r"""
+    \b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b            # IPv4 address, optional port
+  | \b0[xX][0-9a-fA-F]+\b                           # hex number
+  | \b(?=[0-9a-fA-F-]*\d)[0-9a-fA-F]{8,}(?:-[0-9a-fA-F]+)*\b   # hashes, UUIDs
+  | \b\d+(?:\.\d+)?\b                               # decimal number
+""", re.VERBOSE)
+
+_DIGIT = re.compile(r"\d")
+
+
+def mask(message: str) -> str:
+    """Replace the obviously variable parts of a message with <*>"""
+    return _MASK.sub(WILDCARD, message)
+
+
+class Template:
+    """One message template with its statistics"""
+
+    __slots__ = ("id", "tokens", "count", "first_seen", "last_seen", "examples", "leaf")
+
+    def __init__(self, template_id: int, tokens: List[str], leaf: List[int]):
+        self.id = template_id
+        self.tokens = tokens
+        self.count = 0
+        self.first_seen = 0             # timestamps in microseconds, 0 if unknown
+        self.last_seen = 0
+        self.examples = array("Q")      # numbers of the first entries seen
+        self.leaf = leaf                # candidate list of the parse tree holding this template
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> Tuple[float, int]:
+        """(share of equal tokens, wildcards) - wildcards break ties"""
+        if not tokens:
+            return 1.0, 0
+        same = wildcards = 0
+        for mine, theirs in zip(self.tokens, tokens):
+            if mine == WILDCARD:
+                wildcards += 1
+            elif mine == theirs:
+                same += 1
+        return same / len(tokens), wildcards
+
+    def seen(self, timestamp: int, entry: int):
+        self.count += 1
+        if timestamp:
+            if not self.first_seen or timestamp < self.first_seen:
+                self.first_seen = timestamp
+            if timestamp > self.last_seen:
+                self.last_seen = timestamp
+        if len(self.examples) < TEMPLATE_EXAMPLES:
+            self.examples.append(entry)
+
+
+class TemplateMiner:
+    """Online template miner; also the template id column of a LogStore"""
+
+    def __init__(self, depth: int = TEMPLATE_DEPTH, similarity: float = TEMPLATE_SIMILARITY,
+                 max_children: int = TEMPLATE_MAX_CHILDREN,
+                 max_templates: int = TEMPLATE_MAX_TEMPLATES):
+        # Levels below the token count level that route by leading tokens
+        self.levels = max(depth - 2, 1)
+        self.threshold = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+
+        self.root: Dict[int, dict] = {}
+        # Least recently matched first, so eviction pops from the front
+        self.templates: "OrderedDict[int, Template]" = OrderedDict()
+        self.next_id = 1
+        self.evicted = 0                # entries whose template was evicted
+        self._cache: Dict[str, int] = {}
+
+        # Template id of every row of the store this miner follows
+        self.generation = -1
+        self.base = 0
+        self.ids = array("I")
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def _candidates(self, tokens: List[str]) -> Optional[List[int]]:
+        """Templates in the leaf tokens are routed to, or None if there is no such leaf"""
+        node = self.root.get(len(tokens))
+        for token in tokens[:self.levels]:
+            if node is None:
+                return None
+            # Tokens without a branch of their own fall into the wildcard branch
+            node = node.get(token) if token in node else node.get(WILDCARD)
+        return node.get(None) if node is not None else None
+
+    def _new_leaf(self, tokens: List[str]) -> List[int]:
+        """Leaf for a new template with tokens, creating the path as needed"""
+        node = self.root.get(len(tokens))
+        if node is None:
+            node = self.root[len(tokens)] = {}
+        for token in tokens[:self.levels]:
+            if token in node:
+                key = token
+            elif _DIGIT.search(token) or len(node) >= self.max_children:
+                # Tokens with digits are likely variables; full nodes share one branch
+                key = WILDCARD
+            else:
+                key = token
+            child = node.get(key)
+            if child is None:
+                child = node[key] = {}
+            node = child
+        leaf = node.get(None)
+        if leaf is None:
+            leaf = node[None] = []
+        return leaf
+
+    def match(self, message: str) -> Template:
+        """Template for a message, updating or creating it"""
+        template_id = self._cache.get(message)
+        template = self.templates.get(template_id) if template_id is not None else None
+        if template is not None:
+            self.templates.move_to_end(template_id)
+            return template
+
+        masked = mask(message)
+        template_id = self._cache.get(masked)
+        template = self.templates.get(template_id) if template_id is not None else None
+        if template is not None:
+            # Same message apart from masked numbers and addresses
+            self.templates.move_to_end(template_id)
+            self._remember(message, template_id)
+            return template
+
+        tokens = masked.split()
+        best, best_score = None, (-1.0, -1)
+        for candidate_id in self._candidates(tokens) or ():
+            candidate = self.templates[candidate_id]
+            score = candidate.similarity(tokens)
+            if score > best_score:
+                best, best_score = candidate, score
+
+        if best is not None and best_score[0] >= self.threshold:
+            best.tokens = [mine if mine == theirs else WILDCARD
+                           for mine, theirs in zip(best.tokens, tokens)]
+            self.templates.move_to_end(best.id)
+            template = best
+        else:
+            leaf = self._new_leaf(tokens)
+            template = Template(self.next_id, tokens, leaf)
+            self.next_id += 1
+            leaf.append(template.id)
+            self.templates[template.id] = template
+            if len(self.templates) > self.max_templates:
+                _, oldest = self.templates.popitem(last=False)
+                oldest.leaf.remove(oldest.id)
+                self.evicted += oldest.count
+
+        self._remember(masked, template.id)
+        self._remember(message, template.id)
+        return template
+
+    def _remember(self, message: str, template_id: int):
+        if len(self._cache) >= MESSAGE_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[message] = template_id
+
+    def mine(self, store, start: int = 0, first_entry: Optional[int] = None) -> array:
+        """Template ids of store rows from start on
+
+        Entries are numbered from first_entry (the store's entry numbers by
+        default), which is what a template's examples refer to.
+        """
+        first_entry = store.base if first_entry is None else first_entry
+        ids = array("I")
+        timestamps = store.timestamps
+        for row in range(start, len(store)):
+            template = self.match(store.message(row))
+            template.seen(timestamps[row], first_entry + row)
+            ids.append(template.id)
+        return ids
+
+    def update(self, store):
+        """Mine entries added to store since the last update and forget trimmed ones"""
+        if store.base > self.base:
+            del self.ids[:store.base - self.base]
+            self.base = store.base
+        self.ids.extend(self.mine(store, len(self.ids)))
+
+    def get(self, template_id: int) -> Optional[Template]:
+        return self.templates.get(template_id)
+
+    def lookup(self, name: str) -> Optional[int]:
+        """Template id for 'T12' or '12', if that template exists"""
+        name = name.upper().lstrip("T")
+        if not name.isdigit() or int(name) not in self.templates:
+            return None
+        return int(name)
+
+    def label(self, template_id: int) -> str:
+        template = self.templates.get(template_id)
+        return template.text if template is not None else "(evicted)"
+
+    def rows(self, template_id: int) -> List[int]:
+        """Store rows assigned to a template, newest first"""
+        ids = self.ids
+        return [row for row in range(len(ids) - 1, -1, -1) if ids[row] == template_id]
+
+    def group(self, column=None, rows: Optional[List[int]] = None) -> Counter:
+        """Loaded entries per template id, or per (template id, value of column)
+
+        column is a store column (or any sequence aligned with the rows);
+        rows restricts the count to some store rows.
+        """
+        ids = self.ids
+        if rows is not None:
+            if column is None:
+                return Counter(ids[row] for row in rows)
+            return Counter((ids[row], column[row]) for row in rows)
+        if column is None:
+            return Counter(ids)
+        return Counter(zip(ids, column))
+
+    def nbytes(self) -> int:
+        size = 4 * len(self.ids)
+        for template in self.templates.values():
+            size += sum(len(token) for token in template.tokens) + 64
+        return size
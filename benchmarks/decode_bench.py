@@ -0,0 +1,82 @@
+"""
+Benchmark of the JSON decoding backends on a synthetic journal dump.
+
+Usage: python benchmarks/decode_bench.py [--entries N]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import entries
+
+PROCESSES = ["kernel", "systemd", "NetworkManager", "sshd", "gnome-shell", "dbus-daemon",
+             "firewalld", "chronyd", "pipewire", "gdm", "audit", "rpm-ostree"]
+
+
+def synthetic_dump(count: int, seed: int = 0):
+    """journalctl --output=json lines with the usual set of trusted fields"""
+    rng = random.Random(seed)
+    start = 1700000000000000
+    lines = []
+    for i in range(count):
+        process = rng.choice(PROCESSES)
+        lines.append(json.dumps({
+            "__CURSOR": f"s=0123456789abcdef;i={i:x};b=fedcba9876543210;m={i:x};t={start + i:x};x={i:x}",
+            "__REALTIME_TIMESTAMP": str(start + i * 1000),
+            "__MONOTONIC_TIMESTAMP": str(i * 1000),
+            "_BOOT_ID": "fedcba9876543210fedcba9876543210",
+            "_MACHINE_ID": "0123456789abcdef0123456789abcdef",
+            "_HOSTNAME": "fedora",
+            "_TRANSPORT": "journal",
+            "_PID": str(rng.randint(1, 65535)),
+            "_UID": "0",
+            "_GID": "0",
+            "_COMM": process,
+            "_EXE": f"/usr/bin/{process}",
+            "_CMDLINE": f"/usr/bin/{process} --daemon",
+            "_SYSTEMD_UNIT": f"{process}.service",
+            "SYSLOG_FACILITY": "3",
+            "SYSLOG_IDENTIFIER": process,
+            "PRIORITY": str(rng.choices(range(8), weights=[1, 1, 2, 8, 15, 20, 45, 8])[0]),
+            "MESSAGE": f"{process}: event {i} handled in {rng.random():.4f}s",
+        }))
+    return lines
+
+
+def timed(decode, lines) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        decode(line)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000000,
+                        help="number of synthetic entries (default: 1000000)")
+    args = parser.parse_args()
+
+    print(f"Generating {args.entries} entries...")
+    lines = synthetic_dump(args.entries)
+    size = sum(len(line) + 1 for line in lines)
+    print(f"Dump size: {size / 1024 / 1024:.1f} MiB\n")
+
+    baseline = timed(json.loads, lines)
+    results = [("json.loads (dict)", baseline)]
+    for name in entries.DECODERS:
+        entries.set_backend(name)
+        results.append((f"{name} -> LogRecord", timed(entries.decode_record, lines)))
+
+    print(f"{'Decoder':<24}{'Seconds':>10}{'Entries/s':>14}{'Speedup':>10}")
+    for label, seconds in results:
+        print(f"{label:<24}{seconds:>10.2f}{args.entries / seconds:>14,.0f}{baseline / seconds:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 import sys
+import os
+import re
 import shlex
 from analysis.core import LogAnalyzer
+from analysis.entries import PRIORITY_NAMES
+from sources.journal_file import DEFAULT_JOURNAL_DIR
 
 def main():
     analyzer = LogAnalyzer()
@@ -17,6 +21,8 @@ def main():
             cmd_input = input("\nlog-analyzer> ").strip()
             
             if cmd_input.lower() in ['quit', 'q', 'exit']:
+                if analyzer.follower and analyzer.follower.running:
+                    analyzer.follower.stop()
                 print("Goodbye!")
                 break
                 
@@ -34,6 +40,16 @@ def main():
                 limit = None
                 since = None
                 until = None
+                stream = False
+                journal_dir = None
+                incremental = False
+                shards = 1
+                level = None
+                domain = None
+                archive = None
+                fleet = None
+                cache = False
+                saved = False
                 
                 # Skip the first part (the command 'load')
                 for part in parts[1:]:
@@ -46,11 +62,57 @@ def main():
                     elif part.startswith('until='):
                         until = part.split('=', 1)[1]
                         until = until.strip('"\'')
+                    elif part == 'stream':
+                        stream = True
+                    elif part.startswith('shards='):
+                        shards = int(part.split('=', 1)[1])
+                    elif part.startswith('level='):
+                        level = part.split('=', 1)[1]
+                    elif part.startswith('domain='):
+                        domain = part.split('=', 1)[1]
+                    elif part.startswith('fleet='):
+                        fleet = part.split('=', 1)[1].strip('"\'').split(',')
+                    elif part.startswith('file='):
+                        archive = part.split('=', 1)[1].strip('"\'')
+                    elif part == 'new':
+                        incremental = True
+                    elif part == 'cache':
+                        cache = True
+                    elif part == 'saved':
+                        saved = True
+                    elif part == 'journal':
+                        journal_dir = DEFAULT_JOURNAL_DIR
+                    elif part.startswith('journal='):
+                        journal_dir = part.split('=', 1)[1].strip('"\'')
                 
-                analyzer.load_logs(limit, since, until)
+                analyzer.load_logs(limit, since, until, stream=stream, journal_dir=journal_dir,
+                                   incremental=incremental, shards=shards,
+                                   level=level, domain=domain, archive=archive,
+                                   fleet=fleet, cache=cache, saved=saved)
 
-            elif cmd_input.lower() == 'analyze':
-                analyzer.analyze_logs()
+            elif cmd_input.lower().startswith('analyze'):
+                workers = None
+                full = False
+                sketch = False
+                for part in cmd_input.split()[1:]:
+                    if part.lower() == 'parallel':
+                        workers = os.cpu_count()
+                    elif part.lower() == 'full':
+                        full = True
+                    elif part.lower() == 'sketch':
+                        sketch = True
+                    elif part.startswith('workers='):
+                        workers = int(part.split('=', 1)[1])
+                analyzer.analyze_logs(workers, full, sketch)
+
+            elif cmd_input.lower().startswith('window'):
+                parts = cmd_input.split()
+                if len(parts) < 2:
+                    print(f"Window: {analyzer.window or 'unlimited'}")
+                elif parts[1].lower() == 'off':
+                    analyzer.set_window(None)
+                else:
+                    analyzer.set_window(int(parts[1]))
                 
             elif cmd_input.lower() == 'summary':
                 analyzer.show_summary()
@@ -62,14 +124,104 @@ def main():
                 analyzer.show_detailed(month, domain)
                 
             elif cmd_input.lower().startswith('search'):
+                # The query keeps its quotes; name=value options are taken out
+                query = cmd_input[len('search'):]
+                options = dict(re.findall(r'\b(level|process|limit|template)=(\S+)', query))
+                words = re.sub(r'\b(?:level|process|limit|template)=\S+', '', query).split()
+                saved = bool(words) and words[-1].lower() == 'saved'
+                if saved:
+                    words = words[:-1]
+                level = options.get('level')
+                # 'search failed ERROR' names the level positionally
+                if words and words[-1] in PRIORITY_NAMES and (len(words) > 1 or 'template' in options):
+                    level = words.pop()
+                if not words and 'template' not in options:
+                    print("Usage: search <query> [level] [process=NAME] [template=T<id>] [limit=N] [saved]")
+                else:
+                    analyzer.search_logs(' '.join(words), level, saved,
+                                         options.get('process'), int(options.get('limit', 10)),
+                                         options.get('template'))
+
+            elif cmd_input.lower().startswith('grep'):
+                try:
+                    parts = shlex.split(cmd_input)[1:]
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    continue
+                patterns = []
+                options = {}
+                ignore_case = False
+                for part in parts:
+                    name = part.split('=', 1)[0]
+                    if part == '-i':
+                        ignore_case = True
+                    elif '=' in part and name in ('level', 'process', 'limit', 'workers', 'template'):
+                        options[name] = part.split('=', 1)[1]
+                    else:
+                        patterns.append(part)
+                if not patterns:
+                    print("Usage: grep <regex> [regex...] [-i] [level=X] [process=NAME] [template=T<id>] "
+                          "[limit=N] [workers=N]")
+                else:
+                    workers = int(options['workers']) if 'workers' in options else None
+                    analyzer.grep_logs(patterns, options.get('level'), options.get('process'),
+                                       int(options.get('limit', 20)), ignore_case, workers,
+                                       options.get('template'))
+
+            elif cmd_input.lower().startswith('templates'):
+                parts = cmd_input.split()[1:]
+                options = dict(part.split('=', 1) for part in parts if '=' in part)
+                names = [part for part in parts if '=' not in part]
+                if names and not names[0].isdigit():
+                    analyzer.show_template(names[0])
+                else:
+                    limit = int(names[0]) if names else 20
+                    analyzer.show_templates(limit, options.get('level'), options.get('process'),
+                                            options.get('by'))
+
+            elif cmd_input.lower().startswith('save'):
                 parts = cmd_input.split()
-                if len(parts) < 2:
-                    print("Usage: search <keyword> [level]")
+                if len(parts) > 1 and parts[1] == 'info':
+                    print(analyzer.saved_logs.info())
+                elif len(parts) > 1 and parts[1] == 'compact':
+                    merged = analyzer.saved_logs.compact()
+                    print(f"Merged away {merged} segments.")
+                    print(analyzer.saved_logs.info())
                 else:
-                    keyword = parts[1]
-                    level = parts[2] if len(parts) > 2 else None
-                    analyzer.search_logs(keyword, level)
+                    analyzer.save_logs()
                     
+            elif cmd_input.lower().startswith('anomalies'):
+                parts = cmd_input.split()[1:]
+                options = dict(part.split('=', 1) for part in parts if '=' in part)
+                seasonal = True if 'seasonal' in parts else False if 'flat' in parts else None
+                limit = next((int(part) for part in parts if part.isdigit()), 20)
+                analyzer.show_anomalies(limit, options.get('level'), options.get('domain'),
+                                        options.get('bucket'), seasonal)
+
+            elif cmd_input.lower().startswith('alerts'):
+                parts = cmd_input.split()
+                if len(parts) > 1 and parts[1] == 'load':
+                    analyzer.load_alert_rules(parts[2] if len(parts) > 2 else None)
+                else:
+                    analyzer.show_alerts(check=len(parts) > 1 and parts[1] == 'check')
+
+            elif cmd_input.lower().startswith('sample'):
+                parts = cmd_input.split()[1:]
+                options = dict(part.split('=', 1) for part in parts if '=' in part)
+                limit = next((int(part) for part in parts if part.isdigit()), 10)
+                analyzer.show_sample(limit, options.get('level'), options.get('domain'))
+
+            elif cmd_input.lower().startswith('sketch'):
+                parts = cmd_input.split()
+                if len(parts) > 1 and parts[1] in ('save', 'merge'):
+                    if len(parts) < 3:
+                        print(f"Usage: sketch {parts[1]} <path>")
+                    else:
+                        analyzer.show_sketches(parts[1], parts[2])
+                else:
+                    limit = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 10
+                    analyzer.show_sketches(limit=limit)
+
             elif cmd_input.lower() == 'stats':
                 analyzer.show_stats()
                 
@@ -78,9 +230,12 @@ def main():
 
             elif cmd_input.lower().startswith('table'):
                 parts = cmd_input.split()
+                saved = parts[-1].lower() == 'saved'
+                if saved:
+                    parts = parts[:-1]
                 table_type = parts[1] if len(parts) > 1 else "summary"
                 limit = int(parts[2]) if len(parts) > 2 else 20
-                analyzer.show_table(table_type, limit)
+                analyzer.show_table(table_type, limit, saved)
 
             elif cmd_input.lower() == 'browse':
                 analyzer.browse_table()
@@ -95,6 +250,25 @@ def main():
                 else:
                     print("Usage: export <format>")
 
+            elif cmd_input.lower().startswith('follow'):
+                parts = cmd_input.split()
+                if len(parts) > 1 and parts[1] == 'stop':
+                    analyzer.stop_follow()
+                elif len(parts) > 1 and parts[1] == 'status':
+                    if analyzer.follower:
+                        print(analyzer.follower.status())
+                    else:
+                        print("Not following.")
+                else:
+                    policy = None
+                    queue_size = None
+                    for part in parts[1:]:
+                        if part.startswith('queue='):
+                            queue_size = int(part.split('=', 1)[1])
+                        else:
+                            policy = part
+                    analyzer.follow(policy, queue_size)
+
             elif cmd_input.lower() == 'tui':
                 print("Launching TUI...")
                 # Launch the TUI in a subprocess
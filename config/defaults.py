@@ -14,3 +14,100 @@ DOMAIN_MAP = {
     "SCHEDULERS": {"crond", "CROND", "atd", "anacron"},
     "DESKTOP": {"xfce4-terminal", "dolphin", "vlc", "chrome", "brave-browser-stable"},
 }
+
+# Extra classification rules as (kind, pattern, domain). Kinds are "exact",
+# "prefix" (longest wins), "glob" and "regex" (whole name, first wins).
+# Exact names are checked first, then prefixes, then globs and regexes.
+CLASSIFIER_RULES = [
+    ("prefix", "systemd", "BOOT"),
+]
+
+# Process names whose domain is memoized
+CLASSIFIER_CACHE_SIZE = 65536
+
+# Live follow mode: size of the queue between the journal reader and the
+# aggregator, and what to do when it is full ("block", "drop-newest",
+# "drop-oldest"). Blocking applies backpressure to journalctl itself.
+FOLLOW_QUEUE_SIZE = 10000
+FOLLOW_POLICY = "block"
+FOLLOW_PUBLISH_INTERVAL = 0.5
+
+# Parallel analysis: below this many loaded entries the process pool costs
+# more than it saves, so 'analyze parallel' stays serial.
+PARALLEL_MIN_ENTRIES = 200000
+
+# Streamed entries are decoded into a small columnar batch of this many
+# entries before being counted into the rollup cube.
+STREAM_BATCH_SIZE = 10000
+
+# Keep at most this many loaded entries; 'load new' drops the oldest ones
+# (and retracts them from the analysis) past it. None keeps everything.
+LOAD_WINDOW = None
+
+# Aggregate cache: counts of closed hours are kept in this SQLite file and
+# reused by 'load ... cache' instead of fetching those hours again.
+AGGREGATE_CACHE_PATH = "~/.cache/log-analyzer/aggregates.sqlite"
+
+# Saved logs: parsed entries are kept in immutable segment files of at most
+# SEGMENT_MAX_ENTRIES entries. Once SEGMENT_COMPACT_MIN small segments have
+# piled up, a background compaction merges them. Message tokens are indexed
+# in a bloom filter of BLOOM_BITS_PER_TOKEN bits per distinct token.
+SEGMENT_DIR = "~/.local/share/log-analyzer/segments"
+SEGMENT_MAX_ENTRIES = 100000
+SEGMENT_COMPACT_MIN = 4
+BLOOM_BITS_PER_TOKEN = 10
+BLOOM_HASHES = 7
+
+# Message templates: messages are routed through a parse tree of
+# TEMPLATE_DEPTH levels (token count, then leading tokens) with at most
+# TEMPLATE_MAX_CHILDREN branches per node, and join the most similar template
+# of their leaf if at least TEMPLATE_SIMILARITY of the tokens agree. At most
+# TEMPLATE_MAX_TEMPLATES are kept (the least recently seen are evicted), each
+# remembering its first TEMPLATE_EXAMPLES entries.
+TEMPLATE_DEPTH = 4
+TEMPLATE_SIMILARITY = 0.4
+TEMPLATE_MAX_CHILDREN = 100
+TEMPLATE_MAX_TEMPLATES = 10000
+TEMPLATE_EXAMPLES = 3
+
+# Anomaly detection: entries are counted per (domain, priority, process)
+# and ANOMALY_BUCKET ("minute" or "hour"), against a running baseline that
+# weights new buckets by ANOMALY_ALPHA (kept per hour of the day with
+# ANOMALY_SEASONAL). A bucket is flagged once its count exceeds the baseline
+# mean by ANOMALY_THRESHOLD standard deviations and reaches ANOMALY_MIN_COUNT,
+# after ANOMALY_WARMUP buckets of history. The newest ANOMALY_HISTORY
+# anomalies are kept.
+ANOMALY_BUCKET = "minute"
+ANOMALY_SEASONAL = False
+ANOMALY_ALPHA = 0.05
+ANOMALY_THRESHOLD = 4.0
+ANOMALY_MIN_COUNT = 5
+ANOMALY_WARMUP = 30
+ANOMALY_HISTORY = 500
+
+# Alert rules (see analysis/alerts.py for the format) are read from this
+# JSON file at startup when it exists. Rules without a window count over
+# ALERT_DEFAULT_WINDOW.
+ALERT_RULES_PATH = "~/.config/log-analyzer/alerts.json"
+ALERT_DEFAULT_WINDOW = "5m"
+
+# Sketches: with SKETCHES_ENABLED (or 'analyze sketch') the analysis also
+# keeps HyperLogLog distinct counts (2^HLL_PRECISION registers) and the
+# SKETCH_TOP_K heaviest processes and message templates per domain, from a
+# Count-Min sketch of SKETCH_DEPTH rows of SKETCH_WIDTH counters each.
+# SKETCH_TEMPLATES mines the templates of every analyzed entry for them.
+SKETCHES_ENABLED = False
+SKETCH_TEMPLATES = True
+HLL_PRECISION = 14
+SKETCH_WIDTH = 1024
+SKETCH_DEPTH = 4
+SKETCH_TOP_K = 20
+
+# Sampling: ingested entries are reservoir-sampled per (domain, priority),
+# SAMPLE_SIZE entries per stratum, SAMPLE_RARE_SIZE for priorities up to
+# SAMPLE_RARE_PRIORITY (ERROR) so rare levels are normally kept in full.
+# Estimates from the sample carry SAMPLE_CONFIDENCE bounds.
+SAMPLE_SIZE = 1000
+SAMPLE_RARE_SIZE = 10000
+SAMPLE_RARE_PRIORITY = 3
+SAMPLE_CONFIDENCE = 0.95
@@ -0,0 +1,154 @@
+"""
+On-disk cache of finalized aggregates.
+
+Once an hour has ended, its counts can no longer change, so the cube cells
+of every fully loaded closed hour are written to a SQLite file, keyed by
+scope (the source and the host reading it) and local hour bucket. A later
+load of an overlapping window reads those hours back from the cache and
+only fetches the hours around them.
+
+The file records the classifier's fingerprint; when DOMAIN_MAP or the
+classifier rules change, every cached domain may be wrong, so the cache
+is emptied.
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Set, Tuple
+
+from analysis.cube import RollupCube
+from config.defaults import AGGREGATE_CACHE_PATH
+
+# Bumped when the table layout changes
+SCHEMA_VERSION = "1"
+
+_EPOCH = datetime(1970, 1, 1)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hours (
+    scope TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    PRIMARY KEY (scope, hour)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cells (
+    scope TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    domain TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    process TEXT NOT NULL,
+    host TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cells_by_hour ON cells (scope, hour);
+"""
+
+
+def hour_of(seconds: float) -> int:
+    """Local hour bucket containing a POSIX time"""
+    return int(seconds + time.localtime(seconds).tm_gmtoff) // 3600
+
+
+def hour_start(hour: int) -> float:
+    """POSIX time at which a local hour bucket begins"""
+    return (_EPOCH + timedelta(hours=hour)).timestamp()
+
+
+def closed_hours(start: float, end: float, now: float) -> range:
+    """Hour buckets lying entirely inside [start, end] that have already ended"""
+    first = hour_of(start)
+    if hour_start(first) < start:
+        first += 1
+    last = hour_of(min(end, now))
+    return range(first, last)
+
+
+def fetch_windows(start: float, end: float, cached: Iterable[int]) -> List[Tuple[float, float]]:
+    """Inclusive [since, until] windows covering [start, end] minus the cached hours"""
+    windows = []
+    cursor = start
+    for hour in sorted(cached):
+        begin = hour_start(hour)
+        if begin > cursor:
+            # --until is inclusive, so stop just before the cached hour begins
+            windows.append((cursor, begin - 0.000001))
+        cursor = max(cursor, hour_start(hour + 1))
+    if cursor <= end:
+        windows.append((cursor, end))
+    return windows
+
+
+class AggregateCache:
+    """SQLite store of cube cells for closed hours"""
+
+    def __init__(self, fingerprint: str, path: str = AGGREGATE_CACHE_PATH):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(_SCHEMA)
+        self._check(f"{SCHEMA_VERSION}:{fingerprint}")
+
+    def _check(self, fingerprint: str):
+        """Empty the cache if it was built with another classifier"""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row and row[0] == fingerprint:
+            return
+        if row:
+            print("Classifier rules changed; clearing the aggregate cache.")
+        with self.db:
+            self.db.execute("DELETE FROM cells")
+            self.db.execute("DELETE FROM hours")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+
+    def cached_hours(self, scope: str, hours: range) -> Set[int]:
+        """Which of the given hours are cached for scope"""
+        rows = self.db.execute(
+            "SELECT hour FROM hours WHERE scope = ? AND hour >= ? AND hour < ?",
+            (scope, hours.start, hours.stop))
+        return {hour for hour, in rows}
+
+    def load(self, scope: str, hours: Iterable[int]) -> RollupCube:
+        """Cube of the cached cells of some hours"""
+        cube = RollupCube()
+        hours = sorted(hours)
+        if not hours:
+            return cube
+        # Read the covering range in one query and keep the requested hours
+        wanted = set(hours)
+        rows = self.db.execute(
+            "SELECT hour, domain, priority, process, host, count FROM cells "
+            "WHERE scope = ? AND hour >= ? AND hour <= ?",
+            (scope, hours[0], hours[-1]))
+        cube.add_rows(row for row in rows if row[0] in wanted)
+        return cube
+
+    def save(self, scope: str, cube: RollupCube, hours: Iterable[int]):
+        """Record the cells of fully loaded closed hours; hours without entries count too"""
+        hours = set(hours)
+        if not hours:
+            return
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM cells WHERE scope = ? AND hour = ?",
+                ((scope, hour) for hour in hours))
+            self.db.executemany(
+                "INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((scope,) + row for row in cube.rows(hours)))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO hours VALUES (?, ?)",
+                ((scope, hour) for hour in hours))
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM cells")
+            self.db.execute("DELETE FROM hours")
+
+    def close(self):
+        self.db.close()
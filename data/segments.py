@@ -0,0 +1,385 @@
+"""
+Saved logs: an append-only archive of immutable segment files.
+
+Each segment holds up to SEGMENT_MAX_ENTRIES parsed entries in timestamp
+order, stored column by column like LogStore (timestamps, priorities,
+process/host/unit ids, message offsets and a message arena). A JSON header
+in front of the columns acts as a zone map: the min/max timestamp, a bitmap
+of the priorities present, the process names present and a bloom filter
+over the message tokens. Queries read only the headers to rule out whole
+segments, and memory-map the rest, so the columns of a skipped segment are
+never touched.
+
+Segments are never modified. Compaction writes the merged segment first,
+named after the span of sequence numbers it replaces, and only then deletes
+the originals. A reader that lists the directory in between simply prefers
+the covering segment.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from analysis.entries import LogRecord, message_tokens
+from analysis.store import LogStore
+from config.defaults import (SEGMENT_DIR, SEGMENT_MAX_ENTRIES, SEGMENT_COMPACT_MIN,
+                             BLOOM_BITS_PER_TOKEN, BLOOM_HASHES)
+
+MAGIC = b"LOGSEG01"
+SUFFIX = ".seg"
+
+# Columns in file order with their array type codes; each starts 8-aligned
+_SECTIONS = (
+    ("timestamps", "q"), ("offsets", "Q"), ("process_ids", "I"), ("host_ids", "I"),
+    ("unit_ids", "I"), ("priorities", "B"), ("bloom", "B"), ("arena", "B"),
+)
+_ALIGN = 8
+
+# Messages are stored as in LogStore
+_ENCODING = "utf-8"
+_ERRORS = "surrogatepass"
+
+
+class BloomFilter:
+    """Bit array answering 'might this token occur?' without false negatives"""
+
+    def __init__(self, bits: int, hashes: int = BLOOM_HASHES, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = data if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def of(cls, tokens: Set[str]) -> "BloomFilter":
+        bloom = cls(max(64, len(tokens) * BLOOM_BITS_PER_TOKEN))
+        for token in tokens:
+            bloom.add(token)
+        return bloom
+
+    def _positions(self, token: str) -> Iterator[int]:
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(token.encode(_ENCODING, _ERRORS), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, token: str):
+        for position in self._positions(token):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, token: str) -> bool:
+        data = self.data
+        return all(data[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(token))
+
+
+def priority_mask(priorities: Iterable[int]) -> int:
+    """Bitmap with one bit per syslog priority"""
+    mask = 0
+    for priority in priorities:
+        mask |= 1 << priority
+    return mask
+
+
+def _span(name: str) -> Tuple[int, int]:
+    """First and last append sequence numbers covered by a segment file"""
+    first, last = name[:-len(SUFFIX)].split("-")
+    return int(first), int(last)
+
+
+def write_segment(path: str, store: LogStore):
+    """Write every entry of a store as one segment file"""
+    tokens: Set[str] = set()
+    for index in range(len(store)):
+        tokens.update(message_tokens(store.message(index)))
+    bloom = BloomFilter.of(tokens)
+
+    stamped = [timestamp for timestamp in store.timestamps if timestamp]
+    columns = {
+        "timestamps": store.timestamps, "offsets": store.offsets,
+        "process_ids": store.process_ids, "host_ids": store.host_ids,
+        "unit_ids": store.unit_ids, "priorities": store.priorities,
+        "bloom": bloom.data, "arena": store.arena,
+    }
+
+    body = []
+    sections = {}
+    position = 0
+    for name, _ in _SECTIONS:
+        data = bytes(columns[name])
+        sections[name] = [position, len(data)]
+        padding = -len(data) % _ALIGN
+        body.append(data + b"\0" * padding)
+        position += len(data) + padding
+
+    header = {
+        "count": len(store),
+        "min_ts": min(stamped) if stamped else None,
+        "max_ts": max(stamped) if stamped else None,
+        "priorities": priority_mask(set(store.priorities)),
+        "processes": store.processes.values,
+        "hosts": store.hosts.values,
+        "units": store.units.values,
+        "bloom": {"bits": bloom.bits, "hashes": bloom.hashes},
+        "byteorder": sys.byteorder,
+        "sections": sections,
+    }
+    raw = json.dumps(header).encode()
+    # Pad the header with JSON whitespace so the columns stay aligned
+    raw += b" " * (-(len(MAGIC) + 8 + len(raw)) % _ALIGN)
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(raw).to_bytes(8, "little"))
+        f.write(raw)
+        for chunk in body:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+class Segment:
+    """One memory-mapped segment file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.first, self.last = _span(os.path.basename(path))
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._map)
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a log segment")
+        size = int.from_bytes(view[len(MAGIC):len(MAGIC) + 8], "little")
+        start = len(MAGIC) + 8
+        header = json.loads(bytes(view[start:start + size]))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine")
+
+        self.header = header
+        self.count: int = header["count"]
+        self.min_ts: Optional[int] = header["min_ts"]
+        self.max_ts: Optional[int] = header["max_ts"]
+        self.priority_bits: int = header["priorities"]
+        self.processes: List[str] = header["processes"]
+        self.hosts: List[str] = header["hosts"]
+        self.units: List[str] = header["units"]
+        self.process_names = set(self.processes)
+
+        # Columns are views into the mapping; nothing is copied
+        body = start + size
+        self._views = [view]
+        for name, code in _SECTIONS:
+            offset, length = header["sections"][name]
+            column = view[body + offset:body + offset + length].cast(code)
+            self._views.append(column)
+            setattr(self, name, column)
+        self.bloom_filter = BloomFilter(header["bloom"]["bits"], header["bloom"]["hashes"], self.bloom)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def nbytes(self) -> int:
+        return len(self._map)
+
+    def might_match(self, since: Optional[int] = None, until: Optional[int] = None,
+                    priorities: Optional[int] = None, processes: Optional[Set[str]] = None,
+                    tokens: Iterable[str] = ()) -> bool:
+        """Whether the header allows a matching entry; False means skip the segment"""
+        if since is not None and (self.max_ts is None or self.max_ts < since):
+            return False
+        if until is not None and (self.min_ts is None or self.min_ts > until):
+            return False
+        if priorities is not None and not self.priority_bits & priorities:
+            return False
+        if processes is not None and not self.process_names & processes:
+            return False
+        return all(token in self.bloom_filter for token in tokens)
+
+    def rows(self, since: Optional[int] = None, until: Optional[int] = None) -> range:
+        """Rows within [since, until]; timestamps are sorted within a segment"""
+        start = bisect_left(self.timestamps, since) if since is not None else 0
+        stop = bisect_right(self.timestamps, until) if until is not None else self.count
+        return range(start, stop)
+
+    def message(self, index: int) -> str:
+        return bytes(self.arena[self.offsets[index]:self.offsets[index + 1]]).decode(_ENCODING, _ERRORS)
+
+    def record(self, index: int) -> LogRecord:
+        return LogRecord(
+            self.timestamps[index] or None,
+            self.priorities[index],
+            self.processes[self.process_ids[index]] or "unknown",
+            self.message(index),
+            self.hosts[self.host_ids[index]] or None,
+            None,
+            self.units[self.unit_ids[index]] or None,
+        )
+
+    def entry(self, index: int) -> Dict[str, str]:
+        """An entry as journal fields, the way other sources yield them"""
+        entry = {
+            "__REALTIME_TIMESTAMP": str(self.timestamps[index]),
+            "PRIORITY": str(self.priorities[index]),
+            "SYSLOG_IDENTIFIER": self.processes[self.process_ids[index]],
+            "MESSAGE": self.message(index),
+        }
+        host = self.hosts[self.host_ids[index]]
+        if host:
+            entry["_HOSTNAME"] = host
+        unit = self.units[self.unit_ids[index]]
+        if unit:
+            entry["_SYSTEMD_UNIT"] = unit
+        return entry
+
+    def clock(self, index: int) -> str:
+        """Local date and time of an entry"""
+        return datetime.fromtimestamp(self.timestamps[index] / 1000000).strftime("%Y-%m-%d %H:%M:%S")
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._map.close()
+
+
+class SegmentArchive:
+    """A directory of segments, kept in append order"""
+
+    def __init__(self, path: str = SEGMENT_DIR):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._compactor: Optional[threading.Thread] = None
+        self.refresh()
+
+    def refresh(self):
+        """Pick up segments written or compacted since the last look"""
+        names = [name for name in os.listdir(self.path) if name.endswith(SUFFIX)]
+        # A compacted segment replaces every segment inside its span
+        chosen = []
+        for name in sorted(names, key=lambda name: (_span(name)[0], -_span(name)[1])):
+            if chosen and _span(name)[1] <= _span(chosen[-1])[1]:
+                continue
+            chosen.append(name)
+
+        with self._lock:
+            opened = {os.path.basename(segment.path): segment for segment in self._segments}
+            # Dropped segments are left to the garbage collector, since a
+            # query running in another thread may still be reading them
+            self._segments = [opened.get(name) or Segment(os.path.join(self.path, name))
+                              for name in chosen]
+
+    @property
+    def segments(self) -> List[Segment]:
+        with self._lock:
+            return list(self._segments)
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def newest_timestamp(self) -> Optional[int]:
+        stamps = [segment.max_ts for segment in self.segments if segment.max_ts is not None]
+        return max(stamps) if stamps else None
+
+    def _next_sequence(self) -> int:
+        segments = self.segments
+        return segments[-1].last + 1 if segments else 0
+
+    def append(self, store: LogStore) -> int:
+        """Save the stored entries newer than everything already saved
+
+        Entries without a timestamp can't be placed in time and are skipped,
+        so saving the same window twice adds nothing.
+        """
+        newest = self.newest_timestamp() or 0
+        rows = [index for index in range(len(store)) if store.timestamps[index] > newest]
+        # Segments must be sorted by time; loads usually are already
+        rows.sort(key=store.timestamps.__getitem__)
+
+        sequence = self._next_sequence()
+        for start in range(0, len(rows), SEGMENT_MAX_ENTRIES):
+            chunk = LogStore()
+            for index in rows[start:start + SEGMENT_MAX_ENTRIES]:
+                chunk.append(store.record(index))
+            write_segment(os.path.join(self.path, f"{sequence:010d}-{sequence:010d}{SUFFIX}"), chunk)
+            sequence += 1
+
+        self.refresh()
+        self.compact_in_background()
+        return len(rows)
+
+    def select(self, since: Optional[int] = None, until: Optional[int] = None,
+               priorities: Optional[int] = None, processes: Optional[Set[str]] = None,
+               tokens: Iterable[str] = (), newest_first: bool = False) -> List[Segment]:
+        """Segments whose headers allow a match, oldest first unless newest_first"""
+        tokens = list(tokens)
+        selected = [segment for segment in self.segments
+                    if segment.might_match(since, until, priorities, processes, tokens)]
+        if newest_first:
+            selected.reverse()
+        return selected
+
+    def entries(self, since: Optional[int] = None, until: Optional[int] = None) -> Iterator[Dict[str, str]]:
+        """Saved entries within [since, until] (microseconds), oldest first"""
+        for segment in self.select(since, until):
+            for index in segment.rows(since, until):
+                yield segment.entry(index)
+
+    def compact(self) -> int:
+        """Merge runs of adjacent small segments; returns how many were merged away"""
+        merged = 0
+        run: List[Segment] = []
+        for segment in self.segments + [None]:
+            if segment is not None and sum(map(len, run)) + len(segment) <= SEGMENT_MAX_ENTRIES:
+                run.append(segment)
+                continue
+            if len(run) > 1:
+                self._merge(run)
+                merged += len(run) - 1
+            run = [segment] if segment is not None else []
+        if merged:
+            self.refresh()
+        return merged
+
+    def _merge(self, run: List[Segment]):
+        combined = LogStore()
+        for segment in run:
+            for index in range(len(segment)):
+                combined.append(segment.record(index))
+        name = f"{run[0].first:010d}-{run[-1].last:010d}{SUFFIX}"
+        # The covering segment exists before the originals go away
+        write_segment(os.path.join(self.path, name), combined)
+        for segment in run:
+            os.remove(segment.path)
+
+    def compact_in_background(self):
+        """Start a compaction thread once enough small segments have piled up"""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        small = sum(1 for segment in self.segments if len(segment) < SEGMENT_MAX_ENTRIES // 2)
+        if small < SEGMENT_COMPACT_MIN:
+            return
+        self._compactor = threading.Thread(target=self.compact, name="segment-compactor", daemon=True)
+        self._compactor.start()
+
+    def info(self) -> str:
+        segments = self.segments
+        if not segments:
+            return f"No saved logs in {self.path}"
+        size = sum(segment.nbytes() for segment in segments)
+        stamps = [segment.min_ts for segment in segments if segment.min_ts is not None]
+        span = ""
+        if stamps:
+            first = datetime.fromtimestamp(min(stamps) / 1000000)
+            last = datetime.fromtimestamp(self.newest_timestamp() / 1000000)
+            span = f", {first:%Y-%m-%d %H:%M} to {last:%Y-%m-%d %H:%M}"
+        return (f"Saved logs: {len(self)} entries in {len(segments)} segments "
+                f"({size / 1024 / 1024:.1f} MiB{span}) in {self.path}")
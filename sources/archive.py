@@ -0,0 +1,169 @@
+"""
+Readers for journals copied off other machines.
+
+Supports the `journalctl --output=export` format and JSON-lines dumps, either
+plain or compressed with gzip, xz or zstd. Everything is decoded
+incrementally, so archives of any size are read in a single streaming pass.
+"""
+
+import gzip
+import io
+import lzma
+import struct
+from collections import deque
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from sources.base import LogSource
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Fields kept from export entries; the rest is skipped
+EXPORT_FIELDS = ("__CURSOR", "__REALTIME_TIMESTAMP", "_HOSTNAME",
+                 "SYSLOG_IDENTIFIER", "_COMM", "PRIORITY", "MESSAGE", "_SYSTEMD_UNIT")
+
+READ_BUFFER_SIZE = 64 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".zst")
+JSON_SUFFIXES = (".json", ".jsonl", ".ndjson")
+
+
+def open_compressed(path: str) -> BinaryIO:
+    """Open a file for reading, decompressing gzip/xz/zstd on the fly"""
+    raw = open(path, "rb")
+    magic = raw.read(6)
+    raw.seek(0)
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if magic.startswith(XZ_MAGIC):
+        return lzma.LZMAFile(raw, mode="rb")
+    if magic.startswith(ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raw.close()
+            raise OSError(f"{path} is zstd-compressed. Install with: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.BufferedReader(reader, buffer_size=READ_BUFFER_SIZE)
+
+    return io.BufferedReader(raw, buffer_size=READ_BUFFER_SIZE)
+
+
+def _read_export(stream: BinaryIO, fields: Tuple[str, ...]) -> Iterator[Dict[str, str]]:
+    """Parse journal export format into entry dicts"""
+    wanted = {f.encode() for f in fields}
+    entry: Dict[str, str] = {}
+
+    while True:
+        line = stream.readline()
+        if not line:
+            break
+
+        if line == b"\n":
+            # A blank line ends the entry
+            if entry:
+                yield entry
+                entry = {}
+            continue
+
+        line = line[:-1] if line.endswith(b"\n") else line
+        name, sep, value = line.partition(b"=")
+
+        if not sep:
+            # Binary-safe field: name, then a little-endian 64-bit size,
+            # the raw data and a trailing newline
+            header = stream.read(8)
+            if len(header) < 8:
+                raise ValueError("truncated binary field in export stream")
+            (size,) = struct.unpack("<Q", header)
+            if name in wanted:
+                value = stream.read(size)
+                stream.read(1)
+            else:
+                # Skip without holding the field in memory
+                remaining = size + 1
+                while remaining > 0:
+                    chunk = stream.read(min(remaining, READ_BUFFER_SIZE))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                continue
+
+        if name in wanted:
+            entry[name.decode()] = value.decode(errors="replace")
+
+    if entry:
+        yield entry
+
+
+def _read_json_lines(stream: BinaryIO) -> Iterator[str]:
+    """Yield the non-empty lines of a JSON-lines dump"""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line.decode(errors="replace")
+
+
+class ArchiveSource(LogSource):
+    """Entries read from an export or JSON-lines file, optionally compressed"""
+
+    def __init__(self, path: str, limit: Optional[int] = None, fmt: Optional[str] = None):
+        super().__init__(limit)
+        self.path = path
+        self.format = fmt or detect_format(path)
+
+    def _entries(self) -> Iterator:
+        with open_compressed(self.path) as stream:
+            if self.format == "export":
+                yield from _read_export(stream, EXPORT_FIELDS)
+            else:
+                yield from _read_json_lines(stream)
+
+    def iter_entries(self) -> Iterator:
+        if self.limit:
+            # Like 'journalctl -n', keep the newest entries
+            return iter(deque(self._entries(), maxlen=self.limit))
+        return self._entries()
+
+    def load(self) -> List:
+        print(f"Reading {self.format} archive {self.path}")
+        try:
+            logs = list(self.iter_entries())
+        except (OSError, EOFError, ValueError, lzma.LZMAError) as e:
+            print(f"Error reading {self.path}: {e}")
+            return []
+        print(f"Loaded {len(logs)} log entries")
+        return logs
+
+    def __str__(self) -> str:
+        return f"{self.format} archive {self.path}"
+
+
+def detect_format(path: str) -> str:
+    """Guess whether a file holds export format or JSON lines"""
+    name = path.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+
+    if name.endswith(JSON_SUFFIXES):
+        return "json"
+    if name.endswith(".export"):
+        return "export"
+
+    # Fall back to sniffing the (decompressed) content
+    with open_compressed(path) as stream:
+        head = stream.read(64).lstrip()
+    return "json" if head.startswith(b"{") else "export"
+
+
+def open_archive(path: str, limit: Optional[int] = None) -> ArchiveSource:
+    """Create a source for an archived journal file"""
+    return ArchiveSource(path, limit)
@@ -0,0 +1,44 @@
+from typing import Dict, Iterator, List, Optional, Union
+
+# journalctl and JSON-lines sources yield raw JSON strings, the binary and
+# export readers yield already-decoded dicts; parse_entry accepts both.
+Entry = Union[str, Dict[str, str]]
+
+class LogSource:
+    """Something the analyzer can read journal entries from"""
+
+    # Whether a QueryPlan passed to the source is applied by the source itself
+    supports_pushdown = False
+
+    # Whether between() can narrow the source to a time window
+    supports_windows = False
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+
+    def iter_entries(self) -> Iterator[Entry]:
+        """Yield entries in timestamp order without buffering them"""
+        raise NotImplementedError
+
+    def load(self) -> List[Entry]:
+        """Read all entries into a list"""
+        return list(self.iter_entries())
+
+    def load_complete(self) -> List[Entry]:
+        """Read all entries, raising (RuntimeError, OSError, ValueError) instead of
+        returning what could be read, so a failed read is never taken for a complete one"""
+        return list(self.iter_entries())
+
+    def after(self, cursor: str) -> Optional["LogSource"]:
+        """Return a source for entries newer than cursor, if supported"""
+        return None
+
+    def between(self, since: str, until: str) -> Optional["LogSource"]:
+        """Return a source for entries in the inclusive window [since, until], if supported"""
+        return None
+
+    def __iter__(self) -> Iterator[Entry]:
+        return self.iter_entries()
+
+    def __str__(self) -> str:
+        return self.__class__.__name__
@@ -0,0 +1,165 @@
+"""
+Fleet ingestion: many hosts' journals merged into one timestamp-ordered stream.
+
+Each source is read by its own thread into a small bounded queue, and a
+heap-based k-way merge pulls from the queues. Memory is bounded by the
+number of sources times the queue size, not by the total entry count.
+"""
+
+import heapq
+import os
+import queue
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from analysis.entries import parse_entry, entry_timestamp
+from sources.archive import ArchiveSource
+from sources.base import LogSource
+from sources.journal_file import JournalFileSource, find_journal_files
+
+# Entries buffered per source between its reader thread and the merge
+SOURCE_QUEUE_SIZE = 256
+
+_DONE = object()
+
+
+def _host_label(path: str) -> str:
+    """Fallback host name derived from a file or directory name"""
+    name = os.path.basename(os.path.normpath(path))
+    for suffix in (".gz", ".xz", ".zst", ".export", ".jsonl", ".ndjson", ".json", ".journal"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name or path
+
+
+def expand_sources(paths: List[str]) -> List[Tuple[str, LogSource]]:
+    """Turn files and directories into (host label, source) pairs"""
+    sources = []
+    for path in paths:
+        if os.path.isfile(path):
+            if path.endswith(".journal"):
+                sources.append((_host_label(path), JournalFileSource(path)))
+            else:
+                sources.append((_host_label(path), ArchiveSource(path)))
+            continue
+
+        if not os.path.isdir(path):
+            print(f"Skipping {path}: not found")
+            continue
+
+        children = sorted(os.path.join(path, name) for name in os.listdir(path))
+        if any(os.path.isfile(child) and not child.endswith((".journal", ".journal~"))
+               for child in children):
+            # A collection of per-host archives
+            sources.extend(expand_sources(children))
+        elif find_journal_files(path):
+            # A journal directory, e.g. /var/log/journal/<machine-id>
+            sources.append((_host_label(path), JournalFileSource(path)))
+
+    return sources
+
+
+class FleetSource(LogSource):
+    """Merges many journals into one stream, tagging entries with _HOSTNAME"""
+
+    def __init__(self, paths: List[str], limit: Optional[int] = None):
+        super().__init__(limit)
+        self.paths = paths
+        self.sources = expand_sources(paths)
+        # Malformed entries skipped per host in the last merge
+        self.skipped: Dict[str, int] = {}
+
+    def _reader(self, host: str, source: LogSource, out: "queue.Queue", stop: threading.Event):
+        """Reader thread: decode one source into its queue"""
+        skipped = 0
+        try:
+            for line in source.iter_entries():
+                try:
+                    entry = parse_entry(line)
+                    if not isinstance(entry, dict):
+                        raise ValueError("not a JSON object")
+                    # The merge orders by it, so a bad one must not get that far
+                    entry_timestamp(entry)
+                except ValueError:
+                    # A bad line drops only itself, as in LogStore.extend
+                    skipped += 1
+                    continue
+                entry = dict(entry)
+                entry.setdefault("_HOSTNAME", host)
+                while not stop.is_set():
+                    try:
+                        out.put(entry, timeout=0.2)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            out.put(e)
+            return
+        if skipped:
+            self.skipped[host] = skipped
+        out.put(_DONE)
+
+    def _merged(self) -> Iterator[Dict[str, str]]:
+        """k-way merge of all sources by realtime timestamp"""
+        stop = threading.Event()
+        self.skipped = {}
+        queues = []
+        threads = []
+        for host, source in self.sources:
+            q = queue.Queue(maxsize=SOURCE_QUEUE_SIZE)
+            thread = threading.Thread(target=self._reader, args=(host, source, q, stop),
+                                      name=f"fleet-{host}", daemon=True)
+            thread.start()
+            queues.append(q)
+            threads.append(thread)
+
+        def pull(index: int) -> Optional[Dict[str, str]]:
+            item = queues[index].get()
+            if item is _DONE:
+                return None
+            if isinstance(item, Exception):
+                host = self.sources[index][0]
+                print(f"Error reading {host}: {item}")
+                return None
+            return item
+
+        # Heap holds at most one pending entry per source
+        heap = []
+        for index in range(len(queues)):
+            entry = pull(index)
+            if entry is not None:
+                heap.append((entry_timestamp(entry) or 0, index, entry))
+        heapq.heapify(heap)
+
+        try:
+            while heap:
+                _, index, entry = heap[0]
+                yield entry
+                following = pull(index)
+                if following is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (entry_timestamp(following) or 0, index, following))
+            for host, count in sorted(self.skipped.items()):
+                print(f"Skipped {count} malformed entries from {host}")
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=1)
+
+    def iter_entries(self) -> Iterator[Dict[str, str]]:
+        if self.limit:
+            return iter(deque(self._merged(), maxlen=self.limit))
+        return self._merged()
+
+    def load(self) -> List[Dict[str, str]]:
+        print(f"Merging {len(self.sources)} sources from {', '.join(self.paths)}")
+        logs = list(self.iter_entries())
+        print(f"Loaded {len(logs)} log entries")
+        return logs
+
+    def __str__(self) -> str:
+        return f"fleet of {len(self.sources)} sources"
@@ -0,0 +1,406 @@
+"""
+Direct reader for systemd's binary .journal files.
+
+Walks the entry arrays of each file through a memory map and decodes only the
+fields the analyzer needs, skipping journalctl and the JSON round trip.
+"""
+
+import heapq
+import lzma
+import mmap
+import os
+import struct
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sources.base import LogSource
+from sources.journalctl import resolve_time
+
+# Errors a damaged compressed payload can raise
+DECOMPRESS_ERRORS: Tuple[type, ...] = (lzma.LZMAError,)
+
+try:
+    import lz4.block as lz4_block
+    LZ4_AVAILABLE = True
+    DECOMPRESS_ERRORS += (lz4_block.LZ4BlockError,)
+except ImportError:
+    LZ4_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+    DECOMPRESS_ERRORS += (zstandard.ZstdError,)
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+DEFAULT_JOURNAL_DIR = "/var/log/journal"
+
+# Fields decoded by default; everything else is skipped without decompression
+DEFAULT_FIELDS = ("SYSLOG_IDENTIFIER", "_COMM", "PRIORITY", "MESSAGE", "_HOSTNAME",
+                  "_SYSTEMD_UNIT")
+
+SIGNATURE = b"LPKSHHRH"
+
+# Header incompatible flags
+HEADER_INCOMPATIBLE_COMPRESSED_XZ = 1 << 0
+HEADER_INCOMPATIBLE_COMPRESSED_LZ4 = 1 << 1
+HEADER_INCOMPATIBLE_KEYED_HASH = 1 << 2
+HEADER_INCOMPATIBLE_COMPRESSED_ZSTD = 1 << 3
+HEADER_INCOMPATIBLE_COMPACT = 1 << 4
+HEADER_INCOMPATIBLE_SUPPORTED = (
+    HEADER_INCOMPATIBLE_COMPRESSED_XZ | HEADER_INCOMPATIBLE_COMPRESSED_LZ4 |
+    HEADER_INCOMPATIBLE_KEYED_HASH | HEADER_INCOMPATIBLE_COMPRESSED_ZSTD |
+    HEADER_INCOMPATIBLE_COMPACT
+)
+
+# Object types and flags
+OBJECT_DATA = 1
+OBJECT_ENTRY = 3
+OBJECT_ENTRY_ARRAY = 6
+OBJECT_COMPRESSED_XZ = 1 << 0
+OBJECT_COMPRESSED_LZ4 = 1 << 1
+OBJECT_COMPRESSED_ZSTD = 1 << 2
+
+# Object layouts (all little endian)
+OBJECT_HEADER = struct.Struct("<BB6xQ")          # type, flags, size
+ENTRY_HEADER = struct.Struct("<QQQ16sQ")          # seqnum, realtime, monotonic, boot_id, xor_hash
+ENTRY_ITEMS_OFFSET = 64
+ENTRY_ARRAY_NEXT = struct.Struct("<Q")
+ENTRY_ARRAY_ITEMS_OFFSET = 24
+DATA_PAYLOAD_OFFSET = 64
+DATA_PAYLOAD_OFFSET_COMPACT = 72
+
+# Header field offsets
+HEADER_INCOMPATIBLE_FLAGS = 12
+HEADER_SEQNUM_ID = 72
+HEADER_N_ENTRIES = 152
+HEADER_ENTRY_ARRAY_OFFSET = 176
+HEADER_MIN_SIZE = 208
+
+# Upper bound on cached data objects per file; shared objects such as
+# "SYSLOG_IDENTIFIER=kernel" are decoded once and reused across entries.
+DATA_CACHE_SIZE = 65536
+
+
+class JournalFileError(Exception):
+    """Raised when a file is not a readable journal"""
+
+
+class JournalFile:
+    """Memory-mapped view of a single .journal file"""
+
+    def __init__(self, path: str, fields: Tuple[str, ...] = DEFAULT_FIELDS):
+        self.path = path
+        self.fields = {f.encode() for f in fields}
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise JournalFileError(f"{path}: empty file")
+
+        try:
+            self._read_header()
+        except (JournalFileError, struct.error):
+            self.close()
+            raise
+
+        self._data_cache: Dict[int, Optional[Tuple[str, str]]] = {}
+        # Compression codecs this file needs but that aren't installed
+        self.missing_codecs = set()
+
+    def _read_header(self):
+        """Validate the file header and read the fields needed for iteration"""
+        mm = self._mm
+        if len(mm) < HEADER_MIN_SIZE or mm[:8] != SIGNATURE:
+            raise JournalFileError(f"{self.path}: not a journal file")
+
+        (flags,) = struct.unpack_from("<I", mm, HEADER_INCOMPATIBLE_FLAGS)
+        if flags & ~HEADER_INCOMPATIBLE_SUPPORTED:
+            raise JournalFileError(f"{self.path}: unsupported journal features ({flags:#x})")
+
+        self.compact = bool(flags & HEADER_INCOMPATIBLE_COMPACT)
+        self.seqnum_id = mm[HEADER_SEQNUM_ID:HEADER_SEQNUM_ID + 16].hex()
+        (self.n_entries,) = struct.unpack_from("<Q", mm, HEADER_N_ENTRIES)
+        (self.entry_array_offset,) = struct.unpack_from("<Q", mm, HEADER_ENTRY_ARRAY_OFFSET)
+
+        # Compact journals store 32-bit offsets
+        self._offset_format = "<I" if self.compact else "<Q"
+        self._offset_size = 4 if self.compact else 8
+        self._entry_item_size = 4 if self.compact else 16
+        self._data_payload = DATA_PAYLOAD_OFFSET_COMPACT if self.compact else DATA_PAYLOAD_OFFSET
+
+    def close(self):
+        """Release the memory map and file handle"""
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _entry_offsets(self) -> Iterator[int]:
+        """Walk the chain of entry arrays, yielding entry object offsets"""
+        mm = self._mm
+        offset = self.entry_array_offset
+        remaining = self.n_entries
+        item_format = self._offset_format
+        item_size = self._offset_size
+
+        while offset and remaining > 0:
+            try:
+                obj_type, _, size = OBJECT_HEADER.unpack_from(mm, offset)
+                if obj_type != OBJECT_ENTRY_ARRAY:
+                    break
+
+                (next_offset,) = ENTRY_ARRAY_NEXT.unpack_from(mm, offset + 16)
+                count = (size - ENTRY_ARRAY_ITEMS_OFFSET) // item_size
+                items = struct.unpack_from(f"<{count}{item_format[1]}", mm,
+                                           offset + ENTRY_ARRAY_ITEMS_OFFSET)
+            except struct.error as e:
+                # A file that is still being written may end mid-array; the
+                # entries read so far are kept
+                print(f"Stopping at damaged entry array in {self.path}: {e}")
+                return
+
+            for item in items:
+                # Arrays are preallocated, unused slots are zero
+                if not item or remaining <= 0:
+                    return
+                remaining -= 1
+                yield item
+
+            offset = next_offset
+
+    def _decode_data(self, offset: int) -> Optional[Tuple[str, str]]:
+        """Decode a data object into (field, value) if it is a wanted field"""
+        cache = self._data_cache
+        if offset in cache:
+            return cache[offset]
+
+        mm = self._mm
+        obj_type, flags, size = OBJECT_HEADER.unpack_from(mm, offset)
+        result = None
+
+        if obj_type == OBJECT_DATA:
+            start = offset + self._data_payload
+            end = offset + size
+
+            if flags & (OBJECT_COMPRESSED_XZ | OBJECT_COMPRESSED_LZ4 | OBJECT_COMPRESSED_ZSTD):
+                payload = _decompress(flags, mm[start:end])
+                if payload is None:
+                    self._missing_codec(flags)
+            else:
+                # Peek at the field name before copying the payload out
+                eq = mm.find(b"=", start, end)
+                if eq != -1 and mm[start:eq] in self.fields:
+                    payload = mm[start:end]
+                else:
+                    payload = None
+
+            if payload is not None:
+                name, sep, value = payload.partition(b"=")
+                if sep and name in self.fields:
+                    result = (name.decode(), value.decode(errors="replace"))
+
+        if len(cache) >= DATA_CACHE_SIZE:
+            cache.clear()
+        cache[offset] = result
+        return result
+
+    def _missing_codec(self, flags: int):
+        """Warn once per file that fields compressed with an unavailable codec are dropped"""
+        codec, package = ("LZ4", "lz4") if flags & OBJECT_COMPRESSED_LZ4 else ("zstd", "zstandard")
+        if codec not in self.missing_codecs:
+            self.missing_codecs.add(codec)
+            print(f"Warning: {self.path} has {codec}-compressed fields, which are skipped. "
+                  f"Install with: pip install {package}")
+
+    def iter_entries(self, since: Optional[int] = None, until: Optional[int] = None,
+                     after: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, str]]:
+        """Yield entries as dicts shaped like journalctl's JSON output"""
+        mm = self._mm
+
+        # Within the same sequence number space the cursor's seqnum orders
+        # entries exactly; across files fall back to its realtime stamp.
+        after_seqnum = after_realtime = None
+        if after:
+            if after.get("s") == self.seqnum_id:
+                after_seqnum = int(after["i"], 16)
+            else:
+                after_realtime = int(after["t"], 16)
+        item_format = self._offset_format
+        item_size = self._entry_item_size
+
+        for entry_offset in self._entry_offsets():
+            try:
+                obj_type, _, size = OBJECT_HEADER.unpack_from(mm, entry_offset)
+                if obj_type != OBJECT_ENTRY:
+                    continue
+
+                seqnum, realtime, monotonic, boot_id, xor_hash = ENTRY_HEADER.unpack_from(mm, entry_offset + 16)
+                if since is not None and realtime < since:
+                    continue
+                if until is not None and realtime > until:
+                    continue
+                if after_seqnum is not None and seqnum <= after_seqnum:
+                    continue
+                if after_realtime is not None and realtime <= after_realtime:
+                    continue
+
+                entry = {
+                    "__CURSOR": (f"s={self.seqnum_id};i={seqnum:x};b={boot_id.hex()};"
+                                 f"m={monotonic:x};t={realtime:x};x={xor_hash:x}"),
+                    "__REALTIME_TIMESTAMP": str(realtime),
+                }
+
+                count = (size - ENTRY_ITEMS_OFFSET) // item_size
+                base = entry_offset + ENTRY_ITEMS_OFFSET
+                for i in range(count):
+                    (data_offset,) = struct.unpack_from(item_format, mm, base + i * item_size)
+                    field = self._decode_data(data_offset)
+                    if field is not None:
+                        entry.setdefault(field[0], field[1])
+
+                yield entry
+
+            except (struct.error, ValueError) + DECOMPRESS_ERRORS as e:
+                # A file that is still being written may end mid-object
+                print(f"Skipping damaged entry in {self.path}: {e}")
+                continue
+
+
+def _decompress(flags: int, data: bytes) -> Optional[bytes]:
+    """Inflate a compressed data object payload"""
+    if flags & OBJECT_COMPRESSED_XZ:
+        return lzma.decompress(data)
+
+    if flags & OBJECT_COMPRESSED_LZ4:
+        if not LZ4_AVAILABLE:
+            return None
+        # systemd prefixes LZ4 blocks with the uncompressed size
+        (length,) = struct.unpack_from("<Q", data, 0)
+        return lz4_block.decompress(data[8:], uncompressed_size=length)
+
+    if flags & OBJECT_COMPRESSED_ZSTD:
+        if not ZSTD_AVAILABLE:
+            return None
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+    return data
+
+
+def _parse_time(value: Optional[str]) -> Optional[int]:
+    """Convert a journalctl time spec ('@<epoch>', 'yesterday', '1 hour ago', ISO) into microseconds"""
+    if not value:
+        return None
+    moment = resolve_time(value)
+    if moment is None:
+        raise ValueError(f"Can't resolve time '{value}'")
+    return int(moment.timestamp() * 1000000)
+
+
+def _parse_cursor(cursor: Optional[str]) -> Optional[Dict[str, str]]:
+    """Split a journal cursor into its key=value parts"""
+    if not cursor:
+        return None
+    parts = dict(part.split("=", 1) for part in cursor.split(";") if "=" in part)
+    if "i" not in parts or "t" not in parts:
+        raise ValueError(f"unrecognized cursor '{cursor}'")
+    return parts
+
+
+def find_journal_files(path: str = DEFAULT_JOURNAL_DIR) -> List[str]:
+    """List the .journal files under a directory (or the file itself)"""
+    if os.path.isfile(path):
+        return [path]
+
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            # Skip '.journal~' files, which were not closed cleanly
+            if name.endswith(".journal"):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def iter_journal_files(path: str = DEFAULT_JOURNAL_DIR, since: str = None, until: str = None,
+                       fields: Tuple[str, ...] = DEFAULT_FIELDS,
+                       after_cursor: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Yield entries from all journal files under path in timestamp order"""
+    since_us = _parse_time(since)
+    until_us = _parse_time(until)
+    after = _parse_cursor(after_cursor)
+
+    journals = []
+    for file_path in find_journal_files(path):
+        try:
+            journals.append(JournalFile(file_path, fields))
+        except (OSError, JournalFileError) as e:
+            print(f"Skipping {file_path}: {e}")
+
+    try:
+        streams = [j.iter_entries(since_us, until_us, after) for j in journals]
+        yield from heapq.merge(*streams, key=lambda e: int(e["__REALTIME_TIMESTAMP"]))
+    finally:
+        for journal in journals:
+            journal.close()
+
+
+def load_journal_files(path: str = DEFAULT_JOURNAL_DIR, limit: Optional[int] = None,
+                       since: str = None, until: str = None,
+                       after_cursor: Optional[str] = None) -> List[Dict[str, str]]:
+    """Load entries directly from binary journal files"""
+    print(f"Reading journal files from {path}")
+
+    try:
+        entries = iter_journal_files(path, since, until, after_cursor=after_cursor)
+        if limit:
+            # Like 'journalctl -n', keep the newest entries
+            logs = list(deque(entries, maxlen=limit))
+        else:
+            logs = list(entries)
+    except ValueError as e:
+        print(f"Invalid filter: {e}")
+        return []
+    except OSError as e:
+        print(f"Error: {e}")
+        return []
+
+    print(f"Loaded {len(logs)} log entries")
+    return logs
+
+
+class JournalFileSource(LogSource):
+    """Entries read from binary journal files without journalctl"""
+
+    supports_windows = True
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_DIR, limit: Optional[int] = None,
+                 since: str = None, until: str = None, after_cursor: Optional[str] = None):
+        super().__init__(limit)
+        self.path = path
+        self.since = since
+        self.until = until
+        self.after_cursor = after_cursor
+
+    def iter_entries(self) -> Iterator[Dict[str, str]]:
+        entries = iter_journal_files(self.path, self.since, self.until, after_cursor=self.after_cursor)
+        if self.limit:
+            # The newest entries are only known once the files are exhausted
+            return iter(deque(entries, maxlen=self.limit))
+        return entries
+
+    def load(self) -> List[Dict[str, str]]:
+        return load_journal_files(self.path, self.limit, self.since, self.until, self.after_cursor)
+
+    def after(self, cursor: str) -> "JournalFileSource":
+        return JournalFileSource(self.path, after_cursor=cursor)
+
+    def between(self, since: str, until: str) -> "JournalFileSource":
+        return JournalFileSource(self.path, since=since, until=until)
+
+    def __str__(self) -> str:
+        return f"journal files in {self.path}"
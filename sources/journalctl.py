@@ -1,39 +1,290 @@
+import os
+import re
 import subprocess
-import json
-from typing import Optional, List
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, List, Tuple
 
-def load_journal_logs(limit: Optional[int] = None, since: str = None, until: str = None) -> List[str]:
-    """Load logs from journalctl with optional filters"""
+from sources.base import LogSource
+from sources.planner import QueryPlan
+
+# Size of the buffered reader sitting on journalctl's stdout. Lines are handed
+# out one at a time, so memory stays bounded no matter how large the window is.
+READ_BUFFER_SIZE = 64 * 1024
+
+# How often a failed shard is re-run before its slice is given up
+SHARD_RETRIES = 2
+
+_RELATIVE_TIME = re.compile(
+    r"^(?:-\s*)?(\d+)\s*(s|sec|secs|second|seconds|m|min|mins|minute|minutes|"
+    r"h|hour|hours|d|day|days|w|week|weeks)(?:\s+ago)?$"
+)
+_TIME_UNITS = {"s": "seconds", "m": "minutes", "mi": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+def _build_command(limit: Optional[int] = None, since: str = None, until: str = None,
+                   after_cursor: Optional[str] = None, plan: Optional[QueryPlan] = None,
+                   follow: bool = False) -> List[str]:
+    """Build the journalctl command line for the given filters"""
     cmd = ["journalctl", "--output=json", "--no-pager"]
-    
+
+    if follow:
+        cmd.append("--follow")
+        # Without a cursor, start with new entries only
+        if not after_cursor:
+            cmd.extend(["-n", "0"])
+    if after_cursor:
+        cmd.extend(["--after-cursor", after_cursor])
     if limit:
         cmd.extend(["-n", str(limit)])
     if since:
         cmd.extend(["--since", since])
     if until:
         cmd.extend(["--until", until])
-        
-    print(f"Loading logs with command: {' '.join(cmd)}")
-    
-    try:
-        output = subprocess.run(
+    if plan:
+        cmd.extend(plan.journalctl_args())
+
+    return cmd
+
+def _read_lines(cmd: List[str]) -> Iterator[str]:
+    """Run journalctl and yield its output line by line"""
+    # stderr goes to a temporary file so a chatty journalctl can never block
+    # on a full pipe while stdout is still being drained.
+    with tempfile.TemporaryFile() as errors:
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=errors,
+            bufsize=READ_BUFFER_SIZE,
             text=True,
-            timeout=30  # Timeout after 30 seconds
+            errors="replace"
         )
-        
-        if output.returncode != 0:
-            print(f"Error loading logs: {output.stderr}")
-            return []
-            
-        logs = output.stdout.splitlines()
+
+        exhausted = False
+        try:
+            for line in proc.stdout:
+                line = line.rstrip("\n")
+                if line:
+                    yield line
+            exhausted = True
+        finally:
+            # Stop journalctl only if the consumer gave up early; at the end of
+            # the output it may still be exiting and must not be killed
+            if not exhausted and proc.poll() is None:
+                proc.terminate()
+            proc.stdout.close()
+            returncode = proc.wait()
+
+        if returncode != 0:
+            errors.seek(0)
+            raise RuntimeError(errors.read().decode(errors="replace").strip())
+
+def open_follow_process(after_cursor: Optional[str] = None,
+                        plan: Optional[QueryPlan] = None) -> subprocess.Popen:
+    """Start 'journalctl --follow'; the caller reads stdout and terminates it"""
+    cmd = _build_command(after_cursor=after_cursor, plan=plan, follow=True)
+    return subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        bufsize=READ_BUFFER_SIZE,
+        text=True,
+        errors="replace"
+    )
+
+def stream_journal_logs(limit: Optional[int] = None, since: str = None, until: str = None,
+                        after_cursor: Optional[str] = None, plan: Optional[QueryPlan] = None) -> Iterator[str]:
+    """Yield logs from journalctl as they arrive, without buffering the output"""
+    cmd = _build_command(limit, since, until, after_cursor, plan)
+    print(f"Streaming logs with command: {' '.join(cmd)}")
+
+    count = 0
+    try:
+        for line in _read_lines(cmd):
+            count += 1
+            yield line
+    except RuntimeError as e:
+        print(f"Error loading logs: {e}")
+        return
+    except OSError as e:
+        print(f"Error: {e}")
+        return
+
+    print(f"Streamed {count} log entries")
+
+def resolve_time(spec: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Resolve the common journalctl time specifications to a datetime"""
+    now = now or datetime.now()
+    spec = spec.strip().lower()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if spec.startswith("@"):
+        try:
+            return datetime.fromtimestamp(float(spec[1:]))
+        except ValueError:
+            return None
+    if spec == "now":
+        return now
+    if spec == "today":
+        return today
+    if spec == "yesterday":
+        return today - timedelta(days=1)
+    if spec == "tomorrow":
+        return today + timedelta(days=1)
+
+    match = _RELATIVE_TIME.match(spec)
+    if match:
+        amount, unit = match.groups()
+        key = "mi" if unit.startswith("min") else unit[0]
+        return now - timedelta(**{_TIME_UNITS[key]: int(amount)})
+
+    try:
+        return datetime.fromisoformat(spec)
+    except ValueError:
+        return None
+
+def _shard_bounds(start: datetime, end: datetime, shards: int) -> List[Tuple[str, str]]:
+    """Split [start, end] into contiguous, non-overlapping journalctl time slices"""
+    first = start.timestamp()
+    last = end.timestamp()
+    step = (last - first) / shards
+
+    bounds = []
+    for i in range(shards):
+        lower = first + i * step
+        # --since and --until are both inclusive, so stop each slice one
+        # microsecond before the next begins.
+        upper = last if i == shards - 1 else first + (i + 1) * step - 0.000001
+        bounds.append((f"@{lower:.6f}", f"@{upper:.6f}"))
+    return bounds
+
+def _extract_shard(limit: Optional[int], since: str, until: str,
+                   plan: Optional[QueryPlan] = None) -> List[str]:
+    """Load one time slice, retrying on failure"""
+    cmd = _build_command(limit, since, until, plan=plan)
+    attempt = 0
+    while True:
+        try:
+            return list(_read_lines(cmd))
+        except (RuntimeError, OSError):
+            attempt += 1
+            if attempt > SHARD_RETRIES:
+                raise
+
+def load_sharded_journal_logs(limit: Optional[int] = None, since: str = None, until: str = None,
+                              shards: int = 4, workers: Optional[int] = None,
+                              plan: Optional[QueryPlan] = None) -> List[str]:
+    """Load a time window by running one journalctl per slice in parallel"""
+    start = resolve_time(since) if since else None
+    end = resolve_time(until) if until else datetime.now()
+
+    if start is None or end is None or start >= end:
+        print("Sharding needs a resolvable since/until window. Loading in one pass.")
+        return load_journal_logs(limit, since, until, plan=plan)
+
+    bounds = _shard_bounds(start, end, shards)
+    workers = workers or min(shards, os.cpu_count() or 1)
+    print(f"Loading {start:%Y-%m-%d %H:%M:%S} to {end:%Y-%m-%d %H:%M:%S} "
+          f"in {shards} shards with {workers} workers")
+
+    results: List[Optional[List[str]]] = [None] * shards
+    done = 0
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # journalctl does the decoding in its own process, so threads are
+        # enough to keep every core busy.
+        futures = {
+            pool.submit(_extract_shard, limit, shard_since, shard_until, plan): index
+            for index, (shard_since, shard_until) in enumerate(bounds)
+        }
+
+        for future in as_completed(futures):
+            index = futures[future]
+            done += 1
+            try:
+                results[index] = future.result()
+                print(f"  Shard {index + 1}/{shards}: {len(results[index])} entries "
+                      f"({done}/{shards} done)")
+            except Exception as e:
+                failed += 1
+                print(f"  Shard {index + 1}/{shards} failed after {SHARD_RETRIES + 1} attempts: {e}")
+
+    # Slices are disjoint and ascending, so concatenating keeps timestamp order
+    logs = [line for shard in results if shard for line in shard]
+    if limit:
+        logs = logs[-limit:]
+
+    if failed:
+        print(f"Warning: {failed} shard(s) failed, results are incomplete")
+    print(f"Loaded {len(logs)} log entries")
+    return logs
+
+def load_journal_logs(limit: Optional[int] = None, since: str = None, until: str = None,
+                      after_cursor: Optional[str] = None, shards: int = 1,
+                      plan: Optional[QueryPlan] = None) -> List[str]:
+    """Load logs from journalctl with optional filters"""
+    if shards > 1 and not after_cursor:
+        return load_sharded_journal_logs(limit, since, until, shards, plan=plan)
+
+    cmd = _build_command(limit, since, until, after_cursor, plan)
+    print(f"Loading logs with command: {' '.join(cmd)}")
+
+    logs = []
+    try:
+        # Collect line by line instead of capturing the whole output, so the
+        # journal is never held in memory twice and large windows can't time out.
+        for line in _read_lines(cmd):
+            logs.append(line)
+
         print(f"Loaded {len(logs)} log entries")
         return logs
-        
-    except subprocess.TimeoutExpired:
-        print("Timeout loading logs. Try with a smaller limit.")
+
+    except KeyboardInterrupt:
+        print(f"Interrupted. Keeping {len(logs)} log entries loaded so far.")
+        return logs
+    except RuntimeError as e:
+        print(f"Error loading logs: {e}")
         return []
     except Exception as e:
         print(f"Error: {e}")
-        return []
\ No newline at end of file
+        return []
+
+class JournalctlSource(LogSource):
+    """Entries read from the local journal through journalctl"""
+
+    supports_pushdown = True
+    supports_windows = True
+
+    def __init__(self, limit: Optional[int] = None, since: str = None, until: str = None,
+                 after_cursor: Optional[str] = None, shards: int = 1,
+                 plan: Optional[QueryPlan] = None):
+        super().__init__(limit)
+        self.since = since
+        self.until = until
+        self.after_cursor = after_cursor
+        self.shards = shards
+        self.plan = plan
+
+    def iter_entries(self) -> Iterator[str]:
+        return stream_journal_logs(self.limit, self.since, self.until, self.after_cursor, self.plan)
+
+    def load(self) -> List[str]:
+        return load_journal_logs(self.limit, self.since, self.until, self.after_cursor,
+                                 self.shards, self.plan)
+
+    def load_complete(self) -> List[str]:
+        cmd = _build_command(self.limit, self.since, self.until, self.after_cursor, self.plan)
+        print(f"Loading logs with command: {' '.join(cmd)}")
+        logs = list(_read_lines(cmd))
+        print(f"Loaded {len(logs)} log entries")
+        return logs
+
+    def after(self, cursor: str) -> "JournalctlSource":
+        return JournalctlSource(after_cursor=cursor, plan=self.plan)
+
+    def between(self, since: str, until: str) -> "JournalctlSource":
+        return JournalctlSource(since=since, until=until, plan=self.plan)
+
+    def __str__(self) -> str:
+        return "journalctl"
@@ -0,0 +1,111 @@
+"""
+Turns analyzer filters into journalctl arguments.
+
+Whatever can be expressed as a journal match is pushed down to journalctl so
+less data leaves it; the rest is checked in Python after extraction.
+"""
+
+from typing import Callable, Dict, List, Optional, Set
+
+from config.defaults import PRIO_MAP, DOMAIN_MAP
+
+# Fields the analyzer reads; journalctl always adds __CURSOR and the timestamps
+OUTPUT_FIELDS = ["SYSLOG_IDENTIFIER", "_COMM", "PRIORITY", "MESSAGE", "_HOSTNAME",
+                 "_SYSTEMD_UNIT"]
+
+
+class QueryPlan:
+    """Source-side matches plus the predicates left for Python"""
+
+    def __init__(self):
+        self.priority: Optional[str] = None
+        self.matches: List[str] = []
+        self.output_fields: List[str] = list(OUTPUT_FIELDS)
+        self.residual: List[Callable[[Dict], bool]] = []
+        self.checks: List[Callable[[Dict], bool]] = []
+        self.description: List[str] = []
+
+    def journalctl_args(self) -> List[str]:
+        """Arguments that push the plan down into journalctl"""
+        args = []
+        if self.priority:
+            args.extend(["-p", self.priority])
+        if self.output_fields:
+            args.append(f"--output-fields={','.join(self.output_fields)}")
+        # Matches are positional and must come last
+        args.extend(self.matches)
+        return args
+
+    def needs_residual(self) -> bool:
+        """Whether journalctl output still has to be filtered in Python"""
+        return bool(self.residual)
+
+    def accepts(self, entry: Dict, pushed_down: bool = True) -> bool:
+        """Check an entry against the predicates not handled by the source"""
+        checks = self.residual if pushed_down else self.checks
+        return all(check(entry) for check in checks)
+
+    def __str__(self) -> str:
+        return ", ".join(self.description) or "no filters"
+
+
+def _process_name(entry: Dict) -> str:
+    """Process name as the analyzer sees it"""
+    process = entry.get("SYSLOG_IDENTIFIER", "unknown")
+    if not process or process == "unknown":
+        process = entry.get("_COMM", "unknown")
+    return process
+
+
+def _domain_matches(names: Set[str]) -> List[str]:
+    """Journal matches selecting entries whose process is one of names"""
+    # Matches on the same field are OR-ed; '+' ORs the two field groups
+    matches = [f"SYSLOG_IDENTIFIER={name}" for name in sorted(names)]
+    matches.append("+")
+    matches.extend(f"_COMM={name}" for name in sorted(names))
+    return matches
+
+
+def plan_query(level: Optional[str] = None, domain: Optional[str] = None,
+               classify: Optional[Callable[[str], str]] = None,
+               prio_map: Dict[str, str] = PRIO_MAP,
+               domain_map: Dict[str, Set[str]] = DOMAIN_MAP) -> QueryPlan:
+    """Build a query plan for the given priority level and domain"""
+    plan = QueryPlan()
+
+    if level:
+        level = level.upper()
+        priority_num = next((num for num, name in prio_map.items() if name == level), None)
+
+        def level_check(entry: Dict, level=level) -> bool:
+            return prio_map.get(str(entry.get("PRIORITY", "6")), "INFO") == level
+
+        plan.checks.append(level_check)
+        plan.description.append(f"level={level}")
+
+        if priority_num is not None:
+            plan.priority = f"{priority_num}..{priority_num}"
+        else:
+            plan.residual.append(level_check)
+
+    if domain:
+        domain = domain.upper()
+        if classify is None:
+            raise ValueError("a classifier is needed to filter by domain")
+
+        def domain_check(entry: Dict, domain=domain) -> bool:
+            return classify(_process_name(entry)) == domain
+
+        plan.checks.append(domain_check)
+        plan.description.append(f"domain={domain}")
+
+        # domain_map only lists domains defined purely by exact names; e.g.
+        # BOOT also claims every process starting with "systemd".
+        names = domain_map.get(domain)
+        if names:
+            plan.matches = _domain_matches(names)
+        # The matches select a superset (an entry may match on _COMM while its
+        # SYSLOG_IDENTIFIER says otherwise), so the exact check always runs.
+        plan.residual.append(domain_check)
+
+    return plan
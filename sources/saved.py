@@ -0,0 +1,57 @@
+"""
+Entries read back from the saved-logs segment archive.
+"""
+
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+from data.segments import SegmentArchive
+from sources.base import LogSource
+from sources.journalctl import resolve_time
+
+
+def _microseconds(spec: Optional[str]) -> Optional[int]:
+    if not spec:
+        return None
+    moment = resolve_time(spec)
+    if moment is None:
+        raise ValueError(f"Can't resolve time '{spec}'")
+    return int(moment.timestamp() * 1000000)
+
+
+class SavedSource(LogSource):
+    """Entries from saved segments, skipping segments outside the time window"""
+
+    supports_windows = True
+
+    def __init__(self, archive: SegmentArchive, limit: Optional[int] = None,
+                 since: str = None, until: str = None):
+        super().__init__(limit)
+        self.archive = archive
+        self.since = since
+        self.until = until
+
+    def iter_entries(self) -> Iterator[Dict[str, str]]:
+        entries = self.archive.entries(_microseconds(self.since), _microseconds(self.until))
+        if self.limit:
+            return iter(deque(entries, maxlen=self.limit))
+        return entries
+
+    def load(self) -> List[Dict[str, str]]:
+        try:
+            since, until = _microseconds(self.since), _microseconds(self.until)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return []
+        total = len(self.archive.segments)
+        print(f"Reading saved logs: {len(self.archive.select(since, until))} of {total} "
+              f"segments overlap the window")
+        logs = list(self.iter_entries())
+        print(f"Loaded {len(logs)} log entries")
+        return logs
+
+    def between(self, since: str, until: str) -> "SavedSource":
+        return SavedSource(self.archive, since=since, until=until)
+
+    def __str__(self) -> str:
+        return f"saved logs in {self.archive.path}"
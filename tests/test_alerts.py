@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+from analysis.alerts import AlertEngine
+
+
+@pytest.mark.parametrize("config", [
+    ["errors > 1"],
+    {"rules": 5},
+    {"rules": [{"condition": "errors(process=3) > 1"}]},
+    {"rules": [{"condition": "errors(priority=['err', 4]) > 1"}]},
+    {"rules": [{"condition": 5}]},
+    {"rules": [{"condition": "errors > 1", "actions": "print"}]},
+    {"rules": [{"condition": "errors > 1", "actions": [{"command": 5}]}]},
+    {"rules": [{"condition": "errors(**{'process': 'sshd'}) > 1"}]},
+])
+def test_malformed_rules_raise_value_error(tmp_path, config):
+    path = tmp_path / "alerts.json"
+    path.write_text(json.dumps(config))
+    with pytest.raises(ValueError):
+        AlertEngine.from_file(None, str(path))
+
+
+def test_process_option_takes_a_list(tmp_path):
+    path = tmp_path / "alerts.json"
+    path.write_text(json.dumps({"rules": [{"condition": "errors(process=['sshd', 'cron']) > 1"}]}))
+    engine = AlertEngine.from_file(None, str(path))
+    (key, _), = engine.counters.items()
+    assert key[1] == frozenset({"sshd", "cron"})
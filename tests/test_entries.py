@@ -0,0 +1,24 @@
+import json
+
+import pytest
+
+from analysis.entries import DECODERS
+
+# A field repeated in one entry comes out of journalctl as a list of values,
+# a non-UTF-8 value as a list of byte values
+DUPLICATED = json.dumps({
+    "SYSLOG_IDENTIFIER": ["sshd", "sshd-session"], "_COMM": ["sshd"], "_HOSTNAME": ["h1", "h2"],
+    "MESSAGE": ["first", "second"], "PRIORITY": "3", "__REALTIME_TIMESTAMP": "1700000000000000",
+    "__CURSOR": "s=1", "_SYSTEMD_UNIT": list(b"ssh.service"),
+})
+
+
+@pytest.mark.parametrize("backend", sorted(DECODERS))
+def test_backends_normalize_list_fields(backend):
+    record = DECODERS[backend](DUPLICATED)
+    assert record.process == "sshd"
+    assert record.host == "h1"
+    assert record.message == "first"
+    assert record.unit == "ssh.service"
+    assert record.cursor == "s=1"
+    assert record.timestamp == 1_700_000_000_000_000
@@ -0,0 +1,23 @@
+import json
+
+from sources.fleet import FleetSource
+
+
+def _line(timestamp, message):
+    return json.dumps({"__REALTIME_TIMESTAMP": str(timestamp), "MESSAGE": message})
+
+
+def test_malformed_lines_are_skipped_not_the_host(tmp_path, capsys):
+    (tmp_path / "web.jsonl").write_text("\n".join([
+        _line(1, "web 1"), "not json {", "5",
+        json.dumps({"__REALTIME_TIMESTAMP": "soon", "MESSAGE": "bad time"}),
+        _line(3, "web 3")]) + "\n")
+    (tmp_path / "db.jsonl").write_text("\n".join([_line(2, "db 2"), _line(4, "db 4")]) + "\n")
+
+    fleet = FleetSource([str(tmp_path / "web.jsonl"), str(tmp_path / "db.jsonl")])
+    entries = fleet.load()
+
+    assert [(e["_HOSTNAME"], e["MESSAGE"]) for e in entries] == [
+        ("web", "web 1"), ("db", "db 2"), ("web", "web 3"), ("db", "db 4")]
+    assert fleet.skipped == {"web": 3}
+    assert "Skipped 3 malformed entries from web" in capsys.readouterr().out
@@ -0,0 +1,32 @@
+import threading
+
+import analysis.grep as grep_module
+from analysis.grep import PatternSet, grep
+from analysis.store import LogStore
+
+
+def make_store(count):
+    return LogStore.from_lines([
+        {"MESSAGE": f"unit {index} {'failed' if index % 3 else 'started'}",
+         "SYSLOG_IDENTIFIER": "systemd", "PRIORITY": "3" if index % 3 else "6",
+         "__REALTIME_TIMESTAMP": str(1_700_000_000_000_000 + index * 1_000_000)}
+        for index in range(count)])
+
+
+def test_parallel_matches_come_newest_first_like_serial(monkeypatch):
+    monkeypatch.setattr(grep_module, "PARALLEL_MIN_ENTRIES", 0)
+    store = make_store(3000)
+    patterns = PatternSet(["failed"])
+    serial = list(grep(store, patterns, workers=1))
+    assert len(serial) == 2000
+    assert [row for row, _ in serial] == sorted((row for row, _ in serial), reverse=True)
+    assert list(grep(store, patterns, workers=3)) == serial
+
+
+def test_cancelled_search_stops():
+    store = make_store(3000)
+    cancel = threading.Event()
+    cancel.set()
+    assert list(grep(store, PatternSet(["unit"]), workers=1, cancel=cancel)) == []
+    assert grep_module.scan(PatternSet(["unit"]), store.arena, store.offsets, store.priorities,
+                            store.process_ids, 0, len(store), cancelled=cancel.is_set) == []
@@ -0,0 +1,167 @@
+"""
+JournalFile against small journal files written by a fixture writer that
+follows systemd's on-disk layout (regular and compact).
+"""
+
+import lzma
+import struct
+
+import pytest
+
+from sources import journal_file
+from sources.journal_file import (JournalFile, JournalFileError, SIGNATURE, OBJECT_HEADER,
+                                  ENTRY_HEADER, OBJECT_DATA, OBJECT_ENTRY, OBJECT_ENTRY_ARRAY,
+                                  OBJECT_COMPRESSED_XZ, OBJECT_COMPRESSED_ZSTD,
+                                  HEADER_INCOMPATIBLE_COMPACT, HEADER_INCOMPATIBLE_FLAGS,
+                                  HEADER_SEQNUM_ID, HEADER_N_ENTRIES, HEADER_ENTRY_ARRAY_OFFSET)
+
+HEADER_SIZE = 256
+SEQNUM_ID = bytes(range(16))
+BOOT_ID = bytes(range(16, 32))
+
+
+def _align(data: bytearray):
+    data.extend(bytes(-len(data) % 8))
+
+
+def write_journal(path, entries, compact=False, per_array=2, flags=None):
+    """Write entries (lists of (b"FIELD=value", object flags)) as a journal file
+
+    Entries are spread over a chain of entry arrays of per_array slots, the
+    last one with an unused (zero) slot, as journald preallocates them.
+    """
+    data = bytearray(HEADER_SIZE)
+    data[:8] = SIGNATURE
+    struct.pack_into("<I", data, HEADER_INCOMPATIBLE_FLAGS, HEADER_INCOMPATIBLE_COMPACT if compact else 0)
+    data[HEADER_SEQNUM_ID:HEADER_SEQNUM_ID + 16] = SEQNUM_ID
+    struct.pack_into("<Q", data, HEADER_N_ENTRIES, len(entries))
+    payload_offset = 72 if compact else 64
+    offset_format = "<I" if compact else "<Q"
+
+    entry_offsets = []
+    for seqnum, fields in enumerate(entries, 1):
+        data_offsets = []
+        for payload, object_flags in fields:
+            offset = len(data)
+            size = payload_offset + len(payload)
+            data.extend(OBJECT_HEADER.pack(OBJECT_DATA, object_flags, size))
+            data.extend(bytes(payload_offset - OBJECT_HEADER.size))
+            data.extend(payload)
+            _align(data)
+            data_offsets.append(offset)
+
+        offset = len(data)
+        items = b"".join(struct.pack("<I", o) if compact else struct.pack("<QQ", o, 0)
+                         for o in data_offsets)
+        data.extend(OBJECT_HEADER.pack(OBJECT_ENTRY, 0, 64 + len(items)))
+        data.extend(ENTRY_HEADER.pack(seqnum, 1_700_000_000_000_000 + seqnum, seqnum, BOOT_ID, 0))
+        data.extend(items)
+        _align(data)
+        entry_offsets.append(offset)
+
+    chunks = [entry_offsets[i:i + per_array] for i in range(0, len(entry_offsets), per_array)]
+    chunks[-1] = chunks[-1] + [0]
+    array_offsets = []
+    for chunk in chunks:
+        array_offsets.append(len(data))
+        items = b"".join(struct.pack(offset_format, o) for o in chunk)
+        data.extend(OBJECT_HEADER.pack(OBJECT_ENTRY_ARRAY, 0, 24 + len(items)))
+        data.extend(bytes(8))           # next array, patched below
+        data.extend(items)
+        _align(data)
+    for current, following in zip(array_offsets, array_offsets[1:]):
+        struct.pack_into("<Q", data, current + 16, following)
+    struct.pack_into("<Q", data, HEADER_ENTRY_ARRAY_OFFSET, array_offsets[0])
+
+    path.write_bytes(bytes(data))
+    return path
+
+
+def _entry(process, message, priority=6, message_flags=0):
+    message = f"MESSAGE={message}".encode()
+    if message_flags & OBJECT_COMPRESSED_XZ:
+        message = lzma.compress(message)
+    return [(f"SYSLOG_IDENTIFIER={process}".encode(), 0),
+            (f"PRIORITY={priority}".encode(), 0),
+            (b"_BOOT_ID=skipped", 0),
+            (message, message_flags)]
+
+
+ENTRIES = [_entry("sshd", "Accepted key"), _entry("kernel", "oops", 2),
+           _entry("cron", "job done"), _entry("sshd", "Disconnected")]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_reads_entries_across_entry_arrays(tmp_path, compact):
+    path = write_journal(tmp_path / "system.journal", ENTRIES, compact=compact)
+    with JournalFile(str(path)) as journal:
+        assert journal.compact == compact
+        assert journal.n_entries == 4
+        entries = list(journal.iter_entries())
+
+    assert [e["SYSLOG_IDENTIFIER"] for e in entries] == ["sshd", "kernel", "cron", "sshd"]
+    assert entries[1]["PRIORITY"] == "2"
+    assert entries[3]["MESSAGE"] == "Disconnected"
+    assert "_BOOT_ID" not in entries[0]
+    assert entries[0]["__REALTIME_TIMESTAMP"] == str(1_700_000_000_000_001)
+    assert entries[0]["__CURSOR"].startswith(f"s={SEQNUM_ID.hex()};i=1;b={BOOT_ID.hex()};")
+
+
+def test_cursor_and_time_filters(tmp_path):
+    path = write_journal(tmp_path / "system.journal", ENTRIES)
+    with JournalFile(str(path)) as journal:
+        after = {"s": SEQNUM_ID.hex(), "i": "2", "t": "0"}
+        assert [e["MESSAGE"] for e in journal.iter_entries(after=after)] == ["job done", "Disconnected"]
+        since = 1_700_000_000_000_004
+        assert [e["MESSAGE"] for e in journal.iter_entries(since=since)] == ["Disconnected"]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.journal"
+    path.write_bytes(b"x" * 300)
+    with pytest.raises(JournalFileError):
+        JournalFile(str(path))
+
+
+def test_xz_compressed_field(tmp_path):
+    entries = [_entry("sshd", "long message " * 20, message_flags=OBJECT_COMPRESSED_XZ)]
+    path = write_journal(tmp_path / "system.journal", entries, compact=True)
+    with JournalFile(str(path)) as journal:
+        (entry,) = journal.iter_entries()
+    assert entry["MESSAGE"] == "long message " * 20
+
+
+def test_missing_codec_warns_once(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(journal_file, "ZSTD_AVAILABLE", False)
+    entries = [_entry("sshd", f"message {i}", message_flags=OBJECT_COMPRESSED_ZSTD) for i in range(3)]
+    path = write_journal(tmp_path / "system.journal", entries)
+    with JournalFile(str(path)) as journal:
+        read = list(journal.iter_entries())
+        assert journal.missing_codecs == {"zstd"}
+
+    assert len(read) == 3
+    assert all("MESSAGE" not in entry and entry["SYSLOG_IDENTIFIER"] == "sshd" for entry in read)
+    assert capsys.readouterr().out.count("zstd-compressed") == 1
+
+
+def test_damaged_entry_array_keeps_entries_read(tmp_path, capsys):
+    path = write_journal(tmp_path / "system.journal", ENTRIES)
+    data = bytearray(path.read_bytes())
+    # Point the first array's next link past the end, as in a file cut short
+    (first,) = struct.unpack_from("<Q", data, HEADER_ENTRY_ARRAY_OFFSET)
+    struct.pack_into("<Q", data, first + 16, len(data) + 4096)
+    path.write_bytes(bytes(data))
+
+    logs = journal_file.load_journal_files(str(path))
+    assert [e["MESSAGE"] for e in logs] == ["Accepted key", "oops"]
+    assert "damaged entry array" in capsys.readouterr().out
+
+
+def test_load_resolves_journalctl_time_specs(tmp_path, capsys):
+    path = str(write_journal(tmp_path / "system.journal", ENTRIES))
+    assert len(journal_file.load_journal_files(path, since="@1700000000.000003")) == 2
+    assert journal_file.load_journal_files(path, since="1 hour ago") == []
+    assert len(journal_file.load_journal_files(path, until="yesterday")) == 4
+    assert "Invalid filter" not in capsys.readouterr().out
+    assert journal_file.load_journal_files(path, since="whenever") == []
+    assert "Invalid filter: Can't resolve time 'whenever'" in capsys.readouterr().out
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+pytest.importorskip("matplotlib")
+
+from analysis.core import LogAnalyzer
+from analysis.store import LogStore
+from data.segments import SUFFIX, SegmentArchive, write_segment
+
+
+def save_segment(path, sequence, process, timestamp):
+    store = LogStore.from_lines([{
+        "MESSAGE": f"{process} reports disk failure", "SYSLOG_IDENTIFIER": process,
+        "PRIORITY": "3", "__REALTIME_TIMESTAMP": str(timestamp)}])
+    write_segment(os.path.join(path, f"{sequence:010d}-{sequence:010d}{SUFFIX}"), store)
+
+
+@pytest.fixture
+def analyzer(tmp_path):
+    save_segment(str(tmp_path), 0, "kernel", 1_700_000_000_000_000)
+    save_segment(str(tmp_path), 1, "sshd", 1_700_000_060_000_000)
+    analyzer = LogAnalyzer()
+    analyzer._saved_logs = SegmentArchive(str(tmp_path))
+    return analyzer
+
+
+def test_search_saved_across_segments(analyzer, capsys):
+    analyzer.search_logs("disk failure", saved=True)
+    out = capsys.readouterr().out
+    assert "Found 2 matching entries" in out
+    assert out.index("sshd:") < out.index("kernel:")
+
+
+def test_search_saved_process_filter(analyzer, capsys):
+    analyzer.search_logs("disk failure", saved=True, process="kernel")
+    out = capsys.readouterr().out
+    assert "Found 1 matching entries" in out
+    assert "kernel:" in out and "sshd:" not in out
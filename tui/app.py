@@ -3,17 +3,31 @@ logalyzer_tui.py - TUI interface for log analyzer
 """
 
 from textual.app import App, ComposeResult
-from textual.widgets import Header, Footer, Tree, DataTable, Static, Label
+from textual.widgets import Header, Footer, Tree, DataTable, Static, Label, Input
 from textual.containers import Container, Horizontal, Vertical, ScrollableContainer
 from textual.screen import Screen
 from textual.reactive import reactive
 from textual import events
 from datetime import datetime
-import json
+import os
 import subprocess
+import sys
+import threading
 from collections import defaultdict
 from typing import Dict, List, Optional
 
+# Allow running as 'python tui/app.py' from the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.classifier import ProcessClassifier
+from analysis.anomalies import AnomalyDetector
+from analysis.cube import RollupCube
+from analysis.entries import decode_record
+from analysis.live import LogFollower
+from analysis.grep import PatternSet, grep
+from analysis.sampling import StratifiedSample
+from analysis.store import LogStore
+
 # Import your existing analyzer (simplified version)
 class LogAnalyzerTUI:
     """Lightweight analyzer for TUI"""
@@ -24,8 +38,48 @@ class LogAnalyzerTUI:
     }
     
     def __init__(self):
-        self.logs = []
+        self.store = LogStore()
+        self.sample: Optional[StratifiedSample] = None
         self.summary = {}
+        self.classifier = ProcessClassifier()
+        self.last_cursor = None
+        self.live = None
+        self.follower = None
+    
+    def start_follow(self) -> bool:
+        """Start ingesting new entries into live aggregates"""
+        from analysis.core import LogAnalyzer
+        
+        if self.live is None:
+            live = self.live = LogAnalyzer()
+            # Follow on from the loaded entries, so the dashboard keeps their counts
+            live.store = self.store
+            live.last_cursor = self.last_cursor
+            live.data_loaded = bool(self.store)
+            live.cube = RollupCube()
+            live.cube.add_store(self.store, live.classifier)
+            live._mark_analyzed()
+            # Followed entries are checked for bursts as they arrive
+            live.detector = AnomalyDetector(live.classifier)
+            live.detector.update(self.store)
+            live.sample = self.sample
+        self.follower = LogFollower(self.live)
+        try:
+            self.follower.start()
+        except OSError:
+            self.follower = None
+            return False
+        return True
+    
+    def stop_follow(self):
+        """Stop live ingestion"""
+        if self.follower:
+            self.follower.stop()
+            self.follower = None
+    
+    @property
+    def following(self) -> bool:
+        return self.follower is not None and self.follower.running
     
     def load_logs(self, limit: int = 1000) -> bool:
         """Load logs for TUI display"""
@@ -34,36 +88,47 @@ class LogAnalyzerTUI:
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
             
             if result.returncode == 0:
-                self.logs = result.stdout.splitlines()[:500]  # Limit for TUI
+                lines = result.stdout.splitlines()
+                self.store = LogStore.from_lines(lines)
+                self.last_cursor = None
+                for line in reversed(lines):
+                    try:
+                        self.last_cursor = decode_record(line).cursor
+                        break
+                    except ValueError:
+                        continue
+                # Quick-look widgets read the stratified sample, not the oldest lines
+                self.sample = StratifiedSample(self.classifier)
+                self.sample.update(self.store)
                 return True
         except Exception:
             pass
         return False
     
+    def get_anomalies(self, limit: int = 5) -> List[str]:
+        """Most recent bursts, live while following"""
+        if self.following:
+            detector = self.live.detector
+        else:
+            detector = AnomalyDetector(self.classifier)
+            detector.update(self.store)
+        return [str(anomaly) for anomaly in detector.recent(limit)]
+    
     def get_summary(self) -> Dict:
         """Get quick summary for TUI"""
         summary = defaultdict(lambda: defaultdict(int))
         
-        for line in self.logs[:200]:  # Sample for performance
-            try:
-                entry = json.loads(line)
-                priority = self.PRIO_MAP.get(str(entry.get("PRIORITY", "6")), "INFO")
-                
-                # Simple domain detection
-                process = entry.get("SYSLOG_IDENTIFIER", "unknown")
-                if process == "kernel":
-                    domain = "KERNEL"
-                elif "systemd" in process:
-                    domain = "SYSTEMD"
-                elif "Network" in process or "wpa" in process:
-                    domain = "NETWORK"
-                else:
-                    domain = "OTHER"
-                
-                summary[domain][priority] += 1
-                
-            except json.JSONDecodeError:
-                continue
+        if self.following:
+            # Live aggregates are published as snapshots, safe to read any time
+            if self.live.cube:
+                for (domain, priority), count in self.live.cube.group("domain", "priority").items():
+                    summary[domain][priority] += count
+            return dict(summary)
+        
+        if self.sample is not None:
+            # Stratum totals are exact, however much of each stratum is kept
+            for (domain, priority), count in self.sample.totals("domain", "priority").items():
+                summary[domain][priority] += count
         
         return dict(summary)
 
@@ -71,6 +136,10 @@ class LogAnalyzerTUI:
 class DashboardScreen(Screen):
     """Main dashboard screen"""
     
+    BINDINGS = [
+        ("f", "toggle_follow", "Follow"),
+    ]
+    
     def compose(self) -> ComposeResult:
         yield Header()
         yield Container(
@@ -106,6 +175,21 @@ class DashboardScreen(Screen):
         self.analyzer = LogAnalyzerTUI()
         if self.analyzer.load_logs(1000):
             self.update_dashboard()
+        self.refresh_timer = None
+    
+    def action_toggle_follow(self) -> None:
+        """Start or stop live ingestion"""
+        if self.analyzer.following:
+            self.analyzer.stop_follow()
+            if self.refresh_timer:
+                self.refresh_timer.stop()
+            self.notify("Stopped following")
+        elif self.analyzer.start_follow():
+            self.refresh_timer = self.set_interval(1.0, self.update_dashboard)
+            self.notify("Following the journal")
+    
+    def on_unmount(self) -> None:
+        self.analyzer.stop_follow()
     
     def update_dashboard(self):
         """Update all dashboard widgets"""
@@ -117,10 +201,12 @@ class DashboardScreen(Screen):
                     d.get("ALERT", 0) + d.get("EMERGENCY", 0) 
                     for d in summary.values())
         
+        error_rate = (errors / total * 100) if total > 0 else 0
+        
         summary_text = f"""
 Total Logs: {total}
 Errors: {errors}
-Error Rate: {(errors/total*100):.1f}% if total > 0 else 0
+Error Rate: {error_rate:.1f}%
 Domains: {len(summary)}
         """.strip()
         
@@ -146,7 +232,13 @@ Domains: {len(summary)}
         self.query_one("#domains-widget").update(domain_text)
         
         # Update errors widget (simplified)
-        error_text = "Recent errors will appear here..."
+        anomalies = self.analyzer.get_anomalies()
+        if self.analyzer.following:
+            error_text = self.analyzer.follower.status()
+        else:
+            error_text = "Recent errors will appear here..."
+        if anomalies:
+            error_text += "\n\nAnomalies:\n" + "\n".join(anomalies)
         self.query_one("#errors-widget").update(error_text)
 
 class LogViewerScreen(Screen):
@@ -161,29 +253,84 @@ class LogViewerScreen(Screen):
         table = self.query_one("#log-table")
         table.add_columns("Time", "Process", "Priority", "Message")
         
-        # Load and display some logs
+        # Load and display representative logs from the stratified sample
         analyzer = LogAnalyzerTUI()
-        if analyzer.load_logs(50):  # Small sample for table
-            for line in analyzer.logs[:20]:
-                try:
-                    entry = json.loads(line)
-                    process = entry.get("SYSLOG_IDENTIFIER", "unknown")
-                    priority = analyzer.PRIO_MAP.get(
-                        str(entry.get("PRIORITY", "6")), "INFO"
-                    )
-                    message = entry.get("MESSAGE", "")[:40] + "..."
-                    
-                    # Format time
-                    ts = entry.get("__realtime_timestamp")
-                    if ts:
-                        dt = datetime.fromtimestamp(int(ts) / 1000000)
-                        time_str = dt.strftime("%H:%M:%S")
-                    else:
-                        time_str = "??:??:??"
-                    
-                    table.add_row(time_str, process, priority, message)
-                except json.JSONDecodeError:
-                    continue
+        if analyzer.load_logs(1000):
+            for _, record in analyzer.sample.entries(20):
+                process = record.process
+                priority = record.priority_name
+                message = record.message[:40] + "..."
+                
+                # Format time
+                if record.timestamp:
+                    dt = datetime.fromtimestamp(record.timestamp / 1000000)
+                    time_str = dt.strftime("%H:%M:%S")
+                else:
+                    time_str = "??:??:??"
+                
+                table.add_row(time_str, process, priority, message)
+
+class GrepScreen(Screen):
+    """Regex search whose matches appear while the scan is still running"""
+    
+    BINDINGS = [
+        ("escape", "cancel_search", "Cancel search"),
+    ]
+    
+    def compose(self) -> ComposeResult:
+        yield Header()
+        yield Input(placeholder="Regexes separated by ' || ', e.g. I/O error.*sd[a-z] || EXT4-fs error",
+                    id="grep-input")
+        yield Static(id="grep-status")
+        yield DataTable(id="grep-table")
+        yield Footer()
+    
+    def on_mount(self) -> None:
+        self.query_one("#grep-table").add_columns("Time", "Process", "Priority", "Message")
+        self.cancel = threading.Event()
+        self.store = None
+        analyzer = LogAnalyzerTUI()
+        if analyzer.load_logs(1000):
+            self.store = analyzer.store
+    
+    def action_cancel_search(self) -> None:
+        self.cancel.set()
+    
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        # Stop the previous search before starting the next one
+        self.cancel.set()
+        self.cancel = threading.Event()
+        table = self.query_one("#grep-table")
+        table.clear()
+        status = self.query_one("#grep-status")
+        
+        patterns = [p.strip() for p in event.value.split("||") if p.strip()]
+        if not patterns or not self.store:
+            status.update("Nothing to search")
+            return
+        try:
+            pattern_set = PatternSet(patterns)
+        except ValueError as e:
+            status.update(str(e))
+            return
+        status.update("Searching...")
+        threading.Thread(target=self._search, args=(pattern_set, self.cancel), daemon=True).start()
+    
+    def _search(self, pattern_set: PatternSet, cancel: threading.Event) -> None:
+        """Worker thread: hand each match to the UI as soon as it is found"""
+        store = self.store
+        table = self.query_one("#grep-table")
+        found = 0
+        for index, _ in grep(store, pattern_set, cancel=cancel):
+            if cancel.is_set():
+                break
+            record = store.record(index)
+            self.app.call_from_thread(table.add_row, store.clock(index) or "??:??:??",
+                                      record.process, record.priority_name, record.message[:80])
+            found += 1
+        state = "cancelled" if cancel.is_set() else "done"
+        self.app.call_from_thread(self.query_one("#grep-status").update,
+                                  f"{found} match(es), {state}")
 
 class LogalyzerTUI(App):
     """Main TUI application"""
@@ -219,12 +366,14 @@ class LogalyzerTUI(App):
     BINDINGS = [
         ("d", "switch_mode('dashboard')", "Dashboard"),
         ("l", "switch_mode('logs')", "Log Viewer"),
+        ("g", "switch_mode('grep')", "Grep"),
         ("q", "quit", "Quit"),
     ]
     
     MODES = {
         "dashboard": DashboardScreen,
         "logs": LogViewerScreen,
+        "grep": GrepScreen,
     }
     
     def on_mount(self) -> None:
@@ -1,13 +1,13 @@
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
-from datetime import datetime
-import json
-from collections import defaultdict
+from analysis.cube import ERROR_LEVELS
+from analysis.store import NO_TIME
+from analysis.sampling import hour_of
 
 def show_visualization(self):
     """Generate visualizations from analyzed data"""
-    if not self.processed_data:
+    if not self.cube:
         print("No data analyzed. Use 'analyze' command first.")
         return
     
@@ -42,12 +42,8 @@ def show_visualization(self):
 
 def _plot_priority_distribution(self):
     """Create pie chart of log priorities"""
-    # Aggregate priority data
-    priority_totals = defaultdict(int)
-    for month_data in self.processed_data.values():
-        for domain_data in month_data.values():
-            for priority, count in domain_data.items():
-                priority_totals[priority] += count
+    # Priority rollup from the cube
+    priority_totals = self.cube.group("priority")
     
     if not priority_totals:
         print("No priority data available")
@@ -99,10 +95,7 @@ def _plot_priority_distribution(self):
 
 def _plot_domain_distribution(self):
     """Create bar chart of log domains"""
-    domain_totals = defaultdict(int)
-    for month_data in self.processed_data.values():
-        for domain, domain_data in month_data.items():
-            domain_totals[domain] += sum(domain_data.values())
+    domain_totals = self.cube.group("domain")
     
     if not domain_totals:
         print("No domain data available")
@@ -136,39 +129,15 @@ def _plot_domain_distribution(self):
 
 def _plot_monthly_trends(self):
     """Create line chart showing trends over months"""
-    if not self.raw_logs:
-        print("No raw log data available. Load logs first.")
-        return
-    
-    # Extract month and error counts
-    monthly_errors = defaultdict(int)
-    monthly_total = defaultdict(int)
+    # Month rollups come back in chronological order, labelled Year-Month
+    monthly_total = self.cube.group("month")
+    monthly_errors = self.cube.group("month", priority=ERROR_LEVELS)
+    months = [m for m in monthly_total if m != "Unknown"]
     
-    for line in self.raw_logs[:5000]:  # Sample for performance
-        try:
-            log_entry = json.loads(line)
-            priority_num = str(log_entry.get("PRIORITY", "6"))
-            priority = self.PRIO_MAP.get(priority_num, "INFO")
-            
-            # Get month
-            timestamp = log_entry.get("__realtime_timestamp")
-            if timestamp:
-                dt = datetime.fromtimestamp(int(timestamp) / 1000000)
-                month = dt.strftime("%Y-%m")  # Year-Month for ordering
-                
-                monthly_total[month] += 1
-                if priority in ["ERROR", "CRITICAL", "ALERT", "EMERGENCY"]:
-                    monthly_errors[month] += 1
-                    
-        except (json.JSONDecodeError, ValueError):
-            continue
-    
-    if not monthly_total:
+    if not months:
         print("No monthly data available")
         return
     
-    # Sort months chronologically
-    months = sorted(monthly_total.keys())
     totals = [monthly_total[m] for m in months]
     errors = [monthly_errors.get(m, 0) for m in months]
     
@@ -207,31 +176,34 @@ def _plot_monthly_trends(self):
 
 def _plot_hourly_distribution(self):
     """Show when logs occur throughout the day"""
-    hourly_counts = defaultdict(int)
-    
-    for line in self.raw_logs[:10000]:  # Sample size
-        try:
-            log_entry = json.loads(line)
-            timestamp = log_entry.get("__realtime_timestamp")
-            if timestamp:
-                dt = datetime.fromtimestamp(int(timestamp) / 1000000)
-                hour = dt.hour
-                hourly_counts[hour] += 1
-        except (json.JSONDecodeError, ValueError):
-            continue
-    
-    if not hourly_counts:
+    errors = None
+    sample = self._sampled()
+    if not self.store and sample is not None:
+        # Streamed entries aren't kept; estimate from their sample, with bounds
+        estimates = sample.estimate(hour_of)
+        hourly_counts = np.zeros(24)
+        errors = np.zeros((2, 24))
+        for hour, estimate in estimates.items():
+            if hour != NO_TIME:
+                hourly_counts[hour] = estimate.value
+                errors[:, hour] = (estimate.value - estimate.low, estimate.high - estimate.value)
+    else:
+        hours_of_day = np.asarray(self.store.time_parts().hours_of_day())
+        hourly_counts = np.bincount(hours_of_day[hours_of_day != NO_TIME], minlength=24)
+    
+    if not hourly_counts.any():
         print("No hourly data available")
         return
     
     # Prepare data
     hours = list(range(24))
-    counts = [hourly_counts.get(h, 0) for h in hours]
+    counts = hourly_counts.tolist()
     
     plt.figure(figsize=(14, 6))
     
     # Create bar chart with gradient
-    bars = plt.bar(hours, counts, color=plt.cm.coolwarm(np.linspace(0, 1, 24)))
+    bars = plt.bar(hours, counts, color=plt.cm.coolwarm(np.linspace(0, 1, 24)),
+                   yerr=errors, capsize=3 if errors is not None else 0)
     
     # Add hour labels
     hour_labels = [f"{h:02d}:00" for h in hours]
@@ -247,7 +219,8 @@ def _plot_hourly_distribution(self):
     
     plt.xlabel('Hour of Day', fontweight='bold')
     plt.ylabel('Number of Log Entries', fontweight='bold')
-    plt.title('Log Activity by Hour of Day', fontweight='bold')
+    plt.title('Log Activity by Hour of Day' + (' (estimated from a sample)' if errors is not None else ''),
+              fontweight='bold')
     plt.grid(axis='y', alpha=0.3, linestyle='--')
     
     # Add day/night shading
@@ -262,26 +235,15 @@ def _plot_hourly_distribution(self):
 def _plot_error_heatmap(self):
     """Create heatmap of errors by domain and priority"""
     # Prepare data matrix
-    domains = set()
     priorities = ["EMERGENCY", "ALERT", "CRITICAL", "ERROR", 
                  "WARNING", "NOTICE", "INFO", "DEBUG"]
+    domains = self.cube.labels("domain")
     
-    # Collect all domains
-    for month_data in self.processed_data.values():
-        domains.update(month_data.keys())
-    
-    domains = sorted(domains)
-    
-    # Create matrix
+    # Create matrix from the domain x priority rollup
     matrix = np.zeros((len(domains), len(priorities)))
     
-    for i, domain in enumerate(domains):
-        for j, priority in enumerate(priorities):
-            total = 0
-            for month_data in self.processed_data.values():
-                if domain in month_data:
-                    total += month_data[domain].get(priority, 0)
-            matrix[i, j] = total
+    for (domain, priority), total in self.cube.group("domain", "priority").items():
+        matrix[domains.index(domain), priorities.index(priority)] = total
     
     # Log scale for better visualization
     matrix_log = np.log10(matrix + 1)  # +1 to avoid log(0)
@@ -1,6 +1,9 @@
 from collections import defaultdict
 from datetime import datetime
-import json
+from analysis.entries import ERROR_PRIORITY, PRIORITY_NAMES
+from analysis.cube import ERROR_LEVELS
+from analysis.store import NO_TIME
+from data.segments import priority_mask
 
 # Import detection for rich/tabulate
 try:
@@ -17,13 +20,25 @@ try:
 except ImportError:
     RICH_AVAILABLE = False
 
-def show_table(self, table_type: str = "summary", limit: int = 20):
+def show_table(self, table_type: str = "summary", limit: int = 20, saved: bool = False):
     """Display data in tabular format"""
-    if not self.processed_data:
+    table_type = table_type.lower()
+    if saved:
+        if table_type != "errors":
+            print("Only the errors table can be read from saved logs.")
+            return
+        self._show_errors_table(limit, saved=True)
+        return
+    
+    if table_type == "templates":
+        # Mined from the loaded entries, no analysis needed
+        self.show_templates(limit)
+        return
+    
+    if not self.cube:
         print("No data analyzed. Use 'analyze' command first.")
         return
     
-    table_type = table_type.lower()
     
     if table_type == "summary":
         self._show_summary_table(limit)
@@ -33,33 +48,32 @@ def show_table(self, table_type: str = "summary", limit: int = 20):
         self._show_errors_table(limit)
     elif table_type == "domains":
         self._show_domains_table(limit)
+    elif table_type == "hosts":
+        self._show_hosts_table(limit)
     else:
         print(f"Unknown table type: {table_type}")
-        print("Available: summary, detailed, errors, domains")
+        print("Available: summary, detailed, errors, domains, hosts, templates")
 
 def _show_summary_table(self, limit: int = 20):
     """Show summary table"""
-    # Aggregate data
-    summary_data = []
+    # Month-level rollups from the cube
+    cube = self.cube
+    month_errors = cube.group("month", priority=ERROR_LEVELS)
+    domains_per_month = defaultdict(int)
+    for month, _ in cube.group("month", "domain"):
+        domains_per_month[month] += 1
     
-    for month, month_data in sorted(self.processed_data.items()):
-        month_total = 0
-        month_errors = 0
-        
-        for domain_data in month_data.values():
-            for priority, count in domain_data.items():
-                month_total += count
-                if priority in ["ERROR", "CRITICAL", "ALERT", "EMERGENCY"]:
-                    month_errors += count
-        
-        error_rate = (month_errors / month_total * 100) if month_total > 0 else 0
+    summary_data = []
+    for month, month_total in cube.group("month").items():
+        errors = month_errors.get(month, 0)
+        error_rate = (errors / month_total * 100) if month_total > 0 else 0
         
         summary_data.append([
             month,
             month_total,
-            month_errors,
+            errors,
             f"{error_rate:.1f}%",
-            len(month_data)  # Number of domains
+            domains_per_month[month]
         ])
     
     if RICH_AVAILABLE:
@@ -90,15 +104,11 @@ def _show_summary_table(self, limit: int = 20):
 
 def _show_detailed_table(self, limit: int = 20):
     """Show detailed table with all data"""
-    detailed_data = []
-    
-    for month, month_data in sorted(self.processed_data.items()):
-        for domain, domain_data in sorted(month_data.items()):
-            for priority, count in sorted(domain_data.items()):
-                if count > 0:
-                    detailed_data.append([
-                        month, domain, priority, count
-                    ])
+    detailed_data = [
+        [month, domain, priority, count]
+        for (month, domain, priority), count in self.cube.group("month", "domain", "priority").items()
+        if count > 0
+    ]
     
     if RICH_AVAILABLE:
         console = RichConsole()
@@ -133,48 +143,44 @@ def _show_detailed_table(self, limit: int = 20):
         print(tabulate(detailed_data[:limit], headers=headers, 
                       tablefmt="grid"))
     else:
-        print("Month  Domain              Priority    Count")
+        print("Month    Domain              Priority    Count")
         print("-" * 45)
         for row in detailed_data[:limit]:
-            print(f"{row[0]:6} {row[1]:18} {row[2]:10} {row[3]:5}")
+            print(f"{row[0]:8} {row[1]:18} {row[2]:10} {row[3]:5}")
 
-def _show_errors_table(self, limit: int = 20):
+def _show_errors_table(self, limit: int = 20, saved: bool = False):
     """Show only error-related logs"""
-    if not self.data_loaded:
+    if saved:
+        error_data = _saved_errors(self.saved_logs, limit)
+    elif not self.data_loaded:
         print("No logs loaded. Use 'load' command first.")
         return
-    
-    error_data = []
-    
-    for line in self.raw_logs[:500]:  # Limit for performance
-        try:
-            log_entry = json.loads(line)
-            priority_num = str(log_entry.get("PRIORITY", "6"))
-            priority = self.PRIO_MAP.get(priority_num, "INFO")
-            
-            if priority in ["ERROR", "CRITICAL", "ALERT", "EMERGENCY"]:
-                process = log_entry.get("SYSLOG_IDENTIFIER", "unknown")
-                message = log_entry.get("MESSAGE", "")[:60]
-                
-                timestamp = log_entry.get("__realtime_timestamp")
-                if timestamp:
-                    dt = datetime.fromtimestamp(int(timestamp) / 1000000)
-                    time_str = dt.strftime("%H:%M:%S")
-                else:
-                    time_str = "Unknown"
+    elif not self.store and self._sampled() is not None:
+        # Streamed entries aren't kept; errors are in the sample, rare ones in full
+        error_data = _sampled_errors(self.sample, limit)
+    else:
+        error_data = []
+        
+        store = self.store
+        # The priority column is cheap to scan, so only matching rows are decoded
+        for index, priority in enumerate(store.priorities):
+            if priority <= ERROR_PRIORITY:
+                record = store.record(index)
+                message = record.message[:60]
+                time_str = store.clock(index) or "Unknown"
                 
                 error_data.append([
-                    time_str, process, priority, message
+                    time_str, record.process, record.priority_name, message
                 ])
                 
                 if len(error_data) >= limit:
                     break
-                    
-        except (json.JSONDecodeError, ValueError):
-            continue
     
     if not error_data:
         print("No errors found in logs")
+        if not saved:
+            # Streamed entries aren't kept, but their sketches are
+            _show_talkers(self.sketches, errors=True, limit=limit)
         return
     
     if RICH_AVAILABLE:
@@ -199,23 +205,45 @@ def _show_errors_table(self, limit: int = 20):
         print("-" * 70)
         for row in error_data:
             print(f"{row[0]:8} {row[1]:20} {row[2]:9} {row[3]}")
+    
+    if not saved:
+        _show_talkers(self.sketches, errors=True, limit=limit)
+
+def _saved_errors(archive, limit: int):
+    """The newest error rows of the saved logs, oldest first"""
+    error_data = []
+    # Segments whose priority bitmap has no error level are skipped unread
+    for segment in archive.select(priorities=priority_mask(range(ERROR_PRIORITY + 1)),
+                                  newest_first=True):
+        for index in reversed(segment.rows()):
+            if segment.priorities[index] <= ERROR_PRIORITY:
+                record = segment.record(index)
+                error_data.append([
+                    segment.clock(index), record.process, record.priority_name, record.message[:60]
+                ])
+                if len(error_data) >= limit:
+                    return error_data[::-1]
+    return error_data[::-1]
+
+def _sampled_errors(sample, limit: int):
+    """The newest error rows of the sample, oldest first"""
+    entries = [entry for priority in range(ERROR_PRIORITY + 1) for entry in sample.kept(priority)]
+    entries.sort(key=lambda entry: entry[1].timestamp or 0)
+    error_data = []
+    for minute, record in entries[-limit:]:
+        clock = "Unknown"
+        if minute != NO_TIME and record.timestamp:
+            clock = f"{minute // 60 % 24:02d}:{minute % 60:02d}:{record.timestamp // 1000000 % 60:02d}"
+        error_data.append([clock, record.process, record.priority_name, record.message[:60]])
+    return error_data
 
 def _show_domains_table(self, limit: int = 20):
     """Show domain statistics"""
-    domain_stats = defaultdict(lambda: defaultdict(int))
-    
-    for month_data in self.processed_data.values():
-        for domain, domain_data in month_data.items():
-            for priority, count in domain_data.items():
-                domain_stats[domain]['total'] += count
-                if priority in ["ERROR", "CRITICAL", "ALERT", "EMERGENCY"]:
-                    domain_stats[domain]['errors'] += count
+    domain_errors = self.cube.group("domain", priority=ERROR_LEVELS)
     
-    # Convert to list and sort
     table_data = []
-    for domain, stats in sorted(domain_stats.items()):
-        total = stats['total']
-        errors = stats['errors']
+    for domain, total in self.cube.group("domain").items():
+        errors = domain_errors.get(domain, 0)
         error_rate = (errors / total * 100) if total > 0 else 0
         
         table_data.append([
@@ -245,10 +273,223 @@ def _show_domains_table(self, limit: int = 20):
         print("-" * 40)
         for row in table_data[:limit]:
             print(f"{row[0]:18} {row[1]:6} {row[2]:7} {row[3]:7}")
+    
+    _show_talkers(self.sketches, limit=limit)
+
+def _show_talkers(sketches, errors: bool = False, limit: int = 20):
+    """Top processes and templates per domain, estimated by the sketches"""
+    if sketches is None:
+        return
+    
+    def heaviest(what, domain, count):
+        return ", ".join(f"{key[:40]} (~{n})" for key, n in sketches.top(what, domain, errors, count))
+    
+    talker_data = []
+    for domain in sketches.domains():
+        processes = heaviest("process", domain, 3)
+        if processes:
+            talker_data.append([domain, processes, heaviest("template", domain, 1)])
+    if not talker_data:
+        return
+    
+    title = "Top Error Talkers (sketched)" if errors else "Top Talkers (sketched)"
+    if RICH_AVAILABLE:
+        console = RichConsole()
+        table = RichTable(title=title, box=box.ROUNDED)
+        
+        table.add_column("Domain", style="cyan")
+        table.add_column("Processes", style="green")
+        table.add_column("Template", style="white")
+        
+        for row in talker_data[:limit]:
+            table.add_row(*row)
+        
+        console.print(table)
+        
+    elif TABULATE_AVAILABLE:
+        headers = ["Domain", "Processes", "Template"]
+        print(tabulate(talker_data[:limit], headers=headers, tablefmt="grid"))
+    else:
+        print(f"\n{title}")
+        print("-" * 70)
+        for row in talker_data[:limit]:
+            print(f"{row[0]:18} {row[1]}")
+            if row[2]:
+                print(f"{'':18} {row[2]}")
+
+def _show_hosts_table(self, limit: int = 20):
+    """Show per-host statistics"""
+    cube = self.cube
+    if not cube:
+        print("No host data. Use 'analyze' command first.")
+        return
+    
+    host_errors = cube.group("host", priority=ERROR_LEVELS)
+    busiest = {}
+    for (host, domain), count in cube.group("host", "domain").items():
+        if count > busiest.get(host, ("", 0))[1]:
+            busiest[host] = (domain, count)
+    
+    table_data = []
+    for host, total in cube.group("host").items():
+        errors = host_errors.get(host, 0)
+        error_rate = (errors / total * 100) if total > 0 else 0
+        table_data.append([host, total, errors, f"{error_rate:.1f}%", busiest[host][0]])
+    
+    # Noisiest hosts first
+    table_data.sort(key=lambda row: row[1], reverse=True)
+    
+    if RICH_AVAILABLE:
+        console = RichConsole()
+        table = RichTable(title="Host Statistics", box=box.ROUNDED)
+        
+        table.add_column("Host", style="cyan")
+        table.add_column("Total", justify="right", style="green")
+        table.add_column("Errors", justify="right", style="red")
+        table.add_column("Error %", justify="right", style="yellow")
+        table.add_column("Top Domain", style="magenta")
+        
+        for host, total, errors, error_rate, busiest in table_data[:limit]:
+            table.add_row(host, str(total), str(errors), error_rate, busiest)
+        
+        console.print(table)
+        
+    elif TABULATE_AVAILABLE:
+        headers = ["Host", "Total", "Errors", "Error %", "Top Domain"]
+        print(tabulate(table_data[:limit], headers=headers, tablefmt="grid"))
+    else:
+        print("Host                Total  Errors  Error%  Top Domain")
+        print("-" * 55)
+        for row in table_data[:limit]:
+            print(f"{row[0]:18} {row[1]:6} {row[2]:7} {row[3]:7} {row[4]}")
+
+def _seen(timestamp: int) -> str:
+    if not timestamp:
+        return "Unknown"
+    return datetime.fromtimestamp(timestamp / 1000000).strftime("%Y-%m-%d %H:%M:%S")
+
+def show_templates(self, limit: int = 20, level: str = None, process: str = None,
+                   by: str = None):
+    """Show the most frequent message templates of the loaded logs
+    
+    level/process count only matching entries; by breaks each template
+    down by priority, process, host or domain.
+    """
+    if not self.store:
+        print("No logs loaded. Use 'load' command first (streamed logs aren't kept).")
+        return
+    if by and by not in ("priority", "process", "host", "domain"):
+        print(f"Can't break templates down by '{by}'. Use: priority, process, host, domain")
+        return
+    
+    store = self.store
+    miner = store.templates()
+    rows = None
+    if level or process:
+        priority = None
+        if level:
+            if level.upper() not in PRIORITY_NAMES:
+                print(f"Unknown level '{level}'. Use: {', '.join(PRIORITY_NAMES)}")
+                return
+            priority = PRIORITY_NAMES.index(level.upper())
+        process_id = store.processes.id_of(process) if process else None
+        if process and process_id is None:
+            print(f"No entries from process '{process}'.")
+            return
+        rows = [row for row in range(len(store))
+                if (priority is None or store.priorities[row] == priority)
+                and (process_id is None or store.process_ids[row] == process_id)]
+    
+    counts = miner.group(rows=rows)
+    breakdown = defaultdict(lambda: defaultdict(int))
+    if by:
+        column = store.priorities if by == "priority" else \
+            store.host_ids if by == "host" else store.process_ids
+        for (template_id, value), count in miner.group(column, rows).items():
+            if by == "priority":
+                label = PRIORITY_NAMES[value]
+            elif by == "host":
+                label = store.hosts[value] or "unknown"
+            elif by == "domain":
+                label = self.classify_process(store.processes[value] or "unknown")
+            else:
+                label = store.processes[value] or "unknown"
+            breakdown[template_id][label] += count
+    
+    table_data = []
+    for template_id, count in counts.most_common(limit):
+        template = miner.get(template_id)
+        first = _seen(template.first_seen) if template else "-"
+        last = _seen(template.last_seen) if template else "-"
+        row = [f"T{template_id}", count, first, last, miner.label(template_id)[:70]]
+        if by:
+            top = sorted(breakdown[template_id].items(), key=lambda item: item[1], reverse=True)
+            row.append(", ".join(f"{label} {value}" for label, value in top[:3]))
+        table_data.append(row)
+    
+    if not table_data:
+        print("No matching entries.")
+        return
+    
+    title = f"Message Templates ({len(miner)} mined from {len(store)} entries)"
+    headers = ["ID", "Count", "First Seen", "Last Seen", "Template"] + ([by.title()] if by else [])
+    if RICH_AVAILABLE:
+        console = RichConsole()
+        table = RichTable(title=title, box=box.ROUNDED)
+        
+        table.add_column("ID", style="dim")
+        table.add_column("Count", justify="right", style="green")
+        table.add_column("First Seen", style="dim")
+        table.add_column("Last Seen", style="dim")
+        table.add_column("Template", style="white")
+        if by:
+            table.add_column(by.title(), style="magenta")
+        
+        for row in table_data:
+            table.add_row(*[str(x) for x in row])
+        
+        console.print(table)
+        
+    elif TABULATE_AVAILABLE:
+        print(title)
+        print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    else:
+        print(title)
+        print("ID      Count  Last Seen            Template")
+        print("-" * 70)
+        for row in table_data:
+            print(f"{row[0]:6} {row[1]:6}  {row[3]:19}  {row[4]}" + (f"  [{row[5]}]" if by else ""))
+    if miner.evicted:
+        print(f"({miner.evicted} entries belonged to templates evicted to bound memory)")
+
+def show_template(self, name: str):
+    """Show one template with its example entries"""
+    if not self.store:
+        print("No logs loaded. Use 'load' command first (streamed logs aren't kept).")
+        return
+    store = self.store
+    miner = store.templates()
+    template_id = miner.lookup(name)
+    if template_id is None:
+        print(f"No template '{name}'. Use 'templates' to list them.")
+        return
+    
+    template = miner.get(template_id)
+    print(f"\nT{template_id}: {template.text}")
+    print(f"  Seen {template.count} times, first {_seen(template.first_seen)}, "
+          f"last {_seen(template.last_seen)}")
+    print("  Examples:")
+    for entry in template.examples:
+        index = entry - store.base
+        if 0 <= index < len(store):
+            name = store.processes[store.process_ids[index]] or "unknown"
+            print(f"    #{entry} [{store.clock(index) or 'Unknown'}] {name}: {store.message(index)[:100]}")
+        else:
+            print(f"    #{entry} (no longer loaded)")
 
 def browse_table(self):
     """Interactive table browser"""
-    if not self.processed_data:
+    if not self.cube:
         print("No data analyzed. Use 'analyze' command first.")
         return
     
@@ -256,12 +497,11 @@ def browse_table(self):
     page_size = 10
     
     # Get all data for paging
-    all_data = []
-    for month, month_data in sorted(self.processed_data.items()):
-        for domain, domain_data in sorted(month_data.items()):
-            for priority, count in sorted(domain_data.items()):
-                if count > 0:
-                    all_data.append([month, domain, priority, count])
+    all_data = [
+        [month, domain, priority, count]
+        for (month, domain, priority), count in self.cube.group("month", "domain", "priority").items()
+        if count > 0
+    ]
     
     total_pages = (len(all_data) + page_size - 1) // page_size
     
@@ -277,10 +517,10 @@ def browse_table(self):
         if RICH_AVAILABLE or TABULATE_AVAILABLE:
             self._show_detailed_table_data(page_data)
         else:
-            print("Month  Domain              Priority    Count")
+            print("Month    Domain              Priority    Count")
             print("-" * 45)
             for month, domain, priority, count in page_data:
-                print(f"{month:6} {domain:18} {priority:10} {count:5}")
+                print(f"{month:8} {domain:18} {priority:10} {count:5}")
         
         # Navigation
         print("\nNavigation: [n]ext, [p]revious, [j]ump to page, [q]uit")